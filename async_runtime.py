@@ -0,0 +1,157 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from dotenv import load_dotenv
+import outbound
+
+# --- asyncio execution mode ---
+# The PTB 13 dispatcher stays in charge of receiving updates; in asyncio mode every
+# handler callback only schedules a coroutine on one event loop thread and returns.
+# Coroutine handlers do their I/O through the async clients below; plain handlers
+# run on a small executor so they don't block the loop.
+load_dotenv()
+AIO_SYNC_WORKERS = int(os.getenv("AIO_SYNC_WORKERS", "8"))
+AIO_HTTP_CONNECTIONS = int(os.getenv("AIO_HTTP_CONNECTIONS", "100"))
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+
+class AsyncPostgrest:
+    """Minimal async PostgREST client for the Supabase REST endpoint."""
+
+    def __init__(self, url, key):
+        self.client = httpx.AsyncClient(
+            base_url=f"{url}/rest/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=AIO_HTTP_CONNECTIONS, max_keepalive_connections=20),
+        )
+
+    async def select(self, table, columns, **filters):
+        """SELECT rows; filters use PostgREST syntax, e.g. chat_id="eq.42", user_id=in_(ids), order="created_at"."""
+        r = await self.client.get(f"/{table}", params={"select": columns, **filters})
+        r.raise_for_status()
+        return r.json()
+
+    async def rpc(self, function, params):
+        """Call a Postgres function through /rpc."""
+        r = await self.client.post(f"/rpc/{function}", json=params)
+        r.raise_for_status()
+        return r.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+def in_(values):
+    """PostgREST `in` filter value."""
+    return f"in.({','.join(str(v) for v in values)})"
+
+class AsyncTelegram:
+    """Just enough of the Bot API for coroutine handlers to reply without a worker thread.
+
+    Sends share the threaded bot's rate limiter (outbound.py).
+    """
+
+    def __init__(self, token):
+        self.client = httpx.AsyncClient(
+            base_url=f"{TELEGRAM_API_BASE_URL}{token}",
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=AIO_HTTP_CONNECTIONS, max_keepalive_connections=20),
+        )
+
+    async def call(self, method, **payload):
+        if payload.get("reply_markup") is not None and hasattr(payload["reply_markup"], "to_dict"):
+            payload["reply_markup"] = payload["reply_markup"].to_dict()
+        payload = {k: v for k, v in payload.items() if v is not None}
+        limited = method in outbound.LIMITED_METHODS
+        chat_id = outbound.chat_of(payload)
+        for attempt in range(outbound.SEND_MAX_RETRIES + 1):
+            if limited:
+                await outbound.limiter.acquire_async(chat_id)
+            r = await self.client.post(f"/{method}", json=payload)
+            result = r.json()
+            retry_after = (result.get("parameters") or {}).get("retry_after")
+            if result.get("ok") or not (limited and retry_after) or attempt == outbound.SEND_MAX_RETRIES:
+                break
+            outbound.limiter.retry_after(chat_id, retry_after)
+        if not result.get("ok"):
+            raise RuntimeError(f"Telegram {method} failed: {result.get('description')}")
+        return result["result"]
+
+    async def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        return await self.call("sendMessage", chat_id=chat_id, text=text,
+                               parse_mode=parse_mode, reply_markup=reply_markup)
+
+    async def send_chat_action(self, chat_id, action="typing"):
+        return await self.call("sendChatAction", chat_id=chat_id, action=action)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class AsyncRuntime:
+    """Event loop thread that runs handlers as coroutines, ordered per chat."""
+
+    def __init__(self, token):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=AIO_SYNC_WORKERS, thread_name_prefix="aio-sync")
+        self.loop.set_default_executor(self.executor)
+        self.db = AsyncPostgrest(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+        self.telegram = AsyncTelegram(token)
+        self._chat_locks = {}  # chat_id -> [asyncio.Lock, users]
+        self._thread = threading.Thread(target=self._run_loop, name="aio-loop", daemon=True)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        self._thread.start()
+        logging.info(f"asyncio runtime started with {AIO_SYNC_WORKERS} sync workers")
+
+    def stop(self):
+        async def close_clients():
+            await self.db.aclose()
+            await self.telegram.aclose()
+        asyncio.run_coroutine_threadsafe(close_clients(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.executor.shutdown(wait=False)
+
+    async def run_sync(self, fn, *args):
+        """Run a blocking function on the executor."""
+        return await self.loop.run_in_executor(None, fn, *args)
+
+    def handler(self, fn):
+        """Wrap a coroutine or plain handler as a PTB callback that returns immediately."""
+        def callback(update, context):
+            asyncio.run_coroutine_threadsafe(self._handle(fn, update, context), self.loop)
+        callback.__name__ = getattr(fn, "__name__", "callback")
+        return callback
+
+    async def _handle(self, fn, update, context):
+        # Updates of one chat keep their order, other chats run concurrently
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        slot = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                if asyncio.iscoroutinefunction(fn):
+                    await fn(update, context)
+                else:
+                    await self.run_sync(fn, update, context)
+        except Exception as e:
+            logging.exception(f"Error in async handler {getattr(fn, '__name__', fn)}: {e}")
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._chat_locks.pop(chat_id, None)
+
+runtime = None
+
+def start_runtime(token):
+    """Create and start the process-wide runtime used by handlers.async_handlers."""
+    global runtime
+    runtime = AsyncRuntime(token)
+    runtime.start()
+    return runtime
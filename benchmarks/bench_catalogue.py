@@ -0,0 +1,102 @@
+"""Local TMDB catalogue: ingest throughput and memory, and search latency.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_catalogue [--movies 500000] [--searches 2000]
+
+First the small fixture export in benchmarks/fixtures is ingested and a few
+known queries are checked against it. Then a synthetic gzipped export with
+--movies lines (the real one has about a million) is ingested while tracemalloc
+watches peak Python memory, and random title prefixes are searched.
+"""
+import os
+import gzip
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import catalogue
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "movie_ids_sample.json")
+
+# query -> TMDB ids expected first, in order
+FIXTURE_CHECKS = {
+    "matrix": [603, 624860, 604],
+    "the matrix": [603, 624860, 604],
+    "matr": [603, 624860, 604],
+    "amelie": [194],
+    "lion king": [8587, 420818],
+    "lord of the rings return": [122],
+    "千と千尋の神隠し": [129],
+    "2001": [62],
+    "nothing like this": [],
+}
+
+WORDS = ("the of a night last return dark star city love war secret house blood king "
+         "summer winter ghost island road river queen empire shadow fire").split()
+
+def check_fixture(directory):
+    path = os.path.join(directory, "fixture.db")
+    count = catalogue.ingest(FIXTURE, path)
+    catalogue.CATALOGUE_DB = path
+    failures = 0
+    for query, expected in FIXTURE_CHECKS.items():
+        found = catalogue.search(query)[:len(expected)] if expected else catalogue.search(query)
+        if found != expected:
+            failures += 1
+            print(f"  FAIL {query!r}: expected {expected}, got {found}")
+    print(f"fixture: {count} movies indexed, {len(FIXTURE_CHECKS) - failures}/{len(FIXTURE_CHECKS)} queries as expected")
+    return failures
+
+def write_export(path, movies):
+    rng = random.Random(0)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for movie_id in range(1, movies + 1):
+            title = " ".join(rng.choices(WORDS, k=rng.randint(1, 5))).title()
+            f.write(json.dumps({"adult": rng.random() < 0.02, "id": movie_id, "original_title": title,
+                                "popularity": round(rng.expovariate(0.2), 3), "video": False}) + "\n")
+    return rng
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movies", type=int, default=500000)
+    parser.add_argument("--searches", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        failures = check_fixture(directory)
+
+        export = os.path.join(directory, "movie_ids.json.gz")
+        write_export(export, args.movies)
+        path = os.path.join(directory, "catalogue.db")
+        tracemalloc.start()
+        started = time.perf_counter()
+        count = catalogue.ingest(export, path)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"ingest: {count} movies in {elapsed:.1f}s ({count / elapsed:,.0f}/s), "
+              f"peak Python memory {peak / 1024 / 1024:.1f} MB, file {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        catalogue.CATALOGUE_DB = path
+        rng = random.Random(1)
+        queries = []
+        for _ in range(args.searches):
+            words = rng.choices(WORDS, k=rng.randint(1, 3))
+            # Users often stop typing partway through the last word
+            words[-1] = words[-1][:rng.randint(min(2, len(words[-1])), len(words[-1]))]
+            queries.append(" ".join(words))
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            catalogue.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        print(f"search: p50 {timings[len(timings) // 2]:.2f} ms, p99 {timings[int(len(timings) * 0.99)]:.2f} ms "
+              f"over {len(timings)} queries")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
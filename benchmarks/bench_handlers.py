@@ -0,0 +1,267 @@
+"""Latency, throughput and round trips of the real handlers, offline.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_handlers [--sizes 1,10,100,1000,10000] [--households 4] [--rounds 10]
+                                        [--supabase-latency-ms 0] [--tmdb-latency-ms 0]
+
+The handlers bot.py registers (list_movies, random_movie, tmdb_search and the
+button_handler routes) are called with synthetic Updates and CallbackContexts,
+each inside its own repository unit of work like in the bot. Supabase is the
+in-memory PostgREST of benchmarks/fakes.py and TMDB its FakeTMDB, both over
+local HTTP with the given latency. The Bot API is an in-process fake that
+answers at once. The fake has no RPCs, so /random takes its count + offset
+path (two queries). For every household size, `--households` households (two
+members each) go through the same flow in parallel, one step at a time:
+
+    /list planned, Next page, Prev page     (the page buttons only if the list has more than a page)
+    /random all
+    a TMDB search, Next movie, Add to my list, Planned
+
+Each household first runs the flow once per member unrecorded, so identities,
+duplicate indexes and poster file_ids are warm as in a running bot. Per step the
+run prints ops/s (across households), p50/p99 latency, and per operation the
+Supabase and TMDB calls (counted by metrics.py in the handler's thread, so
+background prefetching is not included) and Bot API calls. "fake db ms" is the
+time the fake PostgREST spent filtering and sorting in Python, which a database
+spends in an index; it is part of the latency. Exits 1 if a handler raised.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import argparse
+import tempfile
+import threading
+from itertools import count
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from benchmarks.fakes import FakeBackend, FakeTMDB, BOT_TOKEN, command_update
+
+FIRST_CHAT_ID = 50_000_000
+
+class FakeBotRequest:
+    """Stands in for telegram.utils.request.Request: answers every Bot API call at once."""
+    con_pool_size = 8
+
+    def __init__(self):
+        self.local = threading.local()
+        self.last = {}  # chat_id -> the latest message sent or edited there, as a Bot API dict
+        self.message_ids = count(1)
+
+    def calls(self):
+        """Bot API calls made by the current thread so far."""
+        return getattr(self.local, "calls", 0)
+
+    def post(self, url, data, timeout=None):
+        self.local.calls = self.calls() + 1
+        method = url.rsplit("/", 1)[1]
+        if method not in ("sendMessage", "sendPhoto", "editMessageText", "editMessageMedia"):
+            return True
+        chat_id = int(data["chat_id"])
+        message = {"message_id": data.get("message_id") or next(self.message_ids), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"},
+                   "from": {"id": int(BOT_TOKEN.split(":")[0]), "is_bot": True, "first_name": "Bench"}}
+        if method in ("sendPhoto", "editMessageMedia"):
+            message["photo"] = [{"file_id": f"photo-{message['message_id']}",
+                                 "file_unique_id": f"p{message['message_id']}", "width": 500, "height": 750}]
+        else:
+            message["text"] = data.get("text", "")
+        markup = data.get("reply_markup")
+        if markup is not None:
+            message["reply_markup"] = json.loads(markup) if isinstance(markup, str) else markup.to_dict()
+        self.last[chat_id] = message
+        return message
+
+    def buttons(self, chat_id):
+        """callback_data of the inline buttons under the chat's latest message."""
+        markup = self.last.get(chat_id, {}).get("reply_markup") or {}
+        return {button.get("callback_data") for row in markup.get("inline_keyboard", []) for button in row}
+
+class Household:
+    def __init__(self, number, first_chat_id):
+        self.id = str(uuid.uuid4())
+        self.name = f"h{number}"
+        self.chat_ids = [first_chat_id, first_chat_id + 1]
+        self.user_ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    def users(self):
+        return [{"id": user_id, "chat_id": str(chat_id), "partner_id": self.user_ids[1 - i],
+                 "household_id": self.id, "created_at": "2020-01-01T00:00:00+00:00"}
+                for i, (user_id, chat_id) in enumerate(zip(self.user_ids, self.chat_ids))]
+
+    def movies(self, size):
+        """size movies, every other one planned, one minute apart."""
+        start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        return [{"id": str(uuid.uuid4()), "title": f"{self.name} movie {i}",
+                 "category": "planned" if i % 2 == 0 else "watched", "user_id": self.user_ids[i % 2],
+                 "household_id": self.id, "created_at": (start + timedelta(minutes=i)).isoformat()}
+                for i in range(size)]
+
+class Bench:
+    """Builds updates and contexts like the dispatcher does and records what each handler call cost."""
+
+    def __init__(self, backend):
+        from queue import Queue
+        from telegram.ext import Dispatcher, ExtBot
+        self.backend = backend
+        self.request = FakeBotRequest()
+        self.bot = ExtBot(BOT_TOKEN, request=self.request)
+        self.dispatcher = Dispatcher(self.bot, Queue(), workers=1, use_context=True)  # never started
+        self.update_ids = count(1)
+        self.samples = defaultdict(list)  # operation -> [(seconds, supabase calls, tmdb calls, Bot API calls)]
+        self.wall = defaultdict(float)  # operation -> seconds its steps took across households
+        self.fake_db = defaultdict(float)  # operation -> seconds the fake PostgREST was busy
+        self.errors = []
+        self.recording = False
+        self._lock = threading.Lock()
+
+    def message(self, chat_id, text):
+        from telegram import Update
+        return Update.de_json(command_update(next(self.update_ids), chat_id, text), self.bot)
+
+    def press(self, chat_id, data):
+        """A callback update for a button under the chat's latest message."""
+        from telegram import Update
+        update_id = next(self.update_ids)
+        return Update.de_json({"update_id": update_id, "callback_query": {
+            "id": str(update_id), "chat_instance": str(chat_id), "data": data,
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "message": self.request.last[chat_id],
+        }}, self.bot)
+
+    def run(self, operation, handler, update, args=None):
+        import metrics
+        import repository
+        from telegram.ext import CallbackContext
+        context = CallbackContext.from_update(update, self.dispatcher)
+        context.args = args
+        calls_before, bot_before = metrics.thread_calls(), self.request.calls()
+        started = time.perf_counter()
+        try:
+            repository.per_update(handler)(update, context)
+        except Exception as e:
+            with self._lock:
+                self.errors.append(f"{operation}: {e!r}")
+        seconds = time.perf_counter() - started
+        calls = metrics.thread_calls()
+        sample = (seconds,
+                  calls.get("supabase", 0) - calls_before.get("supabase", 0),
+                  calls.get("tmdb", 0) - calls_before.get("tmdb", 0),
+                  self.request.calls() - bot_before)
+        if self.recording:
+            with self._lock:
+                self.samples[operation].append(sample)
+
+# --- The flow, one step per operation ---
+# A step returns False when it doesn't apply (e.g. no Next button on a short list).
+def list_planned(bench, household, chat_id, round_number):
+    from handlers.movies import list_movies
+    bench.run("/list planned", list_movies, bench.message(chat_id, "/list planned"), ["planned"])
+
+def button_step(operation, data):
+    def step(bench, household, chat_id, round_number):
+        from handlers.callbacks import button_handler
+        if data not in bench.request.buttons(chat_id):
+            return False
+        bench.run(operation, button_handler, bench.press(chat_id, data))
+    return step
+
+def random_all(bench, household, chat_id, round_number):
+    from handlers.movies import random_movie
+    bench.run("/random all", random_movie, bench.message(chat_id, "/random all"), ["all"])
+
+def tmdb_search(bench, household, chat_id, round_number):
+    from handlers.tmdb import tmdb_search
+    # A new query every time, so TMDB is asked rather than the response cache
+    query = f"bench {household.name} {chat_id} {round_number}"
+    bench.run("tmdb: search", tmdb_search, bench.message(chat_id, query))
+
+FLOW = (
+    ("/list planned", list_planned),
+    ("list: next page", button_step("list: next page", "listpg_next")),
+    ("list: prev page", button_step("list: prev page", "listpg_prev")),
+    ("/random all", random_all),
+    ("tmdb: search", tmdb_search),
+    ("tmdb: next movie", button_step("tmdb: next movie", "tmdb_next")),
+    ("tmdb: add to list", button_step("tmdb: add to list", "tmdb_add_to_list_1")),
+    ("tmdb: planned", button_step("tmdb: planned", "tmdb_category_planned_1")),
+)
+
+def run_size(bench, pool, size, households, rounds):
+    bench.backend.load("users", [user for household in households for user in household.users()])
+    bench.backend.load("movies", [movie for household in households for movie in household.movies(size)])
+    warm_up = len(households[0].chat_ids)
+    for round_number in range(warm_up + rounds):
+        bench.recording = round_number >= warm_up
+        for operation, step in FLOW:
+            def run_step(household):
+                chat_id = household.chat_ids[round_number % len(household.chat_ids)]
+                return step(bench, household, chat_id, round_number) is not False
+            busy_before = bench.backend.busy
+            started = time.perf_counter()
+            ran = sum(pool.map(run_step, households))
+            if bench.recording and ran:
+                bench.wall[operation] += time.perf_counter() - started
+                bench.fake_db[operation] += bench.backend.busy - busy_before
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+def report(bench, size, households):
+    print(f"\n{size} movies per household, {households} households in parallel")
+    print(f"  {'operation':20} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'supabase':>9} {'tmdb':>6} "
+          f"{'bot api':>8} {'fake db ms':>11}")
+    for operation, _ in FLOW:
+        samples = bench.samples.get(operation)
+        if not samples:
+            print(f"  {operation:20} {'-':>8}")
+            continue
+        n = len(samples)
+        latencies = [s[0] for s in samples]
+        print(f"  {operation:20} {n / bench.wall[operation]:8.0f} {percentile(latencies, 0.5):8.1f} "
+              f"{percentile(latencies, 0.99):8.1f} {sum(s[1] for s in samples) / n:9.2f} "
+              f"{sum(s[2] for s in samples) / n:6.2f} {sum(s[3] for s in samples) / n:8.2f} "
+              f"{bench.fake_db[operation] / n * 1000:11.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100,1000,10000", help="movies per household, comma-separated")
+    parser.add_argument("--households", type=int, default=4, help="households going through the flow in parallel")
+    parser.add_argument("--rounds", type=int, default=10, help="recorded rounds of the flow per household")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0)
+    parser.add_argument("--tmdb-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    backend = FakeBackend(latency=args.supabase_latency_ms / 1000).start()
+    tmdb = FakeTMDB(latency=args.tmdb_latency_ms / 1000).start()
+    workdir = tempfile.mkdtemp(prefix="bench_handlers_")
+    # The modules read these when first imported (in Bench and the steps)
+    os.environ.update(backend.env(), **tmdb.env(), POSTER_DB="",
+                      CATALOGUE_DB=os.path.join(workdir, "no-catalogue.db"))
+    bench = Bench(backend)
+    chat_ids = count(FIRST_CHAT_ID, 2)
+    failed = False
+    with ThreadPoolExecutor(max_workers=args.households) as pool:
+        for size in (int(s) for s in args.sizes.split(",")):
+            households = [Household(i, next(chat_ids)) for i in range(args.households)]
+            bench.samples.clear()
+            bench.wall.clear()
+            bench.fake_db.clear()
+            run_size(bench, pool, size, households, args.rounds)
+            report(bench, size, args.households)
+            if bench.errors:
+                failed = True
+                print(f"  {len(bench.errors)} handler calls raised, e.g. {bench.errors[0]}")
+                bench.errors.clear()
+    print(f"\nTMDB fake: {tmdb.calls['api']} API calls, {tmdb.calls['image']} poster downloads (prefetching included)")
+    backend.stop()
+    tmdb.stop()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+"""Inline search as users type: keystroke-to-answer latency and TMDB calls saved.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_inline [--users 50] [--target-p99-ms 750]
+
+Each simulated user types a title from a fixed corpus one character at a time,
+60-200 ms apart, through inline_search.submit(). TMDB is replaced by an in-process
+fake with 60-250 ms latency (and an occasional 600 ms straggler) that searches
+the same corpus. The run fails (exit 1) if the p99 latency from the last
+keystroke to its answer is above the target: the default allows the debounce
+plus a slow TMDB answer.
+"""
+import time
+import random
+import argparse
+import threading
+import tmdb_cache
+import inline_search
+
+WORDS = ("the of a night last return dark star city love war secret house blood king "
+         "summer winter ghost island road river queen empire shadow fire matrix").split()
+
+def make_corpus(size=3000):
+    rng = random.Random(0)
+    corpus = []
+    for tmdb_id in range(1, size + 1):
+        title = " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title()
+        corpus.append({"id": tmdb_id, "title": title, "overview": "", "poster_path": f"/{tmdb_id}.jpg",
+                       "release_date": "2001-01-01", "vote_average": 7.0})
+    return corpus
+
+class FakeTMDB:
+    def __init__(self, corpus):
+        self.corpus = [(inline_search.normalize_query(movie["title"]).split(), movie) for movie in corpus]
+        self.calls = 0
+        self.rng = random.Random(2)
+        self.lock = threading.Lock()
+
+    def __call__(self, endpoint, params):
+        with self.lock:
+            self.calls += 1
+            delay = 0.6 if self.rng.random() < 0.01 else self.rng.uniform(0.06, 0.25)
+        time.sleep(delay)
+        query = params["query"]
+        parts = query.split()
+        found = [movie for words, movie in self.corpus
+                 if all(any(word.startswith(part) for word in words) for part in parts)]
+        return {"page": 1, "results": found[:20], "total_results": len(found)}
+
+def simulate_user(user_id, title, rng, last_answer):
+    """Type title, recording when the final text was typed; answers for other texts are ignored."""
+    typed = ""
+    for char in title.lower():
+        typed += char
+        final = typed == title.lower()
+        sent_at = time.monotonic()
+
+        def answer(summaries, sent_at=sent_at, final=final):
+            if final:
+                last_answer[user_id] = time.monotonic() - sent_at
+
+        inline_search.submit(user_id, typed, answer, sent_at)
+        time.sleep(rng.uniform(0.06, 0.2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=4, help="titles typed per user")
+    parser.add_argument("--target-p99-ms", type=float, default=750)
+    args = parser.parse_args()
+
+    corpus = make_corpus()
+    fake = FakeTMDB(corpus)
+    tmdb_cache._fetch = fake
+    rng = random.Random(1)
+    latencies = []
+    keystrokes = 0
+    for _ in range(args.rounds):
+        last_answer = {}
+        titles = {user_id: rng.choice(corpus)["title"] for user_id in range(args.users)}
+        keystrokes += sum(len(title) for title in titles.values())
+        threads = [threading.Thread(target=simulate_user, args=(user_id, title, random.Random(user_id), last_answer))
+                   for user_id, title in titles.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Let the last debounced searches finish
+        time.sleep(inline_search.INLINE_DEBOUNCE + 1.0)
+        missing = len(titles) - len(last_answer)
+        if missing:
+            print(f"  {missing} users got no answer for their final text")
+        latencies += last_answer.values()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    stats = inline_search.stats()
+    print(f"{keystrokes} keystrokes -> {fake.calls} TMDB searches "
+          f"({stats['cache_hits']} cache hits, {stats['prefix_hits']} prefix hits, {stats['superseded']} superseded)")
+    print(f"last keystroke to answer: p50 {p50:.0f} ms, p99 {p99:.0f} ms "
+          f"(debounce {inline_search.INLINE_DEBOUNCE * 1000:.0f} ms, target p99 {args.target_p99_ms:.0f} ms)")
+    if p99 > args.target_p99_ms or len(latencies) < args.users * args.rounds:
+        print("FAIL")
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,111 @@
+"""Cost of the always-on metrics per update.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_metrics [--updates 200000] [--budget-us 8]
+
+A callback update is resolved and run through a handler that makes three
+external calls, the way button_handler does it, with and without the
+instrumentation. Instrumented, the route is timed and the calls are recorded
+(two Supabase calls, one of them through the httpx event hooks, and one TMDB
+call); uninstrumented, the same calls do nothing. The difference per
+update, single-threaded and with 8 threads recording into their own shards,
+must stay under the budget (exit 1 otherwise).
+"""
+import time
+import argparse
+import threading
+import httpx
+import metrics
+from router import Router
+
+KEYS = ["tmdb_planned_603", "editcat_42_watched", "page_planned_3", "back_to_main"]
+
+def build(calls):
+    """A router like callback_router whose handlers make `calls()` (their external calls)."""
+    router = Router("bench")
+    for key in ("tmdb_", "editcat_", "page_"):
+        router.prefix(key, pass_data=True)(lambda update, context, data: calls())
+    router.exact("back_to_main")(lambda update, context: calls())
+    return router
+
+def bare(router, updates):
+    """Lookup and call only: what dispatch costs without instrumentation."""
+    for i in range(updates):
+        key = KEYS[i & 3]
+        route = router.resolve(key)
+        if route.pass_data:
+            route.handler(None, None, key)
+        else:
+            route.handler(None, None)
+
+def instrumented(router, updates):
+    for i in range(updates):
+        router.dispatch(KEYS[i & 3], None, None)
+
+def uninstrumented_calls():
+    # Same number of function calls as the instrumented version, doing nothing
+    _noop(None)
+    _noop(None)
+    _noop(None)
+    _noop(None)
+
+def _noop(_):
+    pass
+
+def instrumented_calls(hooks):
+    on_request, on_response = hooks
+    request = httpx.Request("GET", "http://supabase.local/rest/v1/movies")
+    response = httpx.Response(200, request=request)
+
+    def calls():
+        on_request(request)
+        on_response(response)
+        metrics.record_call("supabase", 0.004)
+        metrics.record_call("tmdb", 0.08)
+    return calls
+
+def timed(work, threads):
+    started = time.perf_counter()
+    if threads == 1:
+        work()
+    else:
+        workers = [threading.Thread(target=work) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    return time.perf_counter() - started
+
+def capture_hooks():
+    client = httpx.Client()
+    metrics.instrument_httpx(client, "supabase")
+    return client.event_hooks["request"][-1], client.event_hooks["response"][-1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=200000)
+    parser.add_argument("--budget-us", type=float, default=8.0)
+    args = parser.parse_args()
+
+    calls = instrumented_calls(capture_hooks())
+    worst = 0.0
+    for threads in (1, 8):
+        per_thread = args.updates // threads
+        base = timed(lambda: bare(build(uninstrumented_calls), per_thread), threads)
+        router = build(calls)
+        metrics.register_router(router)
+        full = timed(lambda: instrumented(router, per_thread), threads)
+        total = per_thread * threads
+        overhead = (full - base) / total * 1e6
+        worst = max(worst, overhead)
+        print(f"{threads} thread(s): bare {base / total * 1e6:.2f} us/update, "
+              f"instrumented (3 external calls) {full / total * 1e6:.2f} us/update, overhead {overhead:.2f} us")
+    started = time.perf_counter()
+    text = metrics.render()
+    print(f"render: {len(text.splitlines())} lines in {(time.perf_counter() - started) * 1000:.1f} ms")
+    print("OK" if worst <= args.budget_us else "FAIL", f"(budget {args.budget_us:.1f} us/update)")
+    return 0 if worst <= args.budget_us else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
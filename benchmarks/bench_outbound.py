@@ -0,0 +1,115 @@
+"""Outbound sends under a burst: flood-limit hits and wait time by priority.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_outbound [--chats 40] [--sends 4] [--background 100]
+
+Every chat sends a burst of messages at once, the way a list page (delete and
+resend) plus a few edits does, from 16 worker threads like the chat scheduler's.
+Meanwhile one thread sends background notifications. The Bot API is a fake
+Request that answers 429 (RetryAfter) whenever a chat gets more than a short
+burst (outbound.SEND_CHAT_BURST, plus the one message a second allowed after
+it) within a second, or the bot more than 30 in a second. The run
+compares a plain ExtBot, which loses the rejected sends, with the rate-limited
+bot, which waits for its tokens and retries after a 429.
+"""
+import time
+import argparse
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+import outbound
+
+TOKEN = "123456:bench"
+TELEGRAM_GLOBAL_LIMIT = 30
+
+class FloodingRequest:
+    """Stands in for telegram.utils.request.Request and enforces Telegram-like flood limits."""
+    con_pool_size = 32
+
+    def __init__(self, chat_limit):
+        self.chat_limit = chat_limit
+        self.recent = defaultdict(deque)  # chat_id (None: the whole bot) -> send times in the last second
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data, timeout=None):
+        chat_id = int(data["chat_id"])
+        now = time.monotonic()
+        with self.lock:
+            for key, limit in ((chat_id, self.chat_limit), (None, TELEGRAM_GLOBAL_LIMIT)):
+                sent = self.recent[key]
+                while sent and now - sent[0] >= 1:
+                    sent.popleft()
+                if len(sent) >= limit:
+                    self.rejected += 1
+                    raise RetryAfter(1)
+            self.recent[chat_id].append(now)
+            self.recent[None].append(now)
+        return {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", "")}
+
+def run(bot, chats, sends, background):
+    latencies = {"interactive": [], "background": []}
+    failed = 0
+    lock = threading.Lock()
+
+    def send(chat_id, kind):
+        nonlocal failed
+        started = time.monotonic()
+        try:
+            bot.send_message(chat_id, "hello")
+        except RetryAfter:
+            with lock:
+                failed += 1
+            return
+        with lock:
+            latencies[kind].append(time.monotonic() - started)
+
+    def chat_burst(chat_id):
+        for _ in range(sends):
+            send(chat_id, "interactive")
+
+    def notifications():
+        with outbound.background():
+            for i in range(background):
+                send(100000 + i, "background")
+
+    started = time.monotonic()
+    notifier = threading.Thread(target=notifications)
+    notifier.start()
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(chat_burst, range(1, chats + 1)))
+    notifier.join()
+    return time.monotonic() - started, latencies, failed
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--sends", type=int, default=4, help="messages per chat, sent back to back")
+    parser.add_argument("--background", type=int, default=100, help="background notifications, one per chat")
+    args = parser.parse_args()
+    total = args.chats * args.sends + args.background
+
+    request = FloodingRequest(outbound.SEND_CHAT_BURST + 1)
+    elapsed, latencies, failed = run(ExtBot(TOKEN, request=request), args.chats, args.sends, args.background)
+    print(f"plain ExtBot:    {total} sends in {elapsed:.1f}s, {request.rejected} answered 429, {failed} lost")
+
+    request = FloodingRequest(outbound.SEND_CHAT_BURST + 1)
+    bot = outbound.RateLimitedBot(TOKEN, request=request, limiter=outbound.SendLimiter())
+    elapsed, latencies, failed = run(bot, args.chats, args.sends, args.background)
+    stats = bot.send_limiter.stats()
+    print(f"RateLimitedBot:  {total} sends in {elapsed:.1f}s, {request.rejected} answered 429, {failed} lost, "
+          f"{stats['throttled']} waited for a token")
+    for kind, values in latencies.items():
+        print(f"  {kind:11}  p50 {percentile(values, 0.5):6.0f} ms  p99 {percentile(values, 0.99):6.0f} ms")
+    return 1 if failed or request.rejected else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
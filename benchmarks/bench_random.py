@@ -0,0 +1,86 @@
+"""Latency of the /random pick against the household size (sql/007_random_key.sql).
+
+Needs the local stand-in from sql/local/docker-compose.yml:
+
+    docker compose -f sql/local/docker-compose.yml up -d
+    python -m benchmarks.bench_random [--sizes 10,100,1000,10000] [--picks 200]
+
+For every size a fresh household gets that many movies, then it is picked from
+`--picks` times through pick_random_household_movie (random key, one index probe),
+with and without favour_older, and through the old count + OFFSET pick_random_movie
+for comparison. The random-key columns should stay flat from 10 to 10,000 movies
+while count + OFFSET grows with the list. Exits 1 if a pick returned nothing or a
+movie of another household.
+"""
+import os
+import time
+import uuid
+import argparse
+import statistics
+import requests
+
+POSTGREST_URL = os.getenv("POSTGREST_URL", "http://localhost:3000")
+CATEGORIES = ["planned", "watched"]
+
+session = requests.Session()
+
+def rpc(function, **params):
+    r = session.post(f"{POSTGREST_URL}/rpc/{function}", json=params, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+def create_household(size):
+    """A fresh user with size movies; returns the user row (with its household_id)."""
+    r = session.post(
+        f"{POSTGREST_URL}/users", json={"chat_id": f"random-{uuid.uuid4().hex[:8]}"},
+        headers={"Prefer": "return=representation"}, timeout=10,
+    )
+    r.raise_for_status()
+    user = r.json()[0]
+    for start in range(0, size, 1000):
+        movies = [{"user_id": user["id"], "title": f"bench movie {i}", "category": CATEGORIES[i % 2]}
+                  for i in range(start, min(size, start + 1000))]
+        session.post(f"{POSTGREST_URL}/movies", json=movies, timeout=60).raise_for_status()
+    return user
+
+def timed_picks(picks, function, **params):
+    samples, rows = [], []
+    for _ in range(picks):
+        started = time.perf_counter()
+        result = rpc(function, **params)
+        samples.append((time.perf_counter() - started) * 1000)
+        rows.append(result[0] if result else None)
+    return samples, rows
+
+def summary(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"{statistics.median(samples):6.1f} / {p99:6.1f}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="movies per household, comma-separated")
+    parser.add_argument("--picks", type=int, default=200, help="timed picks per size and function")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"p50 / p99 ms over {args.picks} picks")
+    print(f"{'movies':>8}  {'random key':>15}  {'favour older':>15}  {'count + offset':>15}  {'distinct':>8}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        user = create_household(size)
+        household = {"p_household_id": user["household_id"], "p_categories": CATEGORIES}
+        rpc("pick_random_household_movie", **household)  # warm the plan cache
+        random_key, rows = timed_picks(args.picks, "pick_random_household_movie", **household)
+        older, older_rows = timed_picks(args.picks, "pick_random_household_movie", **household, p_favour_older=True)
+        offset, _ = timed_picks(args.picks, "pick_random_movie", p_user_ids=[user["id"]], p_categories=CATEGORIES)
+        picked = rows + older_rows
+        if any(row is None or row["household_id"] != user["household_id"] for row in picked):
+            failed = True
+            print(f"{size:>8}  a pick returned nothing or another household's movie")
+            continue
+        distinct = len({row["id"] for row in rows})
+        print(f"{size:>8}  {summary(random_key):>15}  {summary(older):>15}  {summary(offset):>15}  {distinct:>8}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
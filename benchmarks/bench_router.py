@@ -0,0 +1,46 @@
+"""Micro-benchmark: callback dispatch cost of the route trie vs. an if/startswith chain.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_router
+"""
+import random
+import string
+import timeit
+from router import Router
+
+def _noop(update, context):
+    pass
+
+def build(n_routes, seed=42):
+    rng = random.Random(seed)
+    prefixes = set()
+    while len(prefixes) < n_routes:
+        prefixes.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 14))) + "_")
+    prefixes = sorted(prefixes)
+    router = Router(f"bench{n_routes}")
+    for prefix in prefixes:
+        router.prefix(prefix)(_noop)
+    keys = [p + "0123456789abcdef" for p in rng.sample(prefixes, min(200, n_routes))]
+    return router, prefixes, keys
+
+def chain_lookup(prefixes, key):
+    # What button_handler used to do: test each prefix in order
+    for prefix in prefixes:
+        if key.startswith(prefix):
+            return prefix
+    return None
+
+def main():
+    print(f"{'routes':>7} {'trie ns/lookup':>15} {'chain ns/lookup':>16}")
+    for n_routes in (10, 20, 50, 100, 1000, 10000):
+        router, prefixes, keys = build(n_routes)
+        loops = 20
+        trie = timeit.timeit(lambda: [router.resolve(k) for k in keys], number=loops)
+        chain = timeit.timeit(lambda: [chain_lookup(prefixes, k) for k in keys], number=loops if n_routes <= 1000 else 2)
+        calls = len(keys) * loops
+        chain_calls = len(keys) * (loops if n_routes <= 1000 else 2)
+        print(f"{n_routes:>7} {trie / calls * 1e9:>15.0f} {chain / chain_calls * 1e9:>16.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Cold start: import cost of bot.py and time until the first update is handled.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs 5] [--top 12]
+
+First `python -X importtime -c "import bot"` is parsed: what importing bot.py
+costs and which imports dominate, next to the handler modules a fast start
+defers to the warm-up. Then bot.py is started as a subprocess, normally and
+with --fast-start, against the fakes in benchmarks/fakes.py with a /start
+update already waiting; every call to the fakes takes --latency-ms. The time from spawning the process to the fake
+receiving the bot's reply is the time to first update processed.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+from benchmarks.fakes import FakeBackend, command_update
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = "handlers.menu, handlers.callbacks, handlers.inline"
+# Imported by the interpreter itself before the statement runs
+STARTUP_MODULES = {"site", "encodings", "encodings.utf_8", "_frozen_importlib_external", "io", "zipimport",
+                   "_signal", "_codecs", "codecs", "time", "_abc", "abc", "winreg"}
+
+def bot_env(backend, workdir):
+    env = dict(os.environ, **backend.env())
+    env.update(SESSION_DB="", POSTER_DB="", CATALOGUE_DB=os.path.join(workdir, "catalogue.db"),
+               TMDB_API_KEY="", PYTHONPATH=ROOT, BOT_FAST_START="")
+    return env
+
+def import_profile(statement, env):
+    """(total ms, [(cumulative ms, module)]) for the statement's own imports and the ones they make directly."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    total, children = 0.0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        ms = int(cumulative) / 1000
+        if depth == 0 and name.strip() not in STARTUP_MODULES:
+            total += ms
+        elif depth == 1:
+            children.append((ms, name.strip()))
+    return total, children
+
+def first_update(fast_start, latency, timeout=30):
+    """Seconds from spawning bot.py to its reply to a waiting /start, and to its first getUpdates."""
+    backend = FakeBackend(latency).start()
+    backend.push_update(command_update(1, 42, "/start"))
+    with tempfile.TemporaryDirectory() as workdir:
+        command = [sys.executable, os.path.join(ROOT, "bot.py")] + (["--fast-start"] if fast_start else [])
+        started = time.monotonic()
+        process = subprocess.Popen(command, cwd=workdir, env=bot_env(backend, workdir),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            sent = [call for call in backend.wait_for_sent(2, timeout) if call[1] == "sendMessage"]
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            backend.stop()
+    if not sent or backend.first_poll_at is None:
+        raise RuntimeError("the bot did not answer /start")
+    return sent[0][0] - started, backend.first_poll_at - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="bot starts per mode")
+    parser.add_argument("--top", type=int, default=12, help="heaviest imports to list")
+    parser.add_argument("--latency-ms", type=float, default=50, help="round-trip time of the fake Telegram and Supabase")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = bot_env(FakeBackend(), workdir)
+        total, imports = import_profile("import bot", env)
+        deferred, _ = import_profile(f"import bot; import {DEFERRED_MODULES}", env)
+    print(f"import bot: {total:.0f} ms; with the handler modules a fast start defers: {deferred:.0f} ms")
+    for ms, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    for fast_start in (False, True):
+        replies, polls = zip(*(first_update(fast_start, args.latency_ms / 1000) for _ in range(args.runs)))
+        label = "--fast-start" if fast_start else "default     "
+        print(f"{label}  first getUpdates p50 {median(polls) * 1000:.0f} ms, "
+              f"first update handled p50 {median(replies) * 1000:.0f} ms "
+              f"(min {min(replies) * 1000:.0f}, max {max(replies) * 1000:.0f}, {args.runs} runs)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,93 @@
+"""Per-user memory of TMDB browsing state: raw result dicts vs. ids + shared summaries.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tmdb_session [--users 5000]
+
+Two workloads are measured with tracemalloc:
+- shared: every user browses the same cached popular list (one parsed response)
+- distinct: users search for a few hundred different queries, each parsed from
+  its own response; users with the same query share its result list
+"""
+import json
+import random
+import argparse
+import tracemalloc
+import tmdb_store
+import tmdb_stream
+
+def fake_response(seed, count=20):
+    """A TMDB-shaped results page with realistic field sizes."""
+    rng = random.Random(seed)
+    words = "the of a night last return dark star city love war secret house blood king".split()
+    results = []
+    for i in range(count):
+        movie_id = rng.randint(1, 1_000_000)
+        results.append({
+            "adult": False,
+            "backdrop_path": f"/{rng.getrandbits(96):024x}.jpg",
+            "genre_ids": rng.sample([12, 14, 16, 18, 27, 28, 35, 53, 80, 878], 3),
+            "id": movie_id,
+            "original_language": "en",
+            "original_title": " ".join(rng.choices(words, k=3)).title(),
+            "overview": " ".join(rng.choices(words, k=rng.randint(30, 70))).capitalize() + ".",
+            "popularity": rng.uniform(10, 3000),
+            "poster_path": f"/{rng.getrandbits(96):024x}.jpg",
+            "release_date": f"{rng.randint(1970, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "title": " ".join(rng.choices(words, k=3)).title(),
+            "video": False,
+            "vote_average": round(rng.uniform(3, 9), 3),
+            "vote_count": rng.randint(10, 30000),
+        })
+    # Round-trip through JSON so strings are fresh objects, like a real response
+    return json.loads(json.dumps({"page": 1, "results": results}))
+
+def old_session(endpoint, params, data):
+    # What tmdb_search/tmdb_popular used to keep, plus the pending copy from handle_add_to_list
+    results = data["results"]
+    return {"tmdb_results": results[:10], "current_result_index": 0, "pending_movie_tmdb_data": results[0]}
+
+def new_session(endpoint, params, data):
+    # A cursor and a reference to the shared result list (a whole TMDB page of ids)
+    session = {"current_result_index": 0, "pending_tmdb_id": data["results"][0]["id"]}
+    tmdb_stream.open_stream(session, endpoint, params, dict(data, total_pages=500))
+    return session
+
+def measure(users, make_session, responses):
+    tmdb_store.clear()
+    tmdb_stream.clear()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [make_session(*responses(u)) for u in range(users)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / users, sessions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    args = parser.parse_args()
+
+    shared = fake_response(0)
+
+    def search(user):
+        # A few hundred distinct queries: searches repeat and overlap between users,
+        # and every user's response is parsed anew
+        seed = user % 300 + 1
+        return "search/movie", {"query": f"query {seed}"}, fake_response(seed)
+
+    workloads = {
+        "shared": lambda user: ("movie/popular", {"language": "en-US"}, shared),
+        "distinct": search,
+    }
+    print(f"{'workload':>9} {'old bytes/user':>15} {'new bytes/user':>15} {'ratio':>6}")
+    for name, responses in workloads.items():
+        old, kept = measure(args.users, old_session, responses)
+        del kept
+        new, kept = measure(args.users, new_session, responses)
+        del kept
+        print(f"{name:>9} {old:>15.0f} {new:>15.0f} {old / new:>6.1f}x")
+    print(f"summaries kept in tmdb_store: {tmdb_store.stats()['size']}")
+
+if __name__ == "__main__":
+    main()
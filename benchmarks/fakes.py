@@ -0,0 +1,447 @@
+"""In-process fakes of the Telegram Bot API, Supabase's PostgREST and TMDB for benchmarks.
+
+One ThreadingHTTPServer answers both Telegram and PostgREST: point
+TELEGRAM_API_BASE_URL at `backend.telegram_url` and SUPABASE_URL at
+`backend.url`, then start the bot (in this process or as a subprocess). Tables
+live in memory; only the parts of PostgREST the bot uses are implemented (select
+lists, eq/neq/in/is/gt/gte/lt/lte filters, or/and groups, order, limit/offset and
+Range, exact counts, insert, update, delete). RPC calls answer PGRST202, so the
+bot takes its non-RPC fallbacks. FakeTMDB serves search, popular/top rated
+lists, movie details and poster images: point TMDB_API_URL at `tmdb.api_url` and
+TMDB_IMAGE_BASE_URL at `tmdb.image_url`.
+"""
+import json
+import time
+import uuid
+import zlib
+import socket
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+BOT_TOKEN = "123456:bench"
+BENCH_KEY = "bench.supabase.key"  # supabase-py only accepts JWT-shaped keys
+
+TABLE_COLUMNS = {
+    "users": ("id", "chat_id", "partner_id", "household_id", "invite_code", "created_at"),
+    "movies": ("id", "title", "category", "user_id", "household_id", "created_at",
+               "tmdb_id", "poster_path", "overview", "release_year"),
+}
+# Query parameters that are not column filters
+RESERVED_PARAMS = ("select", "order", "limit", "offset", "on_conflict", "columns", "or", "and")
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def command_update(update_id, chat_id, text, first_name="Bench"):
+    """A Telegram update carrying a text message (a /command if text starts with /)."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": first_name},
+        "from": {"id": chat_id, "is_bot": False, "first_name": first_name},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+def _condition(column, condition):
+    """Predicate on a row for one `column=op.value` filter."""
+    op, _, value = condition.partition(".")
+    if op == "not":
+        inner = _condition(column, value)
+        return lambda row: not inner(row)
+    if op == "is":
+        if value == "null":
+            return lambda row: row.get(column) is None
+        return lambda row: str(row.get(column)).lower() == value
+    value = value.strip('"')
+    if op == "in":
+        values = {v.strip('"') for v in value.strip("()").split(",")}
+        test = values.__contains__
+    else:
+        test = {"eq": value.__eq__, "neq": value.__ne__, "gt": value.__lt__, "gte": value.__le__,
+                "lt": value.__gt__, "lte": value.__ge__}.get(op, lambda stored: True)
+    return lambda row: row.get(column) is not None and test(str(row.get(column)))
+
+def _split_terms(text):
+    """Split an or/and group's body on its top-level commas."""
+    terms, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(text):
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            terms.append(text[start:i])
+            start = i + 1
+    terms.append(text[start:])
+    return terms
+
+def _group(operator, body):
+    """Predicate for `or=(...)`/`and=(...)`; body is the part inside the parentheses."""
+    predicates = []
+    for term in _split_terms(body):
+        if term.startswith(("and(", "or(")):
+            nested, _, rest = term.partition("(")
+            predicates.append(_group(nested, rest[:-1]))
+        else:
+            column, _, condition = term.partition(".")
+            predicates.append(_condition(column, condition))
+    combine = any if operator == "or" else all
+    return lambda row: combine(predicate(row) for predicate in predicates)
+
+def _compile(query):
+    """One predicate for all the filters of a request, parsed once rather than per row."""
+    predicates = []
+    for column, condition in query.items():
+        if column in ("or", "and"):
+            predicates.append(_group(column, condition[1:-1]))
+        elif column not in RESERVED_PARAMS:
+            predicates.append(_condition(column, condition))
+    return lambda row: all(predicate(row) for predicate in predicates)
+
+class FakeBackend:
+    """Fake Telegram and PostgREST; `latency` seconds are added to every request."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {name: [] for name in TABLE_COLUMNS}
+        self._by_household = {}  # table -> household_id -> rows, rebuilt after writes
+        self.updates = []
+        self.sent = []  # (monotonic time, method, params) of bot -> Telegram calls
+        self.calls = {"telegram": 0, "postgrest": 0}
+        self.busy = 0.0  # seconds spent answering PostgREST requests, without `latency`
+        self.first_poll_at = None
+        self._cond = threading.Condition()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def telegram_url(self):
+        return f"{self.url}/bot"
+
+    def env(self):
+        """Environment for a bot process talking to this backend."""
+        return {"TELEGRAM_BOT_TOKEN": BOT_TOKEN, "TELEGRAM_API_BASE_URL": self.telegram_url,
+                "SUPABASE_URL": self.url, "SUPABASE_KEY": BENCH_KEY}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-backend", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Telegram ---
+    def push_update(self, update):
+        with self._cond:
+            self.updates.append(update)
+            self._cond.notify_all()
+
+    def wait_for_sent(self, count, timeout):
+        """Block until the bot made `count` send calls; returns the calls so far."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.sent) < count and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return list(self.sent)
+
+    def telegram(self, method, params):
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            deadline = time.monotonic() + min(float(params.get("timeout") or 0), 1.0)
+            with self._cond:
+                if self.first_poll_at is None:
+                    self.first_poll_at = time.monotonic()
+                while True:
+                    pending = [u for u in self.updates if u["update_id"] >= offset]
+                    if pending or time.monotonic() >= deadline:
+                        return pending
+                    self._cond.wait(deadline - time.monotonic())
+        with self._cond:
+            self.sent.append((time.monotonic(), method, params))
+            self._cond.notify_all()
+        if method in ("sendMessage", "sendPhoto", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = params.get("chat_id") or 0
+            return {"message_id": len(self.sent), "date": int(time.time()),
+                    "chat": {"id": int(chat_id), "type": "private"}, "text": params.get("text", "")}
+        return True
+
+    # --- PostgREST ---
+    def load(self, table, rows):
+        """Replace a table's contents, e.g. with seeded rows (missing columns are null)."""
+        with self._cond:
+            self.tables[table] = [dict({column: None for column in TABLE_COLUMNS[table]}, **row) for row in rows]
+            self._by_household.pop(table, None)
+
+    def openapi(self):
+        return {"definitions": {name: {"properties": {column: {} for column in columns}}
+                                for name, columns in TABLE_COLUMNS.items()}}
+
+    def _candidates(self, table, query):
+        """Rows a query can match: one household's when it filters on household_id, like an index would."""
+        household = query.get("household_id") or ""
+        if not household.startswith("eq."):
+            return self.tables.get(table, [])
+        index = self._by_household.get(table)
+        if index is None:
+            index = self._by_household[table] = {}
+            for row in self.tables.get(table, []):
+                index.setdefault(str(row.get("household_id")), []).append(row)
+        return index.get(household[3:], [])
+
+    def select(self, table, query, range_header=None):
+        """(rows of the requested page, number of rows matching the filters)."""
+        rows = list(filter(_compile(query), self._candidates(table, query)))
+        for key in reversed((query.get("order") or "").split(",")):
+            if key:
+                column, _, direction = key.partition(".")
+                rows.sort(key=lambda row: (row.get(column) is None, str(row.get(column))),
+                          reverse=direction.startswith("desc"))
+        total = len(rows)
+        offset = int(query.get("offset") or 0)
+        limit = int(query["limit"]) if query.get("limit") else None
+        if range_header:
+            # Range: first-last, both inclusive
+            first, _, last = range_header.partition("-")
+            offset += int(first)
+            count = int(last) - int(first) + 1 if last else None
+            limit = count if limit is None or count is None else min(limit, count)
+        rows = rows[offset:offset + max(limit, 0)] if limit is not None else rows[offset:]
+        return [self._project(row, query.get("select")) for row in rows], total
+
+    def insert(self, table, body, query):
+        rows = []
+        for values in body if isinstance(body, list) else [body]:
+            row = {column: None for column in TABLE_COLUMNS.get(table, ())}
+            row.update(id=str(uuid.uuid4()), created_at=now_iso())
+            row.update(values)
+            rows.append(row)
+        self.tables.setdefault(table, []).extend(rows)
+        self._by_household.pop(table, None)
+        return [self._project(row, query.get("select")) for row in rows]
+
+    def update(self, table, body, query):
+        rows = list(filter(_compile(query), self._candidates(table, query)))
+        for row in rows:
+            row.update(body)
+        self._by_household.pop(table, None)
+        return [self._project(row, query.get("select")) for row in rows]
+
+    def delete(self, table, query):
+        rows = self.tables.get(table, [])
+        match = _compile(query)
+        gone = [row for row in rows if match(row)]
+        self.tables[table] = [row for row in rows if not match(row)]
+        self._by_household.pop(table, None)
+        return gone
+
+    @staticmethod
+    def _project(row, select):
+        if not select or select.strip() == "*":
+            return dict(row)
+        return {column: row.get(column) for column in (c.strip() for c in select.split(","))}
+
+    def _handler_class(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without this each response waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length and hasattr(socket, "TCP_QUICKACK"):
+                    # httpx sends the body after the headers; ACK them now rather than after the
+                    # delayed-ACK timeout the client's Nagle algorithm waits for (~40 ms a request)
+                    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+                raw = self.rfile.read(length) if length else b""
+                if not raw:
+                    return {}
+                if "json" in (self.headers.get("Content-Type") or "json"):
+                    return json.loads(raw)
+                return dict(parse_qsl(raw.decode()))
+
+            def _reply(self, status, payload, headers=()):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, verb):
+                if backend.latency:
+                    time.sleep(backend.latency)
+                parts = urlsplit(self.path)
+                query = dict(parse_qsl(parts.query, keep_blank_values=True))
+                body = self._body()
+                if parts.path.startswith("/bot"):
+                    with backend._cond:
+                        backend.calls["telegram"] += 1
+                    method = parts.path.rsplit("/", 1)[1]
+                    self._reply(200, {"ok": True, "result": backend.telegram(method, dict(query, **body))})
+                    return
+                path = parts.path[len("/rest/v1/"):].strip("/")
+                headers = []
+                with backend._cond:
+                    started = time.perf_counter()
+                    backend.calls["postgrest"] += 1
+                    if not path:
+                        status, payload = 200, backend.openapi()
+                    elif path.startswith("rpc/"):
+                        status, payload = 404, {"code": "PGRST202", "message": f"Could not find the function {path[4:]}"}
+                    elif verb == "GET":
+                        status = 200
+                        payload, total = backend.select(path, query, self.headers.get("Range"))
+                        if "count=exact" in (self.headers.get("Prefer") or ""):
+                            headers.append(("Content-Range", f"0-{max(len(payload) - 1, 0)}/{total}"))
+                    elif verb == "POST":
+                        status, payload = 201, backend.insert(path, body, query)
+                    elif verb == "PATCH":
+                        status, payload = 200, backend.update(path, body, query)
+                    else:
+                        status, payload = 200, backend.delete(path, query)
+                    backend.busy += time.perf_counter() - started
+                self._reply(status, payload, headers)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+        return Handler
+
+class FakeTMDB:
+    """Fake TMDB API and image host; `latency` seconds are added to every request.
+
+    Every search query and list gets its own stable run of movie ids over
+    `total_pages` pages, and details by id agree with the list entries.
+    """
+
+    def __init__(self, latency=0.0, total_pages=5, page_size=20, poster_bytes=4096):
+        self.latency = latency
+        self.total_pages = total_pages
+        self.page_size = page_size
+        self.poster = b"\xff\xd8" + bytes(poster_bytes - 2)
+        self.calls = {"api": 0, "image": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def api_url(self):
+        return f"{self.url}/3"
+
+    @property
+    def image_url(self):
+        return f"{self.url}/t/p"
+
+    def env(self):
+        return {"TMDB_API_KEY": "bench", "TMDB_API_URL": self.api_url, "TMDB_IMAGE_BASE_URL": self.image_url}
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-tmdb", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def movie(tmdb_id):
+        return {
+            "id": tmdb_id,
+            "title": f"Bench Movie {tmdb_id}",
+            "overview": f"Movie {tmdb_id} of the benchmark catalogue. " * 4,
+            "release_date": f"{1970 + tmdb_id % 55}-0{1 + tmdb_id % 9}-15",
+            "vote_average": round(5 + tmdb_id % 50 / 10, 1),
+            "poster_path": f"/{tmdb_id}.jpg",
+        }
+
+    def results(self, key, page):
+        first = (zlib.crc32(key.encode()) % 100000) * 1000 + (page - 1) * self.page_size + 1
+        return {
+            "page": page,
+            "results": [self.movie(tmdb_id) for tmdb_id in range(first, first + self.page_size)],
+            "total_pages": self.total_pages,
+            "total_results": self.total_pages * self.page_size,
+        }
+
+    def api(self, endpoint, params):
+        """(status, payload) for GET /3/<endpoint>."""
+        page = int(params.get("page") or 1)
+        if endpoint == "search/movie":
+            return 200, self.results(f"search:{params.get('query', '')}", page)
+        if endpoint in ("movie/popular", "movie/top_rated"):
+            return 200, self.results(endpoint, page)
+        if endpoint.startswith("movie/") and endpoint[6:].isdigit():
+            return 200, self.movie(int(endpoint[6:]))
+        if endpoint == "configuration":
+            return 200, {"images": {"base_url": self.image_url}}
+        return 404, {"status_code": 34, "status_message": "The resource you requested could not be found."}
+
+    def _handler_class(self):
+        tmdb = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; without this each response waits for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, data, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if tmdb.latency:
+                    time.sleep(tmdb.latency)
+                parts = urlsplit(self.path)
+                if parts.path.startswith("/t/p/"):
+                    with tmdb._lock:
+                        tmdb.calls["image"] += 1
+                    self._reply(200, tmdb.poster, "image/jpeg")
+                    return
+                with tmdb._lock:
+                    tmdb.calls["api"] += 1
+                status, payload = tmdb.api(parts.path[len("/3/"):], dict(parse_qsl(parts.query)))
+                self._reply(status, json.dumps(payload).encode(), "application/json")
+
+        return Handler
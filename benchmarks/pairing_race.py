@@ -0,0 +1,91 @@
+"""Concurrency check and timing for the pairing procedures (sql/004_pairing_procedures.sql).
+
+Needs the local stand-in from sql/local/docker-compose.yml:
+
+    docker compose -f sql/local/docker-compose.yml up -d
+    python -m benchmarks.pairing_race [--joiners 20] [--rounds 10]
+
+Every round, N fresh users redeem one invite code at the same moment. Exactly one
+must end up paired, and the inviter and joiner must point at each other and share a
+household. Then everyone leaves at once and nobody may keep a partner.
+"""
+import os
+import time
+import uuid
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+POSTGREST_URL = os.getenv("POSTGREST_URL", "http://localhost:3000")
+
+session = requests.Session()
+
+def rpc(function, **params):
+    r = session.post(f"{POSTGREST_URL}/rpc/{function}", json=params, timeout=10)
+    r.raise_for_status()
+    return r.json()[0]
+
+def create_user(chat_id, invite_code=None):
+    r = session.post(
+        f"{POSTGREST_URL}/users", json={"chat_id": chat_id, "invite_code": invite_code},
+        headers={"Prefer": "return=representation"}, timeout=10,
+    )
+    r.raise_for_status()
+    return r.json()[0]
+
+def get_user(user_id):
+    r = session.get(f"{POSTGREST_URL}/users", params={"id": f"eq.{user_id}", "select": "*"}, timeout=10)
+    r.raise_for_status()
+    return r.json()[0]
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+def race_round(pool, joiners):
+    tag = uuid.uuid4().hex[:8]
+    code = f"INV-{tag}"
+    inviter = create_user(f"race-{tag}-inviter", code)
+    chat_ids = [f"race-{tag}-{i}" for i in range(joiners)]
+    for chat_id in chat_ids:
+        create_user(chat_id)
+
+    results = list(pool.map(lambda c: timed(rpc, "redeem_invite", p_chat_id=c, p_invite_code=code), chat_ids))
+    statuses = [r["status"] for r, _ in results]
+    assert statuses.count("paired") == 1, f"expected exactly one pairing, got {statuses}"
+    winner = next(r for r, _ in results if r["status"] == "paired")
+    inviter = get_user(inviter["id"])
+    joiner = get_user(winner["user_id"])
+    assert inviter["partner_id"] == joiner["id"] and joiner["partner_id"] == inviter["id"], "half-paired users"
+    assert inviter["household_id"] == joiner["household_id"] == winner["household_id"], "households differ"
+    assert inviter["invite_code"] is None, "invite code was not consumed"
+
+    leaves = list(pool.map(lambda c: timed(rpc, "leave_household", p_chat_id=c), [inviter["chat_id"], joiner["chat_id"]]))
+    inviter = get_user(inviter["id"])
+    joiner = get_user(joiner["id"])
+    assert inviter["partner_id"] is None and joiner["partner_id"] is None, "partner left behind after unlink"
+    assert inviter["household_id"] != joiner["household_id"], "still sharing a household after unlink"
+    return [ms for _, ms in results], [ms for _, ms in leaves]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--joiners", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    redeem_ms, leave_ms = [], []
+    with ThreadPoolExecutor(max_workers=args.joiners) as pool:
+        for _ in range(args.rounds):
+            redeem, leave = race_round(pool, args.joiners)
+            redeem_ms += redeem
+            leave_ms += leave
+    print(f"{args.rounds} rounds x {args.joiners} concurrent joiners: exactly one pairing each time")
+    for name, samples in (("redeem_invite", redeem_ms), ("leave_household", leave_ms)):
+        samples.sort()
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print(f"{name:>16}: 1 round trip, p50 {statistics.median(samples):.1f} ms, p99 {p99:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,24 @@
+import time
+STARTED_AT = time.monotonic()
+
 import os
+import signal
+import argparse
 import logging
+import importlib
+import threading
+from functools import wraps
 from dotenv import load_dotenv
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackQueryHandler
-from handlers.menu import start, menu_handler
-from handlers.partner import invite, join, partner_status, unlink
-from handlers.movies import add_movie, list_movies, random_movie
-from handlers.callbacks import button_handler
+from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackQueryHandler, InlineQueryHandler
+from telegram.utils.request import Request
+import db
+import repository
+import sessions
+import schema
+import outbound
+import metrics
+from scheduler import ChatScheduler, SCHEDULER_WORKERS
+from webhook import WebhookServer
 
 # Load environment variables
 load_dotenv()
@@ -22,29 +35,289 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def main():
-    """Start the bot."""
-    # Create the Updater
-    updater = Updater(os.getenv('TELEGRAM_BOT_TOKEN'))
-    dp = updater.dispatcher
+def parse_args():
+    parser = argparse.ArgumentParser(description="MovieMateBot")
+    parser.add_argument(
+        "--async", dest="use_async", action="store_true",
+        default=os.getenv("BOT_ASYNC", "").lower() in ("1", "true", "yes"),
+        help="run handlers as coroutines on an asyncio loop (or set BOT_ASYNC=1)"
+    )
+    parser.add_argument(
+        "--mode", choices=["polling", "webhook"], default=os.getenv("BOT_MODE", "polling"),
+        help="how updates reach the bot (or set BOT_MODE)"
+    )
+    parser.add_argument(
+        "--fast-start", dest="fast_start", action="store_true",
+        default=os.getenv("BOT_FAST_START", "").lower() in ("1", "true", "yes"),
+        help="start polling before loading handlers and schema, warm them up in the background (or set BOT_FAST_START=1)"
+    )
+    return parser.parse_args()
+
+def env_flag(name):
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+def allowed_updates():
+    """ALLOWED_UPDATES=message,callback_query -> list, unset -> Telegram's default."""
+    value = os.getenv("ALLOWED_UPDATES")
+    return [u.strip() for u in value.split(",") if u.strip()] if value else None
+
+# --- Handlers and start-up ---
+# Handlers are named "module:function" so a fast start can register them
+# without importing their modules; the warm-up thread (or the first update)
+# imports them. Modules loaded here also register their menu and callback routes.
+WARM_UP_MODULES = ("handlers.menu", "handlers.callbacks", "handlers.inline")
+
+def load_handler(path):
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+def lazy_handler(path):
+    """A stand-in for a handler that imports its module on the first call."""
+    target = None
+
+    def handler(update, context):
+        nonlocal target
+        if target is None:
+            target = load_handler(path)
+        return target(update, context)
+    handler.__name__ = handler.__qualname__ = path.split(":")[1]
+    return handler
+
+_first_update = threading.Event()
+
+def first_update(handler):
+    """Log how long after start the first update was handled."""
+    @wraps(handler)
+    def callback(update, context):
+        try:
+            return handler(update, context)
+        finally:
+            if not _first_update.is_set():
+                _first_update.set()
+                logger.info(f"First update handled {time.monotonic() - STARTED_AT:.2f}s after start")
+    return callback
+
+def register_threaded_handlers(dp, scheduler, fast_start=False):
+    # Every handler goes through the per-chat scheduler: chats run in parallel,
+    # each chat's updates stay in order. Each update is one repository unit of work.
+    def wrap(path):
+        handler = lazy_handler(path) if fast_start else load_handler(path)
+        return scheduler.wrap(repository.per_update(first_update(handler)))
 
     # Command handlers
-    dp.add_handler(CommandHandler("start", start))
-    dp.add_handler(CommandHandler("invite", invite))
-    dp.add_handler(CommandHandler("join", join))
-    dp.add_handler(CommandHandler("add", add_movie))
-    dp.add_handler(CommandHandler("list", list_movies))
-    dp.add_handler(CommandHandler("random", random_movie))
-    dp.add_handler(CommandHandler("partner_status", partner_status))
-    dp.add_handler(CommandHandler("unlink", unlink))
+    dp.add_handler(CommandHandler("start", wrap("handlers.menu:start")))
+    dp.add_handler(CommandHandler("invite", wrap("handlers.partner:invite")))
+    dp.add_handler(CommandHandler("join", wrap("handlers.partner:join")))
+    dp.add_handler(CommandHandler("add", wrap("handlers.movies:add_movie")))
+    dp.add_handler(CommandHandler("list", wrap("handlers.movies:list_movies")))
+    dp.add_handler(CommandHandler("random", wrap("handlers.movies:random_movie")))
+    dp.add_handler(CommandHandler("partner_status", wrap("handlers.partner:partner_status")))
+    dp.add_handler(CommandHandler("unlink", wrap("handlers.partner:unlink")))
     
     # Message & callback handlers
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, menu_handler))
-    dp.add_handler(CallbackQueryHandler(button_handler))
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, wrap("handlers.menu:menu_handler")))
+    dp.add_handler(CallbackQueryHandler(wrap("handlers.callbacks:button_handler")))
+    dp.add_handler(InlineQueryHandler(wrap("handlers.inline:inline_query")))
+
+def warm_up(fast_start):
+    """Pay deferred start-up costs once updates are already being accepted."""
+    import tmdb_client
+    import poster_cache
+    timings = {}
+
+    def step(name, work):
+        started = time.monotonic()
+        try:
+            work()
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {e}")
+        timings[name] = (time.monotonic() - started) * 1000
+
+    step("handlers", lambda: [importlib.import_module(module) for module in WARM_UP_MODULES])
+    # Build the Supabase client and open its connection with a one-row read
+    step("supabase", lambda: db.supabase.table("users").select("id").limit(1).execute())
+    if fast_start:
+        step("schema", lambda: schema.columns("movies"))
+    step("posters", lambda: poster_cache.lookup(0))
+    step("tmdb", tmdb_client.warm)
+    logger.info("Warm-up done in " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in timings.items())
+                + f"; {time.monotonic() - STARTED_AT:.2f}s after start")
+
+def start_warm_up(fast_start):
+    threading.Thread(target=warm_up, args=(fast_start,), name="warm-up", daemon=True).start()
 
-    # Start the Bot
-    updater.start_polling()
+def log_scheduler_stats(scheduler):
+    def job(context):
+        import poster_cache
+        import catalogue
+        import inline_search
+        stats = scheduler.stats()
+        logger.info(
+            f"Scheduler: queue_depth={stats['queue_depth']} running={stats['running']}/{stats['workers']} "
+            f"active_chats={stats['active_chats']} avg_wait_ms={stats['avg_wait_ms']:.1f} "
+            f"top_backlogs={stats['top_chat_backlogs']}"
+        )
+        sends = outbound.limiter.stats()
+        logger.info(
+            f"Outbound: queue_depth={sends['queue_depth']} (background {sends['queued_background']}) "
+            f"sent={sends['sent']} throttled={sends['throttled']} avg_wait_ms={sends['avg_wait_ms']:.0f} "
+            f"p99_wait_ms={sends['p99_wait_ms']:.0f} retry_after={sends['retry_after']} timeouts={sends['timeouts']}"
+        )
+        data = repository.stats()
+        logger.info(
+            f"Repository: {data['round_trips_per_update']:.2f} round trips/update over {data['units']} updates, "
+            f"{data['memo_hits']} memoised reads, {data['batched_rows']} batched rows"
+        )
+        posters = poster_cache.stats()
+        logger.info(
+            f"Poster cache: hit_ratio={posters['hit_ratio']:.2f} ({posters['hits']}/{posters['hits'] + posters['misses']}) "
+            f"avg_hit_ms={posters['avg_hit_ms']:.0f} avg_miss_ms={posters['avg_miss_ms']:.0f} "
+            f"saved_s={posters['saved_ms'] / 1000:.1f} stale_ids={posters['stale_ids']}"
+        )
+        searches = catalogue.stats()
+        logger.info(
+            f"Catalogue: {searches['hits']}/{searches['searches']} searches answered locally, "
+            f"avg_ms={searches['avg_ms']:.2f}"
+        )
+        inline = inline_search.stats()
+        logger.info(
+            f"Inline: {inline['answered']}/{inline['queries']} queries answered, superseded={inline['superseded']} "
+            f"cache_hits={inline['cache_hits'] + inline['prefix_hits']} tmdb_searches={inline['tmdb_searches']} "
+            f"p50_ms={inline['p50_ms']:.0f} p99_ms={inline['p99_ms']:.0f}"
+        )
+    return job
+
+def register_async_handlers(dp, runtime):
+    import asyncio
+    from handlers import async_handlers as aio
+    from handlers.menu import start
+    from handlers.partner import invite, join, unlink
+    from handlers.movies import add_movie
+    from handlers.callbacks import button_handler
+    from handlers.inline import inline_query
+
+    def wrap(handler):
+        # Threaded handlers still get a unit of work on the runtime executor
+        if not asyncio.iscoroutinefunction(handler):
+            handler = repository.per_update(handler)
+        return runtime.handler(handler)
+
+    dp.add_handler(CommandHandler("start", wrap(start)))
+    dp.add_handler(CommandHandler("invite", wrap(invite)))
+    dp.add_handler(CommandHandler("join", wrap(join)))
+    dp.add_handler(CommandHandler("add", wrap(add_movie)))
+    dp.add_handler(CommandHandler("list", wrap(aio.list_movies)))
+    dp.add_handler(CommandHandler("random", wrap(aio.random_movie)))
+    dp.add_handler(CommandHandler("partner_status", wrap(aio.partner_status)))
+    dp.add_handler(CommandHandler("unlink", wrap(unlink)))
+
+    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, wrap(aio.menu_handler)))
+    dp.add_handler(CallbackQueryHandler(wrap(button_handler)))
+    dp.add_handler(InlineQueryHandler(wrap(inline_query)))
+
+def run_polling(updater, fast_start=False):
+    """Long-poll getUpdates; PORT, if set, still gets a health endpoint."""
+    server = None
+    if os.getenv("PORT"):
+        server = WebhookServer("0.0.0.0", int(os.getenv("PORT")))
+        server.start()
+    updater.start_polling(
+        poll_interval=float(os.getenv("POLL_INTERVAL", "0")),
+        timeout=int(os.getenv("POLL_TIMEOUT", "30")),
+        drop_pending_updates=env_flag("DROP_PENDING_UPDATES"),
+        allowed_updates=allowed_updates(),
+    )
+    start_warm_up(fast_start)
     updater.idle()
+    if server:
+        server.stop()
+
+def run_webhook(updater, fast_start=False):
+    """Serve Telegram webhooks from the built-in HTTP server."""
+    bot = updater.bot
+    dp = updater.dispatcher
+    path = os.getenv("WEBHOOK_PATH", "/telegram")
+    secret = os.getenv("WEBHOOK_SECRET")
+    if not secret:
+        logger.warning("WEBHOOK_SECRET is not set, webhook calls are not authenticated")
+    server = WebhookServer(
+        os.getenv("WEBHOOK_LISTEN", "0.0.0.0"), int(os.getenv("PORT", "8080")),
+        bot=bot, update_queue=updater.update_queue, webhook_path=path, secret=secret
+    )
+
+    # Start the dispatcher and job queue the way start_polling() would
+    threading.Thread(target=dp.start, name="dispatcher", daemon=True).start()
+    updater.job_queue.start()
+    server.start()
+
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        bot.set_webhook(
+            url=webhook_url.rstrip("/") + path,
+            allowed_updates=allowed_updates(),
+            drop_pending_updates=env_flag("DROP_PENDING_UPDATES"),
+            api_kwargs={"secret_token": secret} if secret else None,
+        )
+        logger.info(f"Webhook registered at {webhook_url.rstrip('/')}{path}")
+    start_warm_up(fast_start)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    while not stop.wait(1):
+        pass
+    server.stop()
+    updater.job_queue.stop()
+    dp.stop()
+
+def main():
+    """Start the bot."""
+    args = parse_args()
+    token = os.getenv('TELEGRAM_BOT_TOKEN')
+    # Create the Updater (TELEGRAM_API_BASE_URL points it at a local Bot API, e.g. a fake in tests).
+    # Its bot sends through the outbound rate limiter; every scheduler worker may be mid-call.
+    bot = outbound.RateLimitedBot(
+        token,
+        base_url=os.getenv("TELEGRAM_API_BASE_URL"),
+        base_file_url=os.getenv("TELEGRAM_API_FILE_URL"),
+        request=Request(con_pool_size=SCHEDULER_WORKERS + 4),
+    )
+    updater = Updater(bot=bot)
+    dp = updater.dispatcher
+    session_store = sessions.install(dp, updater.job_queue)
+    metrics_server = metrics.serve()
+    # The Supabase client and which optional columns writers and list views may
+    # use (a fast start builds and reads them in the warm-up, or on first use)
+    if not args.fast_start:
+        db.supabase.get()
+        schema.refresh()
+
+    runtime = None
+    scheduler = None
+    if args.use_async:
+        from async_runtime import start_runtime
+        runtime = start_runtime(token)
+        register_async_handlers(dp, runtime)
+        logger.info("Handlers run in asyncio mode")
+    else:
+        scheduler = ChatScheduler()
+        register_threaded_handlers(dp, scheduler, fast_start=args.fast_start)
+        stats_interval = int(os.getenv("SCHEDULER_STATS_INTERVAL", "0"))
+        if stats_interval > 0:
+            updater.job_queue.run_repeating(log_scheduler_stats(scheduler), interval=stats_interval)
+
+    # Start the Bot, then warm up what was deferred
+    if args.mode == "webhook":
+        run_webhook(updater, args.fast_start)
+    else:
+        run_polling(updater, args.fast_start)
+    if runtime:
+        runtime.stop()
+    if scheduler:
+        scheduler.shutdown()
+    session_store.close()
+    if metrics_server:
+        metrics_server.shutdown()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,193 @@
+import io
+import os
+import re
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+# --- Local TMDB title catalogue ---
+# TMDB publishes a daily gzipped JSON-lines export of every movie id with its
+# original title and popularity. `python -m catalogue` streams it into a SQLite
+# file with an FTS5 index (word and prefix search over titles). tmdb_search asks
+# this index first and goes to TMDB live only for the details of the results,
+# so searching keeps working while TMDB is down. Titles in the export are the
+# original ones, and a word match somewhere in a title is almost always found:
+# unless a title starts with what was typed, the bot still searches TMDB live.
+CATALOGUE_DB = os.getenv("CATALOGUE_DB", "catalogue.db")
+CATALOGUE_RESULTS = int(os.getenv("CATALOGUE_RESULTS", "20"))
+TMDB_EXPORT_URL = "http://files.tmdb.org/p/exports/movie_ids_{date}.json.gz"
+INGEST_BATCH = 5000
+
+_conn = None
+_mtime = None
+_lock = threading.Lock()
+_stats = {"searches": 0, "hits": 0, "seconds": 0.0}
+
+# --- Ingest ---
+def export_url(day=None):
+    """URL of TMDB's movie id export for day (default: yesterday, UTC, which is always published)."""
+    day = day or (datetime.now(timezone.utc) - timedelta(days=1)).date()
+    return TMDB_EXPORT_URL.format(date=day.strftime("%m_%d_%Y"))
+
+def _open_export(source):
+    """The raw bytes of the export at a URL or a local path, read incrementally."""
+    if re.match(r"https?://", source):
+        return urllib.request.urlopen(source, timeout=30)
+    return open(source, "rb")
+
+def _rows(lines):
+    """(id, title, popularity) for every usable line of the export."""
+    for line in lines:
+        try:
+            movie = json.loads(line)
+        except ValueError:
+            continue
+        title = (movie.get("original_title") or "").strip()
+        if not title or movie.get("adult") or "id" not in movie:
+            continue
+        yield movie["id"], title, float(movie.get("popularity") or 0)
+
+def ingest(source, path=CATALOGUE_DB):
+    """Build a fresh catalogue from an export into path. Returns the number of movies indexed.
+
+    Lines are inserted in batches of INGEST_BATCH into a temporary table, so memory
+    stays flat whatever the size of the export. Movies are then numbered by
+    popularity (SQLite sorts on disk) and that number is the full-text rowid, so a
+    search reads matches most popular first and stops at its limit without sorting.
+    The new file replaces the old one only once it is complete.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TEMP TABLE export (id INTEGER PRIMARY KEY, title TEXT NOT NULL, popularity REAL NOT NULL)")
+    with _open_export(source) as raw:
+        stream = gzip.GzipFile(fileobj=raw) if source.endswith(".gz") else raw
+        rows = _rows(io.TextIOWrapper(stream, encoding="utf-8"))
+        while True:
+            batch = list(islice(rows, INGEST_BATCH))
+            if not batch:
+                break
+            conn.executemany("INSERT OR REPLACE INTO export (id, title, popularity) VALUES (?, ?, ?)", batch)
+
+    conn.execute(
+        "CREATE TABLE movies (rank INTEGER PRIMARY KEY, id INTEGER NOT NULL, title TEXT NOT NULL, popularity REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO movies (id, title, popularity) SELECT id, title, popularity FROM export ORDER BY popularity DESC, id")
+    conn.execute("DROP TABLE export")
+    conn.execute("CREATE INDEX movies_title ON movies (title COLLATE NOCASE)")
+    conn.execute(
+        "CREATE VIRTUAL TABLE titles USING fts5(title, content='movies', content_rowid='rank', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    # Build the full-text index in one pass over the finished table
+    conn.execute("INSERT INTO titles(titles) VALUES ('rebuild')")
+    conn.execute("INSERT INTO titles(titles) VALUES ('optimize')")
+    count = conn.execute("SELECT count(*) FROM movies").fetchone()[0]
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, path)
+    return count
+
+# --- Search ---
+def _connection():
+    """Read-only connection to the catalogue, reopened after an ingest replaced the file. Caller must hold _lock."""
+    global _conn, _mtime
+    try:
+        mtime = os.stat(CATALOGUE_DB).st_mtime
+    except OSError:
+        mtime = None
+    if mtime != _mtime:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+        _mtime = mtime
+        if mtime is not None:
+            try:
+                _conn = sqlite3.connect(f"file:{CATALOGUE_DB}?mode=ro", uri=True, check_same_thread=False)
+                logging.info(f"TMDB catalogue opened: {CATALOGUE_DB}")
+            except sqlite3.Error as e:
+                logging.warning(f"TMDB catalogue unavailable: {e}")
+    return _conn
+
+def words(text):
+    return re.findall(r"\w+", text.lower())
+
+def match_expression(query):
+    """FTS5 query matching every word of query, the last one as a prefix."""
+    query_words = words(query)
+    if not query_words:
+        return None
+    terms = [f'"{word}"' for word in query_words[:-1]] + [f'"{query_words[-1]}"*']
+    return " ".join(terms)
+
+def strong_match(query, title):
+    """True if title starts with the words of query (the last one as a prefix), e.g. 'star wa' and 'Star Wars'."""
+    query_words, title_words = words(query), words(title)
+    if not query_words or len(title_words) < len(query_words):
+        return False
+    *whole, last = query_words
+    return title_words[:len(whole)] == whole and title_words[len(whole)].startswith(last)
+
+def search(query, limit=CATALOGUE_RESULTS):
+    """TMDB ids whose title matches query, exact titles first, then by popularity. Empty if nothing matched or there is no catalogue."""
+    return [tmdb_id for tmdb_id, _ in search_titles(query, limit)]
+
+def search_titles(query, limit=CATALOGUE_RESULTS):
+    """Like search(), as (tmdb_id, original title) pairs."""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    started = time.perf_counter()
+    with _lock:
+        conn = _connection()
+        if conn is None:
+            return []
+        try:
+            exact = conn.execute(
+                "SELECT id, title FROM movies WHERE title = ? COLLATE NOCASE ORDER BY rank LIMIT ?", (query.strip(), limit)
+            ).fetchall()
+            # rowid order is popularity order, so the first matches are the best ones
+            matches = conn.execute(
+                "SELECT movies.id, movies.title FROM titles JOIN movies ON movies.rank = titles.rowid "
+                "WHERE titles MATCH ? ORDER BY titles.rowid LIMIT ?",
+                (expression, limit),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"TMDB catalogue search failed: {e}")
+            return []
+        found = list(dict.fromkeys(exact + matches))[:limit]
+        _stats["searches"] += 1
+        _stats["hits"] += bool(found)
+        _stats["seconds"] += time.perf_counter() - started
+    return found
+
+def stats():
+    with _lock:
+        stats = dict(_stats)
+    stats["avg_ms"] = stats["seconds"] * 1000 / stats["searches"] if stats["searches"] else 0.0
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local TMDB title catalogue from a daily export.")
+    parser.add_argument("source", nargs="?", help="export URL or .json(.gz) file (default: yesterday's TMDB export)")
+    parser.add_argument("--db", default=CATALOGUE_DB, help=f"catalogue file (default: {CATALOGUE_DB})")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    source = args.source or export_url()
+    started = time.monotonic()
+    count = ingest(source, args.db)
+    logging.info(f"Indexed {count} movies from {source} into {args.db} in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
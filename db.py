@@ -1,18 +1,385 @@
 import os
-import uuid
 import random
 import logging
+import threading
+import contextvars
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from cachetools import TTLCache, LRUCache
+from collections import deque
+import metrics
 
 # --- Supabase DB helpers ---
 load_dotenv(override=True)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+class LazyClient:
+    """Stands in for the Supabase client and builds it on first use.
+
+    Importing supabase and building the client takes a good part of a cold start;
+    this way it happens in the background warm-up (or on the first query) instead.
+    """
+
+    def __init__(self, url, key):
+        self._url = url
+        self._key = key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    client = create_client(self._url, self._key)
+                    metrics.instrument_httpx(client.postgrest.session, "supabase")
+                    self._client = client
+        return self._client
+
+    @property
+    def ready(self):
+        return self._client is not None
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+supabase = LazyClient(SUPABASE_URL, SUPABASE_KEY)
+
+# The unit of work of the update being handled (see repository.unit_of_work); every
+# query in the bot runs through execute() so its round trips are counted there.
+current_unit = contextvars.ContextVar("unit_of_work", default=None)
+
+def execute(query):
+    """Send a built supabase query and return the response, counted in the open unit of work."""
+    uow = current_unit.get()
+    if uow is not None:
+        uow.round_trips += 1
+    return query.execute()
 
 def get_user_by_chat_id(chat_id):
-    return supabase.table("users").select("*").eq("chat_id", str(chat_id)).execute()
+    return execute(supabase.table("users").select("*").eq("chat_id", str(chat_id)))
 
 def insert_user(chat_id):
-    return supabase.table("users").insert({"chat_id": str(chat_id)}).execute()
+    return execute(supabase.table("users").insert({"chat_id": str(chat_id)}))
+
+# --- Identity cache (chat_id -> user id, household, partner) ---
+# Process-wide LRU with a TTL, so every button press doesn't pay a users lookup.
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", "600"))
+
+_identity_cache = TTLCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
+_identity_lock = threading.Lock()
+_identity_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def get_identity(chat_id):
+    """Return the cached identity of a chat: {'id', 'partner_id', 'household_id', 'partner_chat_id', 'partner_name'}.
+
+    Returns None if the chat has no user row yet. Identities are shared between
+    threads, so callers must treat the returned dict as read-only.
+    """
+    key = str(chat_id)
+    identity = get_cached_identity(key)
+    if identity is not None:
+        return identity
+
+    rows = execute(supabase.table("users").select("id, partner_id, household_id").eq("chat_id", key)).data
+    if not rows:
+        return None
+    return cache_identity(key, rows[0])
+
+def get_cached_identity(chat_id):
+    """Return the cached identity of a chat without touching Supabase (None on a miss)."""
+    with _identity_lock:
+        identity = _identity_cache.get(str(chat_id))
+        if identity is not None:
+            _identity_stats["hits"] += 1
+        else:
+            _identity_stats["misses"] += 1
+    return identity
+
+def cache_identity(chat_id, user_row):
+    """Store a freshly read or written users row in the identity cache."""
+    identity = {
+        "id": user_row["id"],
+        "partner_id": user_row.get("partner_id"),
+        "household_id": user_row.get("household_id"),
+        "partner_chat_id": None,
+        "partner_name": None,
+    }
+    with _identity_lock:
+        _identity_cache[str(chat_id)] = identity
+    return identity
+
+def member_ids(identity):
+    """User ids whose movies are shared with this identity (self and partner), for users without a household."""
+    user_ids = [identity["id"]]
+    if identity["partner_id"]:
+        user_ids.append(identity["partner_id"])
+    return user_ids
+
+def scope_movies(query, identity):
+    """Restrict a movies query to the identity's household: one indexed equality filter."""
+    if identity.get("household_id"):
+        return query.eq("household_id", identity["household_id"])
+    return query.in_("user_id", member_ids(identity))
+
+def new_movie_row(identity, title, category):
+    """Row for inserting a movie into the identity's household."""
+    row = {"user_id": identity["id"], "title": title, "category": category}
+    if identity.get("household_id"):
+        row["household_id"] = identity["household_id"]
+    return row
+
+def household_key(identity):
+    """Hashable key of the list an identity sees (used by per-household caches)."""
+    return identity.get("household_id") or tuple(sorted(member_ids(identity)))
+
+def set_partner_display(chat_id, partner_chat_id, partner_name):
+    """Remember the partner's chat id and Telegram display name for a cached identity."""
+    key = str(chat_id)
+    with _identity_lock:
+        identity = _identity_cache.get(key)
+        if identity is not None:
+            _identity_cache[key] = dict(identity, partner_chat_id=partner_chat_id, partner_name=partner_name)
+
+def invalidate_identity(chat_id=None, user_id=None, household_id=None):
+    """Drop cached identities by chat id, user id and/or household (e.g. after pairing changes)."""
+    with _identity_lock:
+        keys = []
+        if chat_id is not None and str(chat_id) in _identity_cache:
+            keys.append(str(chat_id))
+        if user_id is not None:
+            keys.extend(k for k, v in list(_identity_cache.items()) if v["id"] == user_id)
+        if household_id is not None:
+            keys.extend(k for k, v in list(_identity_cache.items()) if v["household_id"] == household_id)
+        for key in keys:
+            _identity_cache.pop(key, None)
+        _identity_stats["invalidations"] += len(keys)
+
+def identity_cache_stats():
+    """Hit/miss counters of the identity cache; every miss is one Supabase round trip."""
+    with _identity_lock:
+        stats = dict(_identity_stats, size=len(_identity_cache))
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / total if total else 0.0
+    return stats
+
+# --- Keyset pagination over a household's movies ---
+# Pages are ordered by (created_at, id) and addressed by the cursors of their first
+# and last rows, so every page costs one indexed range query however long the list is.
+MOVIE_PAGE_COLUMNS = "id, title, category, created_at"
+
+def _or_filter(query, filters):
+    """Add a PostgREST `or=(...)` filter; postgrest-py 0.10 has no or_()."""
+    query.params = query.params.add("or", f"({filters})")
+    return query
+
+def fetch_movies_page(identity, categories=None, after=None, before=None, limit=20, columns=MOVIE_PAGE_COLUMNS):
+    """Return (rows, has_more) for the page after/before a (created_at, id) cursor, oldest first."""
+    query = scope_movies(supabase.table("movies").select(columns), identity)
+    if categories:
+        query = query.in_("category", categories)
+    if after:
+        created_at, movie_id = after
+        query = _or_filter(query, f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt.{movie_id})')
+        query = query.order("created_at,id")
+    elif before:
+        created_at, movie_id = before
+        query = _or_filter(query, f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{movie_id})')
+        query = query.order("created_at.desc,id", desc=True)
+    else:
+        query = query.order("created_at,id")
+    rows = execute(query.limit(limit + 1)).data
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+    return rows, has_more
+
+def remember_page(view, rows, has_prev, has_next):
+    """Store the cursors of the page being shown in a session view dict."""
+    view["first"] = [rows[0]["created_at"], rows[0]["id"]]
+    view["last"] = [rows[-1]["created_at"], rows[-1]["id"]]
+    view["has_prev"] = has_prev
+    view["has_next"] = has_next
+
+def turn_page(view, direction, identity, categories=None, limit=20, columns=MOVIE_PAGE_COLUMNS):
+    """Fetch the page next to the one remembered in view. Returns (rows, has_prev, has_next)."""
+    if direction == "next":
+        rows, has_more = fetch_movies_page(identity, categories, after=view["last"], limit=limit, columns=columns)
+        return rows, True, has_more
+    rows, has_more = fetch_movies_page(identity, categories, before=view["first"], limit=limit, columns=columns)
+    return rows, has_more, True
+
+# --- Random pick ---
+# The pick happens in the database: pick_random_household_movie (sql/007) is one index
+# probe on a random key, so /random costs the same for 10 or 10,000 movies. Without the
+# function it falls back to count + offset, which reads the whole list twice.
+RANDOM_NO_REPEAT = int(os.getenv("RANDOM_NO_REPEAT", "3"))
+RANDOM_FAVOUR_OLDER = os.getenv("RANDOM_FAVOUR_OLDER", "").lower() in ("1", "true", "yes")
+
+_recent_picks = LRUCache(maxsize=IDENTITY_CACHE_SIZE)  # household key -> deque of movie ids
+_recent_lock = threading.Lock()
+_random_rpc_available = True
+
+def pick_random_movie(identity, categories, favour_older=False, columns="id, title, category"):
+    """Return one random movie of the household in the given categories, or None.
+
+    The household's last RANDOM_NO_REPEAT picks are skipped unless nothing else is left.
+    """
+    global _random_rpc_available
+    key = household_key(identity)
+    exclude = recent_random_picks(key)
+
+    movie = None
+    if _random_rpc_available and identity.get("household_id"):
+        try:
+            rows = execute(supabase.rpc("pick_random_household_movie", {
+                "p_household_id": identity["household_id"],
+                "p_categories": list(categories),
+                "p_exclude": exclude,
+                "p_favour_older": favour_older,
+            })).data
+            movie = rows[0] if rows else None
+        except Exception as e:
+            if not _missing_function(e):
+                raise
+            logging.warning(f"pick_random_household_movie RPC unavailable, using count + offset: {e}")
+            _random_rpc_available = False
+    if not _random_rpc_available or not identity.get("household_id"):
+        movie = _pick_by_offset(identity, categories, exclude, favour_older, columns)
+
+    if movie and RANDOM_NO_REPEAT > 0:
+        remember_random_pick(key, movie["id"])
+    return movie
+
+def remember_random_pick(key, movie_id):
+    """Add a pick to the household's no-repeat window."""
+    with _recent_lock:
+        recent = _recent_picks.get(key)
+        if recent is None:
+            recent = _recent_picks[key] = deque(maxlen=RANDOM_NO_REPEAT)
+        recent.append(movie_id)
+
+def recent_random_picks(key):
+    with _recent_lock:
+        return list(_recent_picks.get(key, ()))
+
+def _pick_by_offset(identity, categories, exclude, favour_older, columns):
+    def scoped(query):
+        query = scope_movies(query, identity).in_("category", categories)
+        if exclude:
+            query = query.not_.in_("id", exclude)
+        return query
+
+    count = execute(scoped(supabase.table("movies").select("id", count="exact")).limit(1)).count
+    if not count:
+        return _pick_by_offset(identity, categories, [], favour_older, columns) if exclude else None
+    r = random.random()
+    offset = int(count * (r * r if favour_older else r))
+    # postgrest-py 0.10's range() excludes its end
+    rows = execute(scoped(supabase.table("movies").select(columns)).order("created_at,id").range(offset, offset + 1)).data
+    return rows[0] if rows else None
+
+# --- Pairing ---
+# /join and /unlink are one transactional RPC each (sql/004_pairing_procedures.sql) that
+# locks the rows involved and returns the final state. The table-by-table path below
+# is only used until that migration has run.
+_pairing_rpc_available = True
+
+def _missing_function(error):
+    """True if PostgREST rejected an RPC because the function doesn't exist."""
+    return getattr(error, "code", None) in ("PGRST202", "42883")
+
+def _call_pairing_rpc(function, params):
+    global _pairing_rpc_available
+    if not _pairing_rpc_available:
+        return None
+    try:
+        return execute(supabase.rpc(function, params)).data[0]
+    except Exception as e:
+        if not _missing_function(e):
+            raise
+        logging.warning(f"{function} RPC unavailable, pairing without row locks: {e}")
+        _pairing_rpc_available = False
+        return None
+
+def redeem_invite(chat_id, invite_code):
+    """Join the household of the invite code's owner.
+
+    Returns {'status', 'user_id', 'partner_id', 'household_id', 'previous_household_id',
+    'partner_chat_id'}; status is 'paired', 'invalid_code', 'own_code', 'already_paired'
+    (either side has a partner) or 'unknown_user'.
+    """
+    result = _call_pairing_rpc("redeem_invite", {"p_chat_id": str(chat_id), "p_invite_code": invite_code})
+    if result is None:
+        result = _redeem_invite_unlocked(str(chat_id), invite_code)
+    if result["status"] == "paired":
+        _after_pairing_change(chat_id, result)
+    return result
+
+def leave_household(chat_id):
+    """Leave the current household for a new one of your own, taking your movies along.
+
+    Returns {'status', 'user_id', 'partner_id', 'household_id', 'previous_household_id'};
+    status is 'unlinked', 'not_paired' or 'unknown_user'.
+    """
+    result = _call_pairing_rpc("leave_household", {"p_chat_id": str(chat_id)})
+    if result is None:
+        result = _leave_household_unlocked(str(chat_id))
+    if result["status"] == "unlinked":
+        _after_pairing_change(chat_id, result)
+    return result
+
+def _after_pairing_change(chat_id, result):
+    # Everyone in the old and new household sees a different list now
+    invalidate_identity(user_id=result["partner_id"], household_id=result["previous_household_id"])
+    invalidate_identity(household_id=result["household_id"])
+    cache_identity(chat_id, {
+        "id": result["user_id"],
+        "partner_id": result["partner_id"],
+        "household_id": result["household_id"],
+    })
+
+def _redeem_invite_unlocked(chat_id, invite_code):
+    user = get_identity(chat_id)
+    if user is None:
+        return {"status": "unknown_user", "user_id": None, "partner_id": None, "household_id": None,
+                "previous_household_id": None, "partner_chat_id": None}
+    result = {"user_id": user["id"], "partner_id": user["partner_id"], "household_id": user.get("household_id"),
+              "previous_household_id": None, "partner_chat_id": None}
+    inviter = execute(supabase.table("users").select("id, chat_id, partner_id, household_id").eq("invite_code", invite_code)).data
+    if not inviter:
+        return dict(result, status="invalid_code")
+    inviter = inviter[0]
+    if inviter["id"] == user["id"]:
+        return dict(result, status="own_code")
+    if user["partner_id"] or inviter["partner_id"]:
+        return dict(result, status="already_paired")
+    household_id = inviter.get("household_id")
+    if household_id:
+        execute(supabase.table("movies").update({"household_id": household_id}).eq("user_id", user["id"]))
+        execute(supabase.table("users").update({"partner_id": inviter["id"], "household_id": household_id}).eq("id", user["id"]))
+    else:
+        execute(supabase.table("users").update({"partner_id": inviter["id"]}).eq("id", user["id"]))
+    execute(supabase.table("users").update({"partner_id": user["id"], "invite_code": None}).eq("id", inviter["id"]))
+    return {"status": "paired", "user_id": user["id"], "partner_id": inviter["id"], "household_id": household_id,
+            "previous_household_id": user.get("household_id"), "partner_chat_id": inviter["chat_id"]}
+
+def _leave_household_unlocked(chat_id):
+    user = get_identity(chat_id)
+    if user is None:
+        return {"status": "unknown_user", "user_id": None, "partner_id": None, "household_id": None,
+                "previous_household_id": None}
+    if not user["partner_id"]:
+        return {"status": "not_paired", "user_id": user["id"], "partner_id": None,
+                "household_id": user.get("household_id"), "previous_household_id": None}
+    household_id = None
+    if user.get("household_id"):
+        household_id = execute(supabase.table("households").insert({})).data[0]["id"]
+        execute(supabase.table("movies").update({"household_id": household_id}).eq("user_id", user["id"]))
+    execute(supabase.table("users").update({"partner_id": None, "household_id": household_id}).eq("id", user["id"]))
+    execute(supabase.table("users").update({"partner_id": None}).eq("partner_id", user["id"]))
+    invalidate_identity(user_id=user["partner_id"])
+    return {"status": "unlinked", "user_id": user["id"], "partner_id": None, "household_id": household_id,
+            "previous_household_id": user.get("household_id")}
@@ -1,6 +1,18 @@
-from .movies import *
-from .partner import *
-from .edit_menu import *
-from .tmdb import *
-from .callbacks import *
-from .menu import *
+import importlib
+
+# --- Handler modules ---
+# Submodules are imported where they are used (bot.py loads them in the
+# background on a fast start), not all at once here. `from handlers import start`
+# style imports of handler functions still work: the name is looked up in the
+# submodules on first access.
+HANDLER_MODULES = ("movies", "partner", "edit_menu", "tmdb", "inline", "callbacks", "menu")
+
+def __getattr__(name):
+    if name.startswith("__") or name in HANDLER_MODULES:
+        # Let the import system load submodules itself
+        raise AttributeError(name)
+    for module_name in HANDLER_MODULES:
+        module = importlib.import_module(f"{__name__}.{module_name}")
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
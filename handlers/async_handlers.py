@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import httpx
+from telegram import Update
+from telegram.ext import CallbackContext
+import db
+import async_runtime
+import tmdb_cache
+import repository
+import prefetch
+from async_runtime import in_
+from db import get_cached_identity, cache_identity, member_ids, household_key, set_partner_display
+from tmdb_client import TMDBUnavailable
+from . import menu, movies, partner, tmdb
+
+# --- Coroutine handlers for the asyncio mode ---
+# Hot read paths are native coroutines; everything else falls back to the
+# threaded handler on the runtime executor.
+
+async def get_identity(chat_id):
+    """Async version of db.get_identity sharing the same cache."""
+    identity = get_cached_identity(chat_id)
+    if identity is None:
+        rows = await async_runtime.runtime.db.select("users", "id,partner_id,household_id", chat_id=f"eq.{chat_id}")
+        if not rows:
+            return None
+        identity = cache_identity(chat_id, rows[0])
+    return identity
+
+async def list_movies(update: Update, context: CallbackContext):
+    """List movies in a specific category."""
+    rt = async_runtime.runtime
+    chat_id = str(update.effective_chat.id)
+    if not context.args:
+        await rt.telegram.send_message(chat_id, movies.LIST_USAGE_TEXT, parse_mode='HTML')
+        return
+    category = context.args[0]
+    db_category = 'watched' if category == 'loved' else category
+    if db_category not in ["planned", "watched"]:
+        await rt.telegram.send_message(chat_id, "📝 Category must be 'planned' or 'loved'.")
+        return
+
+    # Resolve the user while Telegram already shows "typing..."
+    user, _ = await asyncio.gather(get_identity(chat_id), rt.telegram.send_chat_action(chat_id))
+    scope = {"household_id": f"eq.{user['household_id']}"} if user.get("household_id") else {"user_id": in_(member_ids(user))}
+    rows = await rt.db.select(
+        "movies", movies.list_columns().replace(" ", ""),
+        category=f"eq.{db_category}", **scope,
+        order="created_at,id", limit=movies.LIST_PAGE_SIZE + 1,
+    )
+    if not rows:
+        await rt.telegram.send_message(chat_id, movies.empty_list_text(category), parse_mode='HTML')
+        return
+    context.user_data['list_view'] = {"category": category}
+    has_more = len(rows) > movies.LIST_PAGE_SIZE
+    chunks, reply_markup = movies.list_page_messages(context, rows[:movies.LIST_PAGE_SIZE], False, has_more)
+    for i, chunk in enumerate(chunks):
+        last = i == len(chunks) - 1
+        await rt.telegram.send_message(chat_id, chunk, parse_mode='HTML', reply_markup=reply_markup if last else None)
+
+async def random_movie(update: Update, context: CallbackContext):
+    """Get a random movie suggestion."""
+    rt = async_runtime.runtime
+    chat_id = str(update.effective_chat.id)
+    categories, shown_category = movies.random_categories(context.args)
+    user, _ = await asyncio.gather(get_identity(chat_id), rt.telegram.send_chat_action(chat_id))
+    if not user.get("household_id"):
+        # Households not migrated yet: the threaded pick knows the per-user fallback
+        movie = await rt.run_sync(db.pick_random_movie, user, categories, movies.favour_older(categories))
+    else:
+        key = household_key(user)
+        try:
+            rows = await rt.db.rpc("pick_random_household_movie", {
+                "p_household_id": user["household_id"],
+                "p_categories": categories,
+                "p_exclude": db.recent_random_picks(key),
+                "p_favour_older": movies.favour_older(categories),
+            })
+            movie = rows[0] if rows else None
+            if movie and db.RANDOM_NO_REPEAT > 0:
+                db.remember_random_pick(key, movie["id"])
+        except httpx.HTTPError as e:
+            logging.warning(f"pick_random_household_movie RPC failed, falling back to the threaded pick: {e}")
+            movie = await rt.run_sync(db.pick_random_movie, user, categories, movies.favour_older(categories))
+    if not movie:
+        await rt.telegram.send_message(chat_id, movies.no_random_text(shown_category), parse_mode='HTML')
+        return
+    await rt.telegram.send_message(chat_id, movies.random_pick_text(movie), parse_mode='HTML')
+
+async def partner_status(update: Update, context: CallbackContext):
+    """Check partner status and show relevant information."""
+    rt = async_runtime.runtime
+    chat_id = str(update.effective_chat.id)
+    user = await get_identity(chat_id)
+    if not user["partner_id"]:
+        await rt.telegram.send_message(chat_id, partner.NOT_PAIRED_TEXT, parse_mode='HTML')
+        return
+    partner_name = user["partner_name"]
+    if not partner_name:
+        rows = await rt.db.select("users", "chat_id", id=f"eq.{user['partner_id']}")
+        partner_chat_id = rows[0]["chat_id"]
+        partner_chat = await rt.telegram.call("getChat", chat_id=partner_chat_id)
+        partner_name = partner_chat.get("first_name") or partner_chat.get("title") or "your friend"
+        set_partner_display(chat_id, partner_chat_id, partner_name)
+    await rt.telegram.send_message(chat_id, partner.paired_text(partner_name), parse_mode='HTML')
+
+async def _load_tmdb(update, context, endpoint, params):
+    """Fetch TMDB results into the session. Returns False (after replying) if there is nothing to show."""
+    rt = async_runtime.runtime
+    chat_id = update.effective_chat.id
+    try:
+        data = await tmdb_cache.get_json_async(endpoint, params)
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable: {e}")
+        await rt.telegram.send_message(chat_id, tmdb.TMDB_UNAVAILABLE_TEXT)
+        return False
+    if not data or not tmdb.start_browsing(context, endpoint, params, data):
+        await rt.telegram.send_message(chat_id, "🔍 No movies found.")
+        return False
+    return True
+
+async def tmdb_search(update: Update, context: CallbackContext):
+    """Search movies through TMDB and display the first result."""
+    query = update.message.text.strip()
+    params = {"query": query, "language": "en-US"}
+    if tmdb.browse_catalogue(context, query) or await _load_tmdb(update, context, "search/movie", params):
+        await async_runtime.runtime.run_sync(tmdb.show_movie_result, update, context)
+
+async def tmdb_popular(update: Update, context: CallbackContext):
+    """Show popular movies from TMDB."""
+    if await _load_tmdb(update, context, "movie/popular", {"language": "en-US"}):
+        await async_runtime.runtime.run_sync(tmdb.show_movie_list, update, context, "🎬 Popular Movies")
+
+async def tmdb_top_rated(update: Update, context: CallbackContext):
+    """Show top rated movies from TMDB."""
+    if await _load_tmdb(update, context, "movie/top_rated", {"language": "en-US"}):
+        await async_runtime.runtime.run_sync(tmdb.show_movie_list, update, context, "⭐ Top Rated Movies")
+
+# Menu buttons served by coroutines: text -> (handler, args)
+ASYNC_MENU = {
+    "📅 Planned": (list_movies, ["planned"]),
+    "❤️ Loved": (list_movies, ["loved"]),
+    "🎲 From Planned": (random_movie, ["planned"]),
+    "🎲 From Loved": (random_movie, ["loved"]),
+    "🎲 From All Lists": (random_movie, ["all"]),
+    "👥 Partner Status": (partner_status, None),
+    "🎬 Popular Movies": (tmdb_popular, None),
+    "⭐ Top Rated": (tmdb_top_rated, None),
+}
+
+async def menu_handler(update: Update, context: CallbackContext):
+    """Handle menu interactions, falling back to the threaded menu for everything else."""
+    user_data = context.user_data
+    text = update.message.text
+    prefetch.cancel(update.effective_user.id)
+    if user_data.get('awaiting_new_title') or user_data.get('awaiting_movie_title'):
+        pass
+    elif user_data.get('awaiting_tmdb_search'):
+        user_data.pop('awaiting_tmdb_search', None)
+        return await tmdb_search(update, context)
+    elif text in ASYNC_MENU:
+        handler, args = ASYNC_MENU[text]
+        if args is not None:
+            context.args = args
+        return await handler(update, context)
+    await async_runtime.runtime.run_sync(repository.per_update(menu.menu_handler), update, context)
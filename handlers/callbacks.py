@@ -1,69 +1,38 @@
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.ext import CallbackContext
-from db import supabase
-from handlers.tmdb import (
-    show_movie_result, handle_tmdb_next, handle_tmdb_prev,
-    handle_view_movie, handle_back_to_list, handle_show_full_description,
-    handle_back_to_movie, handle_tmdb_category_selection, handle_add_to_list
-)
-from handlers.edit_menu import (
-    handle_edit_request, handle_category_edit_request,
-    handle_category_change, handle_delete_request, handle_delete_confirmation,
-    choose_edit_delete_handler, edit_list_menu
-)
+import repository
+import prefetch
+from db import get_identity
+from keyboards import main_menu_keyboard
+from router import callback_router
+# Importing the handler modules registers their callback routes
+from handlers import tmdb, edit_menu, inline
+from handlers.movies import duplicate_reply
 
 def button_handler(update: Update, context: CallbackContext):
     """Handle all callback buttons."""
     query = update.callback_query
-    data = query.data
-    
-    # TMDB handlers
-    if data == "tmdb_next":
-        handle_tmdb_next(update, context)
-    elif data == "tmdb_prev":
-        handle_tmdb_prev(update, context)
-    elif data.startswith("view_movie_"):
-        handle_view_movie(update, context)
-    elif data.startswith("back_to_list"):
-        handle_back_to_list(update, context)
-    elif data.startswith("show_full_"):
-        handle_show_full_description(update, context)
-    elif data.startswith("back_to_movie_"):
-        handle_back_to_movie(update, context)
-    elif data.startswith("tmdb_add_to_list_"):
-        handle_add_to_list(update, context, data)
-    elif data.startswith("tmdb_category_"):
-        handle_tmdb_category_selection(update, context, data)
-      # Movie management handlers
-    elif data.startswith("choose_"):
-        choose_edit_delete_handler(update, context)
-    elif data.startswith("edit_"):
-        handle_edit_request(update, context, data)
-    elif data.startswith("editcat_"):
-        handle_category_edit_request(update, context, data)
-    elif data.startswith("setcat_"):
-        handle_category_change(update, context, data)
-    elif data.startswith("delete_"):
-        handle_delete_request(update, context, data)
-    elif data.startswith("confirm_delete_"):
-        handle_delete_confirmation(update, context, data)
-    elif data == "back_to_edit":
-        edit_list_menu(update, context)
-    elif data == "cancel_delete":
-        query.edit_message_text("❌ Deletion cancelled.")
-        query.answer()
-    elif data == "back_to_main":
-        from keyboards import main_menu_keyboard
-        query.edit_message_text(
-            "📱 Main Menu",
-            reply_markup=main_menu_keyboard()
-        )
-        query.answer()
-    else:
+    if not callback_router.dispatch(query.data, update, context):
         query.answer("⚠️ Unknown button")
 
+@callback_router.exact("cancel_delete")
+def cancel_delete(update: Update, context: CallbackContext):
+    query = update.callback_query
+    query.edit_message_text("❌ Deletion cancelled.")
+    query.answer()
+
+@callback_router.exact("back_to_main")
+def back_to_main(update: Update, context: CallbackContext):
+    query = update.callback_query
+    prefetch.cancel(update.effective_user.id)
+    query.edit_message_text(
+        "📱 Main Menu",
+        reply_markup=main_menu_keyboard()
+    )
+    query.answer()
 
+@callback_router.prefix("category_", pass_data=True)
 def handle_category_selection(update: Update, context: CallbackContext, data: str):
     """Handle category selection for a movie."""
     query = update.callback_query
@@ -83,12 +52,7 @@ def handle_category_selection(update: Update, context: CallbackContext, data: st
         return
 
     try:
-        user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
-        supabase.table("movies").insert({
-            "user_id": user_id,
-            "title": title,
-            "category": db_category
-        }).execute()
+        repository.add_movie(get_identity(chat_id), title, db_category)
         
         query.answer("✅ Movie successfully added!")
         query.edit_message_text(
@@ -97,6 +61,11 @@ def handle_category_selection(update: Update, context: CallbackContext, data: st
             parse_mode='HTML'
         )
         context.user_data.pop('pending_movie_title', None)
+    except repository.DuplicateMovie as e:
+        text, reply_markup = duplicate_reply(e.movie, db_category)
+        query.answer()
+        query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+        context.user_data.pop('pending_movie_title', None)
     except Exception as e:
         logging.error(f"Error adding movie: {e}")
         query.answer("❌ Error occurred while adding the movie.")
@@ -1,17 +1,37 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
-from db import supabase
+import repository
+import schema
+from db import get_identity, fetch_movies_page, remember_page, turn_page, MOVIE_PAGE_COLUMNS
+from router import callback_router, menu_router
+from keyboards import page_nav_row
 
+EDIT_PAGE_SIZE = 20
+PICKER_PAGE_SIZE = 10
+# Long titles are cut so a page always fits into one message / button
+MAX_TITLE_LENGTH = 100
+
+PICKER_PROMPTS = {
+    "edit": "✏️ Select a movie to edit title:",
+    "editcat": "🔄 Select a movie to change category:",
+    "delete": "🗑️ Select a movie to delete:",
+}
+
+def edit_columns():
+    return schema.select_columns("movies", MOVIE_PAGE_COLUMNS, "release_year")
+
+def _short(title):
+    return title if len(title) <= MAX_TITLE_LENGTH else title[:MAX_TITLE_LENGTH - 1] + "…"
+
+@menu_router.exact("✏️ Edit Movies")
+@callback_router.exact("back_to_edit")
 def edit_list_menu(update: Update, context: CallbackContext):
-    """Show the edit menu with all user's movies."""
+    """Show the edit menu with the first page of the user's movies."""
     chat_id = str(update.effective_chat.id)
-    user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-    user_ids = [user["id"]]
-    if user["partner_id"]:
-        user_ids.append(user["partner_id"])
+    user = get_identity(chat_id)
         
-    movies = supabase.table("movies").select("*").in_("user_id", user_ids).execute().data
+    movies, has_more = fetch_movies_page(user, limit=EDIT_PAGE_SIZE, columns=edit_columns())
     
     # Prepare the "no movies" message
     no_movies_text = (
@@ -33,22 +53,32 @@ def edit_list_menu(update: Update, context: CallbackContext):
             )
         return
         
+    context.user_data['edit_view'] = {}
+    show_edit_page(update, context, movies, False, has_more)
+
+def show_edit_page(update: Update, context: CallbackContext, movies, has_prev, has_next):
+    """Render one page of the edit menu."""
+    remember_page(context.user_data['edit_view'], movies, has_prev, has_next)
     text = "<b>📝 Your Movies</b>\n\n"
     for m in movies:
         cat = '❤️ Loved' if m['category'] == 'watched' else '📅 Planned'
-        title = m['title']
+        title = _short(m['title'])
         if m.get('release_year'):
             title += f" ({m['release_year']})"
         text += f"• <b>{title}</b> - {cat}\n"
     text += "\nSelect an action from the buttons below:"
     
-    keyboard = [
+    keyboard = []
+    nav = page_nav_row("editpg", has_prev, has_next)
+    if nav:
+        keyboard.append(nav)
+    keyboard += [
         [InlineKeyboardButton("✏️ Edit Title", callback_data="choose_edit"),
          InlineKeyboardButton("🔄 Change Category", callback_data="choose_editcat")],
         [InlineKeyboardButton("🗑️ Delete Movie", callback_data="choose_delete")],
         [InlineKeyboardButton("↩️ Back to Menu", callback_data="back_to_main")]
     ]
-      # Handle both callback queries and direct commands
+    # Handle both callback queries and direct commands
     if update.callback_query:
         update.callback_query.edit_message_text(
             text,
@@ -63,57 +93,82 @@ def edit_list_menu(update: Update, context: CallbackContext):
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
+@callback_router.prefix("editpg_", pass_data=True)
+def handle_edit_page(update: Update, context: CallbackContext, data: str):
+    """Handle Prev/Next in the edit menu."""
+    query = update.callback_query
+    view = context.user_data.get('edit_view')
+    if not view or "last" not in view:
+        return edit_list_menu(update, context)
+    user = get_identity(query.message.chat_id)
+    movies, has_prev, has_next = turn_page(view, data.split("_")[1], user, limit=EDIT_PAGE_SIZE, columns=edit_columns())
+    if not movies:
+        query.answer("No more movies.")
+        return
+    show_edit_page(update, context, movies, has_prev, has_next)
+
+@callback_router.prefix("choose_")
 def choose_edit_delete_handler(update: Update, context: CallbackContext):
     """Handle edit menu button callbacks."""
     query = update.callback_query
     chat_id = str(query.message.chat_id)
-    data = query.data
+    action = query.data[len("choose_"):]
+    if action not in PICKER_PROMPTS:
+        query.answer("⚠️ Unknown button")
+        return
     
-    user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-    user_ids = [user["id"]]
-    if user["partner_id"]:
-        user_ids.append(user["partner_id"])
+    user = get_identity(chat_id)
         
-    movies = supabase.table("movies").select("id, title, category").in_("user_id", user_ids).execute().data
+    movies, has_more = fetch_movies_page(user, limit=PICKER_PAGE_SIZE)
     if not movies:
         query.answer()
         query.edit_message_text("No movies to edit or delete.")
         return
-          # Create keyboard for movie selection
+    context.user_data['pick_view'] = {"action": action}
+    show_picker_page(update, context, movies, False, has_more)
+
+def show_picker_page(update: Update, context: CallbackContext, movies, has_prev, has_next):
+    """Render one page of movie buttons for the chosen edit action."""
+    query = update.callback_query
+    view = context.user_data['pick_view']
+    remember_page(view, movies, has_prev, has_next)
+    action = view["action"]
+
+    # Create keyboard for movie selection
     keyboard = []
-    
-    if data == "choose_edit":
-        for m in movies:
-            keyboard.append([InlineKeyboardButton(
-                f"{m['title']} ({'loved' if m['category']=='watched' else m['category']})", 
-                callback_data=f"edit_{m['id']}"
-            )])
-        msg = "✏️ Select a movie to edit title:"
-    elif data == "choose_editcat":
-        for m in movies:
-            keyboard.append([InlineKeyboardButton(
-                f"{m['title']} ({'loved' if m['category']=='watched' else m['category']})", 
-                callback_data=f"editcat_{m['id']}"
-            )])
-        msg = "🔄 Select a movie to change category:"
-    elif data == "choose_delete":
-        for m in movies:
-            keyboard.append([InlineKeyboardButton(
-                f"{m['title']} ({'loved' if m['category']=='watched' else m['category']})", 
-                callback_data=f"delete_{m['id']}"
-            )])
-        msg = "🗑️ Select a movie to delete:"
+    for m in movies:
+        keyboard.append([InlineKeyboardButton(
+            f"{_short(m['title'])} ({'loved' if m['category']=='watched' else m['category']})", 
+            callback_data=f"{action}_{m['id']}"
+        )])
+    nav = page_nav_row("pickpg", has_prev, has_next)
+    if nav:
+        keyboard.append(nav)
     
     # Add back button
     keyboard.append([InlineKeyboardButton("↩️ Back", callback_data="back_to_edit")])
     
     query.edit_message_text(
-        msg,
+        PICKER_PROMPTS[action],
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode='HTML'
     )
     query.answer()
 
+@callback_router.prefix("pickpg_", pass_data=True)
+def handle_picker_page(update: Update, context: CallbackContext, data: str):
+    """Handle Prev/Next in a movie picker."""
+    query = update.callback_query
+    view = context.user_data.get('pick_view')
+    if not view or "last" not in view:
+        return edit_list_menu(update, context)
+    user = get_identity(query.message.chat_id)
+    movies, has_prev, has_next = turn_page(view, data.split("_")[1], user, limit=PICKER_PAGE_SIZE)
+    if not movies:
+        query.answer("No more movies.")
+        return
+    show_picker_page(update, context, movies, has_prev, has_next)
+
 def handle_new_title(update: Update, context: CallbackContext):
     """Handle new title input for movie editing."""
     if context.user_data.get('awaiting_new_title') and context.user_data.get('edit_movie_id'):
@@ -122,29 +177,17 @@ def handle_new_title(update: Update, context: CallbackContext):
         new_title = update.message.text.strip()
         
         try:
-            # Get user and their partner's IDs
-            user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-            user_ids = [user["id"]]
-            if user["partner_id"]:
-                user_ids.append(user["partner_id"])
+            user = get_identity(chat_id)
 
-            # First verify the movie belongs to user or partner
-            movie = supabase.table("movies").select("*").eq("id", movie_id).in_("user_id", user_ids).execute().data
-            if not movie:
-                update.message.reply_text("❌ Movie not found or you don't have permission to edit it.")
-                return
-            
-            # Update the movie title
-            result = supabase.table("movies").update({"title": new_title}).eq("id", movie_id).in_("user_id", user_ids).execute()
-            
-            if result.data:
+            # The update is scoped to the household, so it also checks ownership
+            if repository.rename_movie(user, movie_id, new_title):
                 update.message.reply_text(
                     f"✅ Movie updated successfully!\n"
                     f"New title: <b>{new_title}</b>",
                     parse_mode='HTML'
                 )
             else:
-                update.message.reply_text("❌ Error updating movie. Please try again.")
+                update.message.reply_text("❌ Movie not found or you don't have permission to edit it.")
         except Exception as e:
             logging.error(f"Error updating movie title: {e}")
             update.message.reply_text("❌ An error occurred. Please try again.")
@@ -153,6 +196,7 @@ def handle_new_title(update: Update, context: CallbackContext):
             context.user_data.pop('edit_movie_id', None)
             context.user_data.pop('awaiting_new_title', None)
 
+@callback_router.prefix("edit_", pass_data=True)
 def handle_edit_request(update: Update, context: CallbackContext, data: str) -> None:
     """Handle request to edit a movie title."""
     query = update.callback_query
@@ -160,14 +204,10 @@ def handle_edit_request(update: Update, context: CallbackContext, data: str) ->
     chat_id = str(query.message.chat_id)
     
     try:
-        # Get user and partner IDs
-        user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-        user_ids = [user["id"]]
-        if user["partner_id"]:
-            user_ids.append(user["partner_id"])
+        user = get_identity(chat_id)
             
         # Get movie details
-        movie = supabase.table("movies").select("*").eq("id", movie_id).in_("user_id", user_ids).execute().data
+        movie = repository.get_movie(user, movie_id)
         if not movie:
             query.edit_message_text("❌ Movie not found or you don't have permission to edit it.")
             return
@@ -177,7 +217,7 @@ def handle_edit_request(update: Update, context: CallbackContext, data: str) ->
         context.user_data['awaiting_new_title'] = True
         
         query.edit_message_text(
-            f"✏️ Current title: <b>{movie[0]['title']}</b>\n\n"
+            f"✏️ Current title: <b>{movie['title']}</b>\n\n"
             "Please send the new title for this movie:",
             parse_mode='HTML'
         )
@@ -186,6 +226,7 @@ def handle_edit_request(update: Update, context: CallbackContext, data: str) ->
         logging.error(f"Error in handle_edit_request: {e}")
         query.edit_message_text("❌ Error editing movie. Please try again.")
 
+@callback_router.prefix("editcat_", pass_data=True)
 def handle_category_edit_request(update: Update, context: CallbackContext, data: str) -> None:
     """Handle request to edit a movie category."""
     query = update.callback_query
@@ -209,6 +250,7 @@ def handle_category_edit_request(update: Update, context: CallbackContext, data:
         logging.error(f"Error in handle_category_edit_request: {e}")
         query.edit_message_text("❌ Error changing category. Please try again.")
 
+@callback_router.prefix("setcat_", pass_data=True)
 def handle_category_change(update: Update, context: CallbackContext, data: str) -> None:
     """Handle category change for a movie."""
     query = update.callback_query
@@ -217,9 +259,8 @@ def handle_category_change(update: Update, context: CallbackContext, data: str)
     db_category = 'watched' if category == 'loved' else category
     
     try:
-        user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
-        result = supabase.table("movies").update({"category": db_category}).eq("id", movie_id).eq("user_id", user_id).execute()
-        if result.data:
+        user = get_identity(chat_id)
+        if repository.set_movie_category(user, movie_id, db_category):
             query.edit_message_text(f"Category updated to: <b>{category}</b>", parse_mode='HTML')
         else:
             query.edit_message_text("Movie not found or you don't have permission to edit it.")
@@ -228,6 +269,7 @@ def handle_category_change(update: Update, context: CallbackContext, data: str)
         query.edit_message_text("Error changing category. Please try again.")
     query.answer()
 
+@callback_router.prefix("delete_", pass_data=True)
 def handle_delete_request(update: Update, context: CallbackContext, data: str) -> None:
     """Handle request to delete a movie."""
     query = update.callback_query
@@ -242,15 +284,15 @@ def handle_delete_request(update: Update, context: CallbackContext, data: str) -
     )
     query.answer()
 
+@callback_router.prefix("confirm_delete_", pass_data=True)
 def handle_delete_confirmation(update: Update, context: CallbackContext, data: str) -> None:
     """Handle movie deletion confirmation."""
     query = update.callback_query
     chat_id = str(query.message.chat_id)
     movie_id = data.split("_")[2]
     try:
-        user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
-        result = supabase.table("movies").delete().eq("id", movie_id).eq("user_id", user_id).execute()
-        if result.data:
+        user = get_identity(chat_id)
+        if repository.delete_movie(user, movie_id):
             query.edit_message_text("Movie deleted.")
         else:
             query.edit_message_text("Movie not found or you don't have permission to delete it.")
@@ -0,0 +1,90 @@
+import html
+import time
+import logging
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import CallbackContext
+import tmdb_store
+import repository
+import inline_search
+from db import get_identity
+from poster_cache import poster_url
+from router import callback_router
+from tmdb_client import TMDBUnavailable
+from handlers.tmdb import add_tmdb_movie, TMDB_UNAVAILABLE_TEXT
+from handlers.movies import duplicate_reply, category_label
+
+# --- Inline mode: @bot <title> ---
+# Answers are debounced and cached in inline_search; here they are rendered as
+# articles with a poster thumbnail and buttons that add the movie to the list of
+# whoever taps them.
+# Telegram may reuse an answer for the same query text this long, for every user
+INLINE_CACHE_TIME = 300
+THUMB_SIZE = "w92"
+OVERVIEW_LIMIT = 300
+
+def add_buttons(tmdb_id):
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("📅 Planned", callback_data=f"inladd_planned_{tmdb_id}"),
+        InlineKeyboardButton("❤️ Loved", callback_data=f"inladd_loved_{tmdb_id}"),
+    ]])
+
+def movie_article(movie):
+    title = f"{movie.title} ({movie.year})" if movie.year else movie.title
+    overview = movie.overview if len(movie.overview) <= OVERVIEW_LIMIT else movie.overview[:OVERVIEW_LIMIT] + "…"
+    text = f"🎬 <b>{html.escape(title)}</b>"
+    if movie.rating:
+        text += f"\n⭐ {movie.rating:.1f}/10"
+    if overview:
+        text += f"\n\n{html.escape(overview)}"
+    return InlineQueryResultArticle(
+        id=str(movie.id),
+        title=title,
+        description=overview[:100] or None,
+        thumb_url=poster_url(movie.poster_path, THUMB_SIZE) if movie.poster_path else None,
+        input_message_content=InputTextMessageContent(text, parse_mode='HTML'),
+        reply_markup=add_buttons(movie.id),
+    )
+
+def inline_query(update: Update, context: CallbackContext) -> None:
+    """Search TMDB as the user types @bot <title>."""
+    query = update.inline_query
+    received_at = time.monotonic()
+
+    def answer(summaries):
+        query.answer([movie_article(movie) for movie in summaries], cache_time=INLINE_CACHE_TIME, is_personal=False)
+
+    inline_search.submit(query.from_user.id, query.query, answer, received_at)
+
+@callback_router.prefix("inladd_", pass_data=True)
+def handle_inline_add(update: Update, context: CallbackContext, data: str) -> None:
+    """Add the movie of an inline result to the list of the user who tapped the button."""
+    query = update.callback_query
+    try:
+        _, category, tmdb_id = data.split("_")
+        db_category = 'watched' if category == 'loved' else category
+        # Callbacks from inline messages have no chat; a user's private chat id is their user id
+        identity = get_identity(str(query.from_user.id))
+        if identity is None:
+            query.answer("👋 Open the bot and press /start first.", show_alert=True)
+            return
+        movie = tmdb_store.get(int(tmdb_id))
+        if not movie:
+            query.answer("❌ Error: Movie data not found")
+            return
+        add_tmdb_movie(identity, movie, db_category)
+        query.answer(f"✅ Added '{movie.title}' to your {category} list!")
+    except repository.DuplicateMovie as e:
+        listed = e.movie
+        if listed["category"] == db_category or not listed["id"]:
+            query.answer(f"ℹ️ '{listed['title']}' is already in your {category_label(listed['category'])} list.")
+            return
+        # The button sits in someone else's chat: offer the move in the user's own chat
+        text, reply_markup = duplicate_reply(listed, db_category)
+        context.bot.send_message(query.from_user.id, text, parse_mode='HTML', reply_markup=reply_markup)
+        query.answer(f"ℹ️ Already in your {category_label(listed['category'])} list — see my message.")
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable: {e}")
+        query.answer(TMDB_UNAVAILABLE_TEXT)
+    except ValueError as e:
+        logging.error(f"Error adding inline movie: {e}")
+        query.answer("❌ Error adding movie")
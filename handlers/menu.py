@@ -1,27 +1,25 @@
-import os
-import uuid
-import random
 import logging
-from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import CallbackContext, Updater, CommandHandler, MessageHandler, Filters, CallbackQueryHandler
-from supabase import create_client, Client
-from db import supabase
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
+from telegram.ext import CallbackContext
+import repository
+from db import get_identity, cache_identity, invalidate_identity
+import prefetch
 from keyboards import main_menu_keyboard
-from .callbacks import handle_add_to_list, handle_category_selection
-from .tmdb import tmdb_search, tmdb_popular, tmdb_top_rated
-from .movies import handle_movie_title, add_movie, list_movies, random_movie
-from .edit_menu import handle_new_title, edit_list_menu
-from .partner import partner_status, invite, unlink
+from router import menu_router
+# Importing the handler modules registers their menu and callback routes
+from . import callbacks, partner
+from .tmdb import tmdb_search
+from .movies import handle_movie_title, list_movies, random_movie
+from .edit_menu import handle_new_title
 
 # --- Menu and navigation handlers ---
 def start(update: Update, context: CallbackContext):
     chat_id = str(update.effective_chat.id)
     logging.info(f"/start command received from chat_id: {chat_id}")
     try:
-        user = supabase.table("users").select("*").eq("chat_id", chat_id).execute()
-        if not user.data:
-            supabase.table("users").insert({"chat_id": chat_id}).execute()
+        invalidate_identity(chat_id=chat_id)
+        if get_identity(chat_id) is None:
+            cache_identity(chat_id, repository.create_user(chat_id))
             logging.info(f"New user added with chat_id: {chat_id}")
         welcome_text = (
             "👋 <b>Welcome to MovieMateBot!</b>\n\n"
@@ -46,102 +44,89 @@ def start(update: Update, context: CallbackContext):
 def menu_handler(update: Update, context: CallbackContext):
     """Handle all menu interactions."""
     text = update.message.text
+    # Any menu action leaves the TMDB browse flow
+    prefetch.cancel(update.effective_user.id)
 
     # Handle special states first
     if context.user_data.get('awaiting_new_title') and context.user_data.get('edit_movie_id'):
-        return handle_new_title(update, context)
+        return menu_router.call("awaiting_new_title", handle_new_title, update, context)
     
     if context.user_data.get('awaiting_movie_title'):
-        return handle_movie_title(update, context)
+        return menu_router.call("awaiting_movie_title", handle_movie_title, update, context)
 
     # Handle TMDB search state
     if context.user_data.get('awaiting_tmdb_search'):
         context.user_data.pop('awaiting_tmdb_search', None)
-        return tmdb_search(update, context)
+        return menu_router.call("awaiting_tmdb_search", tmdb_search, update, context)
 
-    # Clean text for menu comparison
-    normalized = text.strip().replace('✏️', '').replace('📝', '').replace(' ', '').lower()
-
-    # Main menu options
-    if text == "🎬 Add Movie":
-        return add_movie(update, context)
-    
-    elif text == "📋 My Lists":
-        update.message.reply_text(
-            "📋 Which list do you want to see?",
-            reply_markup=ReplyKeyboardMarkup([
-                [KeyboardButton("📅 Planned"), KeyboardButton("❤️ Loved")],
-                [KeyboardButton("✏️ Edit Movies")],
-                [KeyboardButton("⬅️ Back to Menu")]
-            ], resize_keyboard=True)
-        )
-    
-    elif text == "🌟 Browse TMDB":
-        tmdb_menu = ReplyKeyboardMarkup([
-            [KeyboardButton("🔍 Search Movie")],
-            [KeyboardButton("🎬 Popular Movies")],
-            [KeyboardButton("⭐ Top Rated")],
-            [KeyboardButton("⬅️ Back to Menu")]
-        ], resize_keyboard=True)
-        update.message.reply_text("🎬 TMDB Menu: Choose an action", reply_markup=tmdb_menu)
-    
-    elif text == "🔍 Search Movie":
-        update.message.reply_text("🔍 Enter a movie title to search in TMDB:")
-        context.user_data['awaiting_tmdb_search'] = True
-    
-    elif text == "🎬 Popular Movies":
-        return tmdb_popular(update, context)
-    
-    elif text == "⭐ Top Rated":
-        return tmdb_top_rated(update, context)
-    
-    elif text == "✏️ Edit Movies":
-        return edit_list_menu(update, context)
-    
-    elif text == "🎲 Random Pick":
-        update.message.reply_text(
-            "🎲 Choose a list for random movie:",
-            reply_markup=ReplyKeyboardMarkup([
-                [KeyboardButton("🎲 From Planned"), KeyboardButton("🎲 From Loved")],
-                [KeyboardButton("🎲 From All Lists")],
-                [KeyboardButton("⬅️ Back to Menu")]
-            ], resize_keyboard=True)
-        )
-    
-    elif text == "🎲 From Planned":
-        context.args = ["planned"]
-        return random_movie(update, context)
-    
-    elif text == "🎲 From Loved":
-        context.args = ["loved"]
-        return random_movie(update, context)
-    
-    elif text == "🎲 From All Lists":
-        context.args = ["all"]
-        return random_movie(update, context)
-    
-    elif text == "👥 Partner Status":
-        return partner_status(update, context)
-    
-    elif text == "🔗 Invite Friend":
-        return invite(update, context)
-    
-    elif text == "🔓 Unlink Partner":
-        return unlink(update, context)
-    
-    elif text == "📅 Planned":
-        context.args = ["planned"]
-        return list_movies(update, context)
-    
-    elif text == "❤️ Loved":
-        context.args = ["loved"]
-        return list_movies(update, context)
-    
-    elif text == "⬅️ Back to Menu":
-        update.message.reply_text("📱 Back to main menu", reply_markup=main_menu_keyboard())
-    
-    else:
+    if not menu_router.dispatch(text, update, context):
         update.message.reply_text(
             "Please use the menu buttons below 👇",
             reply_markup=main_menu_keyboard()
         )
+
+@menu_router.exact("📋 My Lists")
+def show_lists_menu(update: Update, context: CallbackContext):
+    update.message.reply_text(
+        "📋 Which list do you want to see?",
+        reply_markup=ReplyKeyboardMarkup([
+            [KeyboardButton("📅 Planned"), KeyboardButton("❤️ Loved")],
+            [KeyboardButton("✏️ Edit Movies")],
+            [KeyboardButton("⬅️ Back to Menu")]
+        ], resize_keyboard=True)
+    )
+
+@menu_router.exact("🌟 Browse TMDB")
+def show_tmdb_menu(update: Update, context: CallbackContext):
+    tmdb_menu = ReplyKeyboardMarkup([
+        [KeyboardButton("🔍 Search Movie")],
+        [KeyboardButton("🎬 Popular Movies")],
+        [KeyboardButton("⭐ Top Rated")],
+        [KeyboardButton("⬅️ Back to Menu")]
+    ], resize_keyboard=True)
+    update.message.reply_text("🎬 TMDB Menu: Choose an action", reply_markup=tmdb_menu)
+
+@menu_router.exact("🔍 Search Movie")
+def ask_tmdb_search(update: Update, context: CallbackContext):
+    update.message.reply_text("🔍 Enter a movie title to search in TMDB:")
+    context.user_data['awaiting_tmdb_search'] = True
+
+@menu_router.exact("🎲 Random Pick")
+def show_random_menu(update: Update, context: CallbackContext):
+    update.message.reply_text(
+        "🎲 Choose a list for random movie:",
+        reply_markup=ReplyKeyboardMarkup([
+            [KeyboardButton("🎲 From Planned"), KeyboardButton("🎲 From Loved")],
+            [KeyboardButton("🎲 From All Lists")],
+            [KeyboardButton("⬅️ Back to Menu")]
+        ], resize_keyboard=True)
+    )
+
+@menu_router.exact("🎲 From Planned")
+def random_from_planned(update: Update, context: CallbackContext):
+    context.args = ["planned"]
+    return random_movie(update, context)
+
+@menu_router.exact("🎲 From Loved")
+def random_from_loved(update: Update, context: CallbackContext):
+    context.args = ["loved"]
+    return random_movie(update, context)
+
+@menu_router.exact("🎲 From All Lists")
+def random_from_all(update: Update, context: CallbackContext):
+    context.args = ["all"]
+    return random_movie(update, context)
+
+@menu_router.exact("📅 Planned")
+def list_planned(update: Update, context: CallbackContext):
+    context.args = ["planned"]
+    return list_movies(update, context)
+
+@menu_router.exact("❤️ Loved")
+def list_loved(update: Update, context: CallbackContext):
+    context.args = ["loved"]
+    return list_movies(update, context)
+
+@menu_router.exact("⬅️ Back to Menu")
+def back_to_menu(update: Update, context: CallbackContext):
+    update.message.reply_text("📱 Back to main menu", reply_markup=main_menu_keyboard())
@@ -1,10 +1,24 @@
 import logging
-import random
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
-from db import supabase
-from keyboards import main_menu_keyboard
+import repository
+import schema
+from db import (
+    get_identity, fetch_movies_page, remember_page, turn_page,
+    pick_random_movie, RANDOM_FAVOUR_OLDER
+)
+from router import menu_router, callback_router
+from keyboards import page_nav_row
+from utils import split_message
 
+LIST_PAGE_SIZE = 50
+LIST_COLUMNS = "id, title, created_at"
+
+def list_columns():
+    """Columns of a list page; the release year too once the table has it (sql/006)."""
+    return schema.select_columns("movies", LIST_COLUMNS, "release_year")
+
+@menu_router.exact("🎬 Add Movie")
 def add_movie(update: Update, context: CallbackContext):
     """Add a movie to user's list."""
     chat_id = str(update.effective_chat.id)
@@ -27,14 +41,52 @@ def add_movie(update: Update, context: CallbackContext):
             update.message.reply_text("Category must be 'planned' or 'loved'.")
             return
             
-        user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
-        supabase.table("movies").insert({"user_id": user_id, "title": title, "category": db_category}).execute()
+        repository.add_movie(get_identity(chat_id), title, db_category)
         logging.info(f"Movie '{title}' added to category '{category}' by chat_id: {chat_id}")
         update.message.reply_text(f"Added '<b>{title}</b>' to <b>{category}</b>.", parse_mode='HTML')
+    except repository.DuplicateMovie as e:
+        text, reply_markup = duplicate_reply(e.movie, db_category)
+        update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
     except IndexError:
         logging.warning(f"Invalid /add command usage by chat_id: {chat_id}")
         update.message.reply_text("Usage: /add <category> <movie_title>")
 
+# --- Duplicates ---
+def category_label(db_category):
+    return 'loved' if db_category == 'watched' else db_category
+
+def duplicate_reply(movie, db_category):
+    """(text, keyboard) for a movie that is already listed; offers to move it when db_category differs."""
+    label = category_label(movie["category"])
+    if movie["category"] == db_category or not movie["id"]:
+        return f"ℹ️ '<b>{movie['title']}</b>' is already in your <b>{label}</b> list.", None
+    target = category_label(db_category)
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton(f"➡️ Move to {target}", callback_data=f"dupmove_{db_category}_{movie['id']}"),
+        InlineKeyboardButton("👌 Keep it", callback_data="dupkeep"),
+    ]])
+    return f"ℹ️ '<b>{movie['title']}</b>' is already in <b>{label}</b> — move it to <b>{target}</b>?", keyboard
+
+@callback_router.prefix("dupmove_", pass_data=True)
+def handle_duplicate_move(update: Update, context: CallbackContext, data: str):
+    """Move an already listed movie to the category the user tried to add it to."""
+    query = update.callback_query
+    _, db_category, movie_id = data.split("_", 2)
+    movie = repository.set_movie_category(get_identity(str(query.message.chat_id)), movie_id, db_category)
+    if not movie:
+        query.answer("Movie not found.")
+        return
+    query.answer()
+    query.edit_message_text(
+        f"✅ Moved '<b>{movie['title']}</b>' to <b>{category_label(db_category)}</b>.", parse_mode='HTML'
+    )
+
+@callback_router.exact("dupkeep")
+def handle_duplicate_keep(update: Update, context: CallbackContext):
+    query = update.callback_query
+    query.answer()
+    query.edit_message_text("👌 Left it where it is.")
+
 def list_movies(update: Update, context: CallbackContext):
     """List movies in a specific category."""
     chat_id = str(update.effective_chat.id)
@@ -45,77 +97,130 @@ def list_movies(update: Update, context: CallbackContext):
             update.message.reply_text("📝 Category must be 'planned' or 'loved'.")
             return
             
-        user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-        user_ids = [user["id"]]
-        if user["partner_id"]:
-            user_ids.append(user["partner_id"])
-            
-        movies = supabase.table("movies").select("*").in_("user_id", user_ids).eq("category", db_category).execute()
-        if not movies.data:
-            update.message.reply_text(
-                f"📭 Your {category} list is empty!\n\n"
-                "➕ Use <code>/add</code> or the menu button to add movies\n"
-                "🔍 Or try searching TMDB for suggestions", 
-                parse_mode='HTML'
-            )
+        user = get_identity(chat_id)
+        rows, has_more = fetch_movies_page(user, [db_category], limit=LIST_PAGE_SIZE, columns=list_columns())
+        if not rows:
+            update.message.reply_text(empty_list_text(category), parse_mode='HTML')
             return
             
-        emoji = "📅" if category == "planned" else "❤️"
-        response = (
-            f"{emoji} <b>Your {category} movies:</b>\n\n" + 
-            "\n".join([f"• {movie['title']}" for movie in movies.data])
-        )
-        update.message.reply_text(response, parse_mode='HTML')
+        context.user_data['list_view'] = {"category": category}
+        send_list_page(update, context, rows, False, has_more)
     except IndexError:
-        update.message.reply_text(
-            "ℹ️ Usage:\n"
-            "<code>/list planned</code> - See movies you want to watch\n"
-            "<code>/list loved</code> - See movies you've watched and loved",
-            parse_mode='HTML'
-        )
+        update.message.reply_text(LIST_USAGE_TEXT, parse_mode='HTML')
 
-def random_movie(update: Update, context: CallbackContext):
-    """Get a random movie suggestion."""
-    chat_id = str(update.effective_chat.id)
-    user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-    user_ids = [user["id"]]
-    if user["partner_id"]:
-        user_ids.append(user["partner_id"])
-        
+def list_page_messages(context: CallbackContext, rows, has_prev, has_next):
+    """Remember the page in the session and render it as (text chunks, nav keyboard)."""
+    view = context.user_data['list_view']
+    remember_page(view, rows, has_prev, has_next)
+    nav = page_nav_row("listpg", has_prev, has_next)
+    reply_markup = InlineKeyboardMarkup([nav]) if nav else None
+    return split_message(movie_list_text(view["category"], rows)), reply_markup
+
+def send_list_page(update: Update, context: CallbackContext, rows, has_prev, has_next):
+    """Show one page of a list; pages that don't fit one message go out as several."""
+    chunks, reply_markup = list_page_messages(context, rows, has_prev, has_next)
+    query = update.callback_query
+    if query and len(chunks) == 1:
+        query.edit_message_text(chunks[0], parse_mode='HTML', reply_markup=reply_markup)
+        return
+    message = query.message if query else update.message
+    for i, chunk in enumerate(chunks):
+        last = i == len(chunks) - 1
+        message.reply_text(chunk, parse_mode='HTML', reply_markup=reply_markup if last else None)
+
+@callback_router.prefix("listpg_", pass_data=True)
+def handle_list_page(update: Update, context: CallbackContext, data: str):
+    """Handle Prev/Next in a /list view."""
+    query = update.callback_query
+    view = context.user_data.get('list_view')
+    if not view or "last" not in view:
+        query.answer("This list has expired, please open it again.")
+        return
+    category = view["category"]
+    db_category = 'watched' if category == 'loved' else category
+    user = get_identity(query.message.chat_id)
+    rows, has_prev, has_next = turn_page(
+        view, data.split("_")[1], user, [db_category], limit=LIST_PAGE_SIZE, columns=list_columns()
+    )
+    if not rows:
+        query.answer("No more movies.")
+        return
+    query.answer()
+    send_list_page(update, context, rows, has_prev, has_next)
+
+def empty_list_text(category):
+    return (
+        f"📭 Your {category} list is empty!\n\n"
+        "➕ Use <code>/add</code> or the menu button to add movies\n"
+        "🔍 Or try searching TMDB for suggestions"
+    )
+
+def movie_label(movie):
+    """Title, with the release year when the row has one."""
+    return f"{movie['title']} ({movie['release_year']})" if movie.get('release_year') else movie['title']
+
+def movie_list_text(category, movies):
+    emoji = "📅" if category == "planned" else "❤️"
+    return (
+        f"{emoji} <b>Your {category} movies:</b>\n\n" + 
+        "\n".join([f"• {movie_label(movie)}" for movie in movies])
+    )
+
+LIST_USAGE_TEXT = (
+    "ℹ️ Usage:\n"
+    "<code>/list planned</code> - See movies you want to watch\n"
+    "<code>/list loved</code> - See movies you've watched and loved"
+)
+
+def random_categories(args):
+    """Map /random arguments to (db categories, shown category)."""
     categories = ["planned"]
     shown_category = 'planned'
-    if context.args:
-        arg = context.args[0].lower()
+    if args:
+        arg = args[0].lower()
         if arg == "loved":
             categories = ["watched"]
             shown_category = 'loved'
         elif arg == "all":
             categories = ["planned", "watched"]
             shown_category = 'all'
-            
-    movies = supabase.table("movies").select("*").in_("user_id", user_ids).in_("category", categories).execute()
-    if not movies.data:
-        cat_text = 'both lists' if shown_category == 'all' else f'{shown_category} list'
-        update.message.reply_text(
-            f"🎲 No movies in {cat_text}!\n\n"
-            "➕ Add some movies first using the menu.",
-            parse_mode='HTML'
-        )
-        return
-        
-    movie = random.choice(movies.data)
+    return categories, shown_category
+
+def favour_older(categories):
+    """Older planned entries get picked more often when RANDOM_FAVOUR_OLDER is set."""
+    return RANDOM_FAVOUR_OLDER and categories == ["planned"]
+
+def no_random_text(shown_category):
+    cat_text = 'both lists' if shown_category == 'all' else f'{shown_category} list'
+    return (
+        f"🎲 No movies in {cat_text}!\n\n"
+        "➕ Add some movies first using the menu."
+    )
+
+def random_pick_text(movie):
     # Show 'loved' for watched in UI
     display_cat = 'loved' if movie['category'] == 'watched' else movie['category']
-    update.message.reply_text(
+    return (
         f"🎲 <b>Your random pick from {display_cat}:</b>\n\n"
-        f"🎬 <b>{movie['title']}</b>",
-        parse_mode='HTML'
+        f"🎬 <b>{movie['title']}</b>"
     )
 
+def random_movie(update: Update, context: CallbackContext):
+    """Get a random movie suggestion."""
+    chat_id = str(update.effective_chat.id)
+    user = get_identity(chat_id)
+    categories, shown_category = random_categories(context.args)
+    movie = pick_random_movie(user, categories, favour_older=favour_older(categories))
+    if not movie:
+        update.message.reply_text(no_random_text(shown_category), parse_mode='HTML')
+        return
+        
+    update.message.reply_text(random_pick_text(movie), parse_mode='HTML')
+
 def edit_movie(update: Update, context: CallbackContext):
     """Edit a movie's title."""
     chat_id = str(update.effective_chat.id)
-    user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
+    user = get_identity(chat_id)
     try:
         movie_id = context.args[0]
         new_title = " ".join(context.args[1:])
@@ -123,8 +228,7 @@ def edit_movie(update: Update, context: CallbackContext):
             update.message.reply_text("Usage: /edit <code>movie_id</code> <code>new_title</code>")
             return
             
-        result = supabase.table("movies").update({"title": new_title}).eq("id", movie_id).eq("user_id", user_id).execute()
-        if result.data:
+        if repository.rename_movie(user, movie_id, new_title):
             update.message.reply_text(f"Movie updated to: <b>{new_title}</b>", parse_mode='HTML')
         else:
             update.message.reply_text("Movie not found or you don't have permission to edit it.")
@@ -135,11 +239,10 @@ def edit_movie(update: Update, context: CallbackContext):
 def delete_movie(update: Update, context: CallbackContext):
     """Delete a movie."""
     chat_id = str(update.effective_chat.id)
-    user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
+    user = get_identity(chat_id)
     try:
         movie_id = context.args[0]
-        result = supabase.table("movies").delete().eq("id", movie_id).eq("user_id", user_id).execute()
-        if result.data:
+        if repository.delete_movie(user, movie_id):
             update.message.reply_text("Movie deleted.")
         else:
             update.message.reply_text("Movie not found or you don't have permission to delete it.")
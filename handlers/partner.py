@@ -1,20 +1,22 @@
-import os
+import html
 import uuid
-import random
 import logging
-from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update
+from telegram.error import TelegramError
 from telegram.ext import CallbackContext
-from supabase import create_client, Client
-from db import supabase
+import outbound
+import repository
+from db import get_identity, set_partner_display, redeem_invite, leave_household
+from router import menu_router
 
 # --- Partner-related handlers ---
+@menu_router.exact("🔗 Invite Friend")
 def invite(update: Update, context: CallbackContext):
     """Generate and send an invite code."""
     chat_id = str(update.effective_chat.id)
     invite_code = f"INV-{uuid.uuid4().hex[:6]}"
     logging.info(f"Generated invite code {invite_code} for chat_id: {chat_id}")
-    supabase.table("users").update({"invite_code": invite_code}).eq("chat_id", chat_id).execute()
+    repository.set_invite_code(chat_id, invite_code)
     text = (
         f"🎟️ <b>Your invite code:</b> <code>{invite_code}</code>\n\n"
         "1️⃣ Share this code with your friend\n"
@@ -31,8 +33,20 @@ def join(update: Update, context: CallbackContext):
     try:
         invite_code = context.args[0]
         logging.info(f"Attempting to join with invite code: {invite_code}")
-        inviter = supabase.table("users").select("*").eq("invite_code", invite_code).execute()
-        if not inviter.data:
+        result = redeem_invite(chat_id, invite_code)
+        if result["status"] == "own_code":
+            update.message.reply_text(
+                "🙃 That's your own invite code!\n\n"
+                "💡 Send it to your friend so they can /join you"
+            )
+            return
+        if result["status"] == "already_paired":
+            update.message.reply_text(
+                "👥 One of you is already paired!\n\n"
+                "🔓 Use Unlink Partner first, then /join again"
+            )
+            return
+        if result["status"] != "paired":
             logging.warning(f"Invalid invite code: {invite_code} from chat_id: {chat_id}")
             update.message.reply_text(
                 "❌ Invalid invite code!\n\n"
@@ -40,10 +54,7 @@ def join(update: Update, context: CallbackContext):
                 "💡 Or ask your friend to generate a new one with /invite"
             )
             return
-        inviter_id = inviter.data[0]["id"]
-        supabase.table("users").update({"partner_id": inviter_id}).eq("chat_id", chat_id).execute()
-        supabase.table("users").update({"partner_id": supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]}).eq("id", inviter_id).execute()
-        supabase.table("users").update({"invite_code": None}).eq("id", inviter_id).execute()
+        inviter_id = result["partner_id"]
         logging.info(f"Users paired: chat_id {chat_id} with inviter_id {inviter_id}")
         update.message.reply_text(
             "🎉 <b>Successfully paired!</b>\n\n"
@@ -54,6 +65,9 @@ def join(update: Update, context: CallbackContext):
             "✨ Have fun watching together!",
             parse_mode='HTML'
         )
+        name = html.escape(update.effective_user.first_name or "Your friend")
+        notify_partner(context, result["partner_chat_id"],
+                       f"🎉 <b>{name} joined you!</b>\n\nYour movie lists are shared now. Try /list")
     except IndexError:
         logging.warning(f"No invite code provided by chat_id: {chat_id}")
         update.message.reply_text(
@@ -62,46 +76,49 @@ def join(update: Update, context: CallbackContext):
             "2️⃣ Use: /join <code>your_code</code>"
         )
 
+@menu_router.exact("👥 Partner Status")
 def partner_status(update: Update, context: CallbackContext):
     """Check partner status and show relevant information."""
     chat_id = str(update.effective_chat.id)
-    user = supabase.table("users").select("partner_id").eq("chat_id", chat_id).execute().data[0]
+    user = get_identity(chat_id)
     if user["partner_id"]:
-        # Get partner's Telegram user
-        partner_user = context.bot.get_chat(
-            supabase.table("users")
-            .select("chat_id")
-            .eq("id", user["partner_id"])
-            .execute()
-            .data[0]["chat_id"]
-        )
-        partner_name = partner_user.first_name or partner_user.full_name or "your friend"
-        update.message.reply_text(
-            f"👥 <b>You are paired with {partner_name}!</b>\n\n"
-            "Together you can:\n"
-            "🎬 Share movie lists\n"
-            "📝 Add and edit movies\n"
-            "🎲 Get movie suggestions\n"
-            "❤️ Track favorites",
-            parse_mode='HTML'
-        )
+        partner_name = user["partner_name"]
+        if not partner_name:
+            # Get partner's Telegram user once and keep the name in the identity cache
+            partner_chat_id = repository.get_user(user["partner_id"])["chat_id"]
+            partner_user = context.bot.get_chat(partner_chat_id)
+            partner_name = partner_user.first_name or partner_user.full_name or "your friend"
+            set_partner_display(chat_id, partner_chat_id, partner_name)
+        update.message.reply_text(paired_text(partner_name), parse_mode='HTML')
     else:
-        update.message.reply_text(
-            "🔄 <b>You are not paired yet</b>\n\n"
-            "To connect with a friend:\n"
-            "1️⃣ Use /invite to generate a code\n"
-            "2️⃣ Share the code with your friend\n"
-            "3️⃣ They use /join with your code",
-            parse_mode='HTML'
-        )
+        update.message.reply_text(NOT_PAIRED_TEXT, parse_mode='HTML')
+
+def paired_text(partner_name):
+    return (
+        f"👥 <b>You are paired with {partner_name}!</b>\n\n"
+        "Together you can:\n"
+        "🎬 Share movie lists\n"
+        "📝 Add and edit movies\n"
+        "🎲 Get movie suggestions\n"
+        "❤️ Track favorites"
+    )
 
+NOT_PAIRED_TEXT = (
+    "🔄 <b>You are not paired yet</b>\n\n"
+    "To connect with a friend:\n"
+    "1️⃣ Use /invite to generate a code\n"
+    "2️⃣ Share the code with your friend\n"
+    "3️⃣ They use /join with your code"
+)
+
+@menu_router.exact("🔓 Unlink Partner")
 def unlink(update: Update, context: CallbackContext):
     """Unlink from current partner."""
     chat_id = str(update.effective_chat.id)
-    user = supabase.table("users").select("id, partner_id").eq("chat_id", chat_id).execute().data[0]
-    if user["partner_id"]:
-        supabase.table("users").update({"partner_id": None}).eq("id", user["partner_id"]).execute()
-        supabase.table("users").update({"partner_id": None}).eq("chat_id", chat_id).execute()
+    identity = get_identity(chat_id)
+    partner_chat_id = identity and (identity["partner_chat_id"] or _chat_of(identity["partner_id"]))
+    result = leave_household(chat_id)
+    if result["status"] == "unlinked":
         update.message.reply_text(
             "🔓 <b>Successfully unlinked!</b>\n\n"
             "You can now:\n"
@@ -110,9 +127,25 @@ def unlink(update: Update, context: CallbackContext):
             "✨ Start fresh with a new partner!",
             parse_mode='HTML'
         )
+        notify_partner(context, partner_chat_id,
+                       "🔓 <b>Your partner unlinked.</b>\n\nYour list is your own again; use /invite to pair with someone.")
     else:
         update.message.reply_text(
             "ℹ️ You are not paired with anyone.\n\n"
             "Use /invite to generate a code and start sharing movies!",
             parse_mode='HTML'
         )
+
+def _chat_of(user_id):
+    user = repository.get_user(user_id) if user_id else None
+    return user["chat_id"] if user else None
+
+def notify_partner(context: CallbackContext, partner_chat_id, text):
+    """Tell the other side of a /join or /unlink; it waits behind interactive replies."""
+    if not partner_chat_id:
+        return
+    try:
+        with outbound.background():
+            context.bot.send_message(partner_chat_id, text, parse_mode='HTML')
+    except TelegramError as e:
+        logging.warning(f"Could not notify partner chat {partner_chat_id}: {e}")
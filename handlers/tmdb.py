@@ -1,34 +1,80 @@
 import os
 import logging
-import requests
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.ext import CallbackContext
-from db import supabase  # Import supabase client
+import repository
+import schema
+from db import get_identity
+from router import callback_router, menu_router
+from keyboards import page_nav_row
+from handlers.movies import duplicate_reply
+import tmdb_cache
+import tmdb_store
+import poster_cache
+import prefetch
+import tmdb_stream
+import catalogue
+from tmdb_client import TMDBUnavailable
 
 # Load environment variables if not already loaded
 load_dotenv()
 
+TMDB_UNAVAILABLE_TEXT = "🎬 TMDB is not responding right now. Please try again in a minute."
+TMDB_LIST_PAGE_SIZE = 10
+
+# --- Browsing session ---
+# user_data keeps a lazy tmdb_stream (a window of TMDB ids, more pages loaded on
+# demand) and a cursor; the summaries themselves live once in tmdb_store.
+def start_browsing(context: CallbackContext, endpoint, params, data) -> bool:
+    """Point the session at the results of endpoint, whose first page is data. Returns False if there is nothing to browse."""
+    context.user_data['current_result_index'] = 0
+    context.user_data['tmdb_list_start'] = 0
+    return tmdb_stream.open_stream(context.user_data, endpoint, params, data)
+
+def browse_catalogue(context: CallbackContext, query) -> bool:
+    """Point the session at the local catalogue's matches for query.
+
+    Returns False if none of them starts with the query, so the caller searches TMDB live.
+    """
+    found = catalogue.search_titles(query)
+    if not any(catalogue.strong_match(query, title) for _, title in found):
+        return False
+    tmdb_ids = [tmdb_id for tmdb_id, _ in found]
+    context.user_data['current_result_index'] = 0
+    context.user_data['tmdb_list_start'] = 0
+    return tmdb_stream.open_ids(context.user_data, tmdb_ids)
+
+def session_movie(context: CallbackContext, index=None):
+    """MovieSummary at index (default: the cursor) of the browsed results, or None."""
+    if index is None:
+        index = context.user_data.get('current_result_index', 0)
+    try:
+        tmdb_id = tmdb_stream.movie_id(context.user_data, index)
+        return tmdb_store.get(tmdb_id) if tmdb_id is not None else None
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable while loading result {index}: {e}")
+        return None
+
+def prefetch_around(update: Update, context: CallbackContext, index) -> None:
+    offset, ids = tmdb_stream.window(context.user_data, index)
+    prefetch.around(update.effective_user.id, ids, index - offset)
+
+@callback_router.prefix("tmdb_add_to_list_", pass_data=True)
 def handle_add_to_list(update: Update, context: CallbackContext, data: str):
     """Handle adding a movie to the list."""
     query = update.callback_query
     try:
         # Parse the movie index from the callback data (tmdb_add_to_list_X)
         movie_index = int(data.split("_")[-1])  # Use last part of callback data
-        results = context.user_data.get('tmdb_results', [])
-        
-        if not results or movie_index >= len(results):
-            query.answer("Movie not found.")
-            return
-            
-        movie = results[movie_index]
+        movie = session_movie(context, movie_index)
         if not movie:
-            query.answer("Error: Movie data not found")
+            query.answer("Movie not found.")
             return
             
-        title = movie.get("title", "Title not specified")
+        title = movie.title
         context.user_data['pending_movie_title'] = title
-        context.user_data['pending_movie_tmdb_data'] = movie
+        context.user_data['pending_tmdb_id'] = movie.id
         
         keyboard = [
             [InlineKeyboardButton("📅 Planned", callback_data=f'tmdb_category_planned_{movie_index}')],
@@ -57,44 +103,45 @@ def tmdb_search(update: Update, context: CallbackContext) -> None:
         return
     
     try:
-        url = "https://api.themoviedb.org/3/search/movie"
-        params = {"api_key": TMDB_API_KEY, "query": query, "language": "en-US"}
-        r = requests.get(url, params=params)
+        # Titles come from the local catalogue when one starts with the query; TMDB is asked only for details
+        if browse_catalogue(context, query):
+            show_movie_result(update, context)
+            return
+
+        params = {"query": query, "language": "en-US"}
+        data = tmdb_cache.get_json("search/movie", params)
         
-        if r.status_code != 200 or not r.json().get("results"):
+        if not data or not start_browsing(context, "search/movie", params, data):
             update.message.reply_text("🔍 No movies found.")
             return
-            
-        results = r.json()["results"]
-        context.user_data['tmdb_results'] = results
-        context.user_data['current_result_index'] = 0
         
         # Show first result
         show_movie_result(update, context)
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable: {e}")
+        update.message.reply_text(TMDB_UNAVAILABLE_TEXT)
     except Exception as e:
         logging.error(f"Error searching movie through TMDB: {e}")
         update.message.reply_text("❌ Error occurred while searching for the movie. Please try again later.")
 
 def show_movie_result(update: Update, context: CallbackContext) -> None:
     """Show a single movie result with navigation buttons."""
-    results = context.user_data.get('tmdb_results', [])
     current_index = context.user_data.get('current_result_index', 0)
-    next_index = current_index + 1
     
     query = update.callback_query
     
-    if not results or current_index >= len(results):
+    movie = session_movie(context)
+    if not movie:
         if query:
             query.edit_message_text("🔍 No results to display.")
         else:
             update.message.reply_text("🔍 No results to display.")
         return
     
-    movie = results[current_index]
-    title = movie.get("title", "Title not specified")
-    year = movie.get("release_date", "")[:4] if movie.get("release_date") else "Year unknown"
-    overview = movie.get("overview", "No description available")
-    rating = movie.get("vote_average", 0)
+    title = movie.title
+    year = movie.year or "Year unknown"
+    overview = movie.overview or "No description available"
+    rating = movie.rating
     
     # Truncate overview if it's too long
     short_overview = overview[:100] + "..." if len(overview) > 100 else overview
@@ -109,7 +156,12 @@ def show_movie_result(update: Update, context: CallbackContext) -> None:
     # Add navigation buttons
     if current_index > 0:
         nav_buttons.append(InlineKeyboardButton("⬅️ Previous movie", callback_data="tmdb_prev"))
-    if next_index < len(results):
+    try:
+        more = tmdb_stream.has_next(context.user_data, current_index)
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable while loading more results: {e}")
+        more = False
+    if more:
         nav_buttons.append(InlineKeyboardButton("➡️ Next movie", callback_data="tmdb_next"))
     if nav_buttons:
         keyboard.append(nav_buttons)
@@ -129,48 +181,51 @@ def show_movie_result(update: Update, context: CallbackContext) -> None:
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
+    # Warm the neighbours while this one is being sent and read
+    prefetch_around(update, context, current_index)
+    
     # Send or update movie info with poster
-    poster = movie.get("poster_path")
+    poster = movie.poster_path
     if poster:
-        poster_url = f"https://image.tmdb.org/t/p/w500{poster}"
         if query:
             try:
-                query.edit_message_media(
+                poster_cache.send_poster(movie.id, poster, lambda photo: query.edit_message_media(
                     media=InputMediaPhoto(
-                        media=poster_url,
+                        media=photo,
                         caption=msg,
                         parse_mode='HTML'
                     ),
                     reply_markup=reply_markup
-                )
+                ))
             except Exception as e:
                 logging.error(f"Error updating message with photo: {e}")
                 query.edit_message_text(msg, parse_mode='HTML', reply_markup=reply_markup)
         else:
-            update.message.reply_photo(
-                photo=poster_url,
+            poster_cache.send_poster(movie.id, poster, lambda photo: update.message.reply_photo(
+                photo=photo,
                 caption=msg,
                 parse_mode='HTML',
                 reply_markup=reply_markup
-            )
+            ))
     else:
         if query:
             query.edit_message_text(msg, parse_mode='HTML', reply_markup=reply_markup)
         else:
             update.message.reply_text(msg, parse_mode='HTML', reply_markup=reply_markup)
 
+@callback_router.exact("tmdb_next")
 def handle_tmdb_next(update: Update, context: CallbackContext) -> None:
     """Handle next movie button in TMDB results."""
     query = update.callback_query
     query.answer()
     
-    results = context.user_data.get('tmdb_results', [])
     current_index = context.user_data.get('current_result_index', 0)
     
-    if current_index + 1 < len(results):
+    if session_movie(context, current_index + 1):
         context.user_data['current_result_index'] = current_index + 1
         show_movie_result(update, context)
 
+@callback_router.exact("tmdb_prev")
 def handle_tmdb_prev(update: Update, context: CallbackContext) -> None:
     """Handle previous movie button in TMDB results."""
     query = update.callback_query
@@ -182,23 +237,23 @@ def handle_tmdb_prev(update: Update, context: CallbackContext) -> None:
         context.user_data['current_result_index'] = current_index - 1
         show_movie_result(update, context)
 
+@callback_router.prefix("show_full_")
 def handle_show_full_description(update: Update, context: CallbackContext) -> None:
     """Show full movie description."""
     query = update.callback_query
     query.answer()
     
-    results = context.user_data.get('tmdb_results', [])
     current_index = context.user_data.get('current_result_index', 0)
     
-    if not results or current_index >= len(results):
+    movie = session_movie(context)
+    if not movie:
         query.edit_message_text("Movie not found.")
         return
     
-    movie = results[current_index]
-    title = movie.get("title", "Title not specified")
-    year = movie.get("release_date", "")[:4] if movie.get("release_date") else "Year unknown"
-    overview = movie.get("overview", "No description available")
-    rating = movie.get("vote_average", 0)
+    title = movie.title
+    year = movie.year or "Year unknown"
+    overview = movie.overview or "No description available"
+    rating = movie.rating
     
     msg = (f"🎬 <b>{title}</b> ({year})\n"
            f"⭐ Rating: {rating:.1f}\n\n"
@@ -209,15 +264,15 @@ def handle_show_full_description(update: Update, context: CallbackContext) -> No
         InlineKeyboardButton("➕ Add to list", callback_data=f"tmdb_add_to_list_{current_index}")
     ]]
     
-    if movie.get("poster_path"):
-        query.edit_message_media(
+    if movie.poster_path:
+        poster_cache.send_poster(movie.id, movie.poster_path, lambda photo: query.edit_message_media(
             media=InputMediaPhoto(
-                media=f"https://image.tmdb.org/t/p/w500{movie.get('poster_path')}",
+                media=photo,
                 caption=msg,
                 parse_mode='HTML'
             ),
             reply_markup=InlineKeyboardMarkup(keyboard)
-        )
+        ))
     else:
         query.edit_message_text(
             text=msg,
@@ -225,12 +280,25 @@ def handle_show_full_description(update: Update, context: CallbackContext) -> No
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
+@callback_router.prefix("back_to_movie_")
 def handle_back_to_movie(update: Update, context: CallbackContext) -> None:
     """Return to movie details from full description."""
     query = update.callback_query
     query.answer()
     show_movie_result(update, context)
 
+def add_tmdb_movie(identity, movie, db_category):
+    """Save a TMDB movie to the identity's list, with whichever TMDB details the table has columns for."""
+    details = {
+        "tmdb_id": movie.id,
+        "poster_path": movie.poster_path,
+        "overview": movie.overview or None,
+        "release_year": int(movie.year) if movie.year else None,
+    }
+    details = {column: value for column, value in details.items() if schema.has("movies", column)}
+    repository.add_movie(identity, movie.title, db_category, **details)
+
+@callback_router.prefix("tmdb_category_", pass_data=True)
 def handle_tmdb_category_selection(update: Update, context: CallbackContext, data: str) -> None:
     """Handle category selection for TMDB movie."""
     query = update.callback_query
@@ -242,35 +310,18 @@ def handle_tmdb_category_selection(update: Update, context: CallbackContext, dat
         movie_index = int(index)
         db_category = 'watched' if category == 'loved' else category
 
-        # Get movie details from context - this was saved during handle_add_to_list
-        movie = context.user_data.get('pending_movie_tmdb_data')
+        # The TMDB id was saved during handle_add_to_list
+        tmdb_id = context.user_data.get('pending_tmdb_id')
+        movie = tmdb_store.get(tmdb_id) if tmdb_id else None
         if not movie:
             query.answer("❌ Error: Movie data not found")
             return
             
-        title = movie.get("title", "Title not specified")
-        release_year = movie.get("release_date", "")[:4] if movie.get("release_date") else None
-        poster_path = movie.get("poster_path")
-        overview = movie.get("overview")
-        tmdb_id = movie.get("id")
-          # Add to database with basic data (only columns that exist in the table)
-        user_id = supabase.table("users").select("id").eq("chat_id", chat_id).execute().data[0]["id"]
-        movie_data = {
-            "user_id": user_id,
-            "title": title,
-            "category": db_category
-        }
-        # Try to add TMDB ID if the column exists
-        try:
-            supabase.table("movies").select("tmdb_id").limit(1).execute()
-            movie_data["tmdb_id"] = tmdb_id
-        except:
-            pass
-            
-        supabase.table("movies").insert(movie_data).execute()
+        title = movie.title
+        add_tmdb_movie(get_identity(chat_id), movie, db_category)
         
         # Clear pending data
-        context.user_data.pop('pending_movie_tmdb_data', None)
+        context.user_data.pop('pending_tmdb_id', None)
         context.user_data.pop('pending_movie_title', None)
         
         # Send success message with movie details
@@ -280,6 +331,15 @@ def handle_tmdb_category_selection(update: Update, context: CallbackContext, dat
             "Use /list or the menu to see your movies",
             parse_mode='HTML'
         )
+    except repository.DuplicateMovie as e:
+        text, reply_markup = duplicate_reply(e.movie, db_category)
+        query.answer()
+        query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+        context.user_data.pop('pending_tmdb_id', None)
+        context.user_data.pop('pending_movie_title', None)
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable: {e}")
+        query.answer(TMDB_UNAVAILABLE_TEXT)
     except (ValueError, IndexError) as e:
         logging.error(f"Error adding TMDB movie: {e}")
         query.answer("❌ Error adding movie")
@@ -288,6 +348,7 @@ def handle_tmdb_category_selection(update: Update, context: CallbackContext, dat
             parse_mode='HTML'
         )
 
+@menu_router.exact("🎬 Popular Movies")
 def tmdb_popular(update: Update, context: CallbackContext) -> None:
     """Show popular movies from TMDB."""
     TMDB_API_KEY = os.getenv("TMDB_API_KEY")
@@ -296,24 +357,23 @@ def tmdb_popular(update: Update, context: CallbackContext) -> None:
         return
     
     try:
-        url = "https://api.themoviedb.org/3/movie/popular"
-        params = {"api_key": TMDB_API_KEY, "language": "en-US"}
-        r = requests.get(url, params=params)
+        params = {"language": "en-US"}
+        data = tmdb_cache.get_json("movie/popular", params)
         
-        if r.status_code != 200 or not r.json().get("results"):
+        if not data or not start_browsing(context, "movie/popular", params, data):
             update.message.reply_text("Failed to get popular movies.")
             return
         
-        results = r.json()["results"][:10]
-        context.user_data['tmdb_results'] = results
-        context.user_data['current_result_index'] = 0
-        
         # Show popular movies list
         show_movie_list(update, context, "🎬 Popular Movies")
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable: {e}")
+        update.message.reply_text(TMDB_UNAVAILABLE_TEXT)
     except Exception as e:
         logging.error(f"Error getting popular movies: {e}")
         update.message.reply_text("Error occurred while getting popular movies.")
 
+@menu_router.exact("⭐ Top Rated")
 def tmdb_top_rated(update: Update, context: CallbackContext) -> None:
     """Show top rated movies from TMDB."""
     TMDB_API_KEY = os.getenv("TMDB_API_KEY")
@@ -322,28 +382,32 @@ def tmdb_top_rated(update: Update, context: CallbackContext) -> None:
         return
     
     try:
-        url = "https://api.themoviedb.org/3/movie/top_rated"
-        params = {"api_key": TMDB_API_KEY, "language": "en-US"}
-        r = requests.get(url, params=params)
+        params = {"language": "en-US"}
+        data = tmdb_cache.get_json("movie/top_rated", params)
         
-        if r.status_code != 200 or not r.json().get("results"):
+        if not data or not start_browsing(context, "movie/top_rated", params, data):
             update.message.reply_text("Failed to get top rated movies.")
             return
         
-        results = r.json()["results"][:10]
-        context.user_data['tmdb_results'] = results
-        context.user_data['current_result_index'] = 0
-        
         # Show top rated movies list
         show_movie_list(update, context, "⭐ Top Rated Movies")
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable: {e}")
+        update.message.reply_text(TMDB_UNAVAILABLE_TEXT)
     except Exception as e:
         logging.error(f"Error getting top rated movies: {e}")
         update.message.reply_text("Error occurred while getting top rated movies.")
 
 def show_movie_list(update: Update, context: CallbackContext, title: str) -> None:
-    """Helper function to show a list of movies with buttons."""
-    results = context.user_data.get('tmdb_results', [])
-    if not results:
+    """Helper function to show a list of movies with buttons (one page of the result stream)."""
+    start = context.user_data.get('tmdb_list_start', 0)
+    try:
+        ids = tmdb_stream.loaded(context.user_data, start, TMDB_LIST_PAGE_SIZE)
+        has_next = tmdb_stream.has_next(context.user_data, start + len(ids) - 1) if ids else False
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable while loading more results: {e}")
+        ids, has_next = [], False
+    if not ids:
         if update.callback_query:
             update.callback_query.edit_message_text("No results to display.")
         else:
@@ -351,23 +415,25 @@ def show_movie_list(update: Update, context: CallbackContext, title: str) -> Non
         return
 
     context.user_data['list_title'] = title
+    prefetch.schedule(update.effective_user.id, ids[:prefetch.PREFETCH_AHEAD + 1])
     
     msg = f"<b>{title}:</b>\n\nClick on a movie number to see detailed information:\n\n"
     keyboard = []
     row = []
     
-    for i, movie in enumerate(results, 1):
-        title = movie.get("title", "Title not specified")
-        year = movie.get("release_date", "")[:4] if movie.get("release_date") else "Year unknown"
-        rating = movie.get("vote_average", 0)
-        
-        msg += f"<b>{i}</b>. {title} ({year}) - ⭐ {rating:.1f}\n"
+    for i in range(start + 1, start + len(ids) + 1):
+        movie = session_movie(context, i - 1)
+        if movie:
+            msg += f"<b>{i}</b>. {movie.title} ({movie.year or 'Year unknown'}) - ⭐ {movie.rating:.1f}\n"
         
         row.append(InlineKeyboardButton(str(i), callback_data=f"view_movie_{i-1}"))
         
-        if len(row) == 5 or i == len(results):
+        if len(row) == 5 or i == start + len(ids):
             keyboard.append(row)
             row = []
+    nav = page_nav_row("tmdblist", start > 0, has_next)
+    if nav:
+        keyboard.append(nav)
     
     reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -397,6 +463,7 @@ def show_movie_list(update: Update, context: CallbackContext, title: str) -> Non
             reply_markup=reply_markup
         )
 
+@callback_router.prefix("back_to_list")
 def handle_back_to_list(update: Update, context: CallbackContext) -> None:
     """Handle the 'Back to list' button press."""
     query = update.callback_query
@@ -405,8 +472,26 @@ def handle_back_to_list(update: Update, context: CallbackContext) -> None:
     if not list_title:
         query.edit_message_text("Unable to return to list. Please try your search again.")
         return
+    # Back to the list page holding the movie that was open
+    current_index = context.user_data.get('current_result_index', 0)
+    context.user_data['tmdb_list_start'] = current_index - current_index % TMDB_LIST_PAGE_SIZE
+    show_movie_list(update, context, list_title)
+
+@callback_router.prefix("tmdblist_", pass_data=True)
+def handle_tmdb_list_page(update: Update, context: CallbackContext, data: str) -> None:
+    """Handle Prev/Next in a Popular / Top Rated list."""
+    query = update.callback_query
+    query.answer()
+    list_title = context.user_data.get('list_title', '')
+    if not list_title or 'tmdb_stream' not in context.user_data:
+        query.edit_message_text("Unable to show more. Please open the list again.")
+        return
+    start = context.user_data.get('tmdb_list_start', 0)
+    step = TMDB_LIST_PAGE_SIZE if data.endswith("_next") else -TMDB_LIST_PAGE_SIZE
+    context.user_data['tmdb_list_start'] = max(0, start + step)
     show_movie_list(update, context, list_title)
 
+@callback_router.prefix("view_movie_")
 def handle_view_movie(update: Update, context: CallbackContext) -> None:
     """Handle viewing a specific movie from the list."""
     query = update.callback_query
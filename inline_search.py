@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from itertools import count
+import tmdb_cache
+import tmdb_store
+import catalogue
+from tmdb_store import MovieSummary
+from tmdb_client import TMDBUnavailable
+
+# --- As-you-type search for inline queries ---
+# Telegram sends an inline query on every keystroke. A query is answered only once
+# the user has paused for INLINE_DEBOUNCE_MS, and a newer query from the same user
+# supersedes the older one: its timer is cancelled, or its answer is dropped if the
+# search was already running. Results are cached by normalised query. When a
+# shorter query's results were complete (TMDB had no more pages), a longer query
+# is answered by filtering them, with no TMDB call. If TMDB is down, the local
+# catalogue answers with titles only.
+INLINE_DEBOUNCE = int(os.getenv("INLINE_DEBOUNCE_MS", "250")) / 1000
+INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "2048"))
+INLINE_CACHE_TTL = 600
+INLINE_RESULTS = 20
+MIN_QUERY_LENGTH = 2
+# Latency samples kept for the p50/p99 in stats()
+LATENCY_SAMPLES = 1000
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # normalised query -> (summaries, complete, stored_at), least recently used first
+_pending = {}  # user_id -> (generation, Timer or None)
+_generations = count(1)
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+_stats = {"queries": 0, "answered": 0, "superseded": 0, "cache_hits": 0, "prefix_hits": 0,
+          "tmdb_searches": 0, "catalogue_fallbacks": 0, "errors": 0}
+
+def normalize_query(text):
+    """Lowercase, accents stripped, words separated by single spaces."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def _matches(query, title):
+    """True if every word of query starts a word of title (the way a prefix search would match)."""
+    title_words = normalize_query(title).split()
+    return all(any(word.startswith(part) for word in title_words) for part in query.split())
+
+# --- Result cache ---
+def cached(query):
+    """Summaries for query from the cache, or None. Complete results of a shorter query are filtered."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(query)
+        if entry is not None and now - entry[2] < INLINE_CACHE_TTL:
+            _cache.move_to_end(query)
+            _stats["cache_hits"] += 1
+            return entry[0]
+        for length in range(len(query) - 1, MIN_QUERY_LENGTH - 1, -1):
+            entry = _cache.get(query[:length])
+            if entry is not None and entry[1] and now - entry[2] < INLINE_CACHE_TTL:
+                _stats["prefix_hits"] += 1
+                break
+        else:
+            return None
+    summaries = [summary for summary in entry[0] if _matches(query, summary.title)]
+    _store(query, summaries, True)
+    return summaries
+
+def _store(query, summaries, complete):
+    with _lock:
+        _cache[query] = (summaries, complete, time.monotonic())
+        _cache.move_to_end(query)
+        while len(_cache) > INLINE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def search(query):
+    """Summaries for a normalised query: cache, then TMDB, then the local catalogue."""
+    summaries = cached(query)
+    if summaries is not None:
+        return summaries
+    try:
+        data = tmdb_cache.get_json("search/movie", {"query": query, "language": "en-US"}) or {}
+    except TMDBUnavailable as e:
+        logging.warning(f"TMDB unavailable for inline search, using the local catalogue: {e}")
+        with _lock:
+            _stats["catalogue_fallbacks"] += 1
+        # Not cached: TMDB's answer (with posters) is wanted as soon as it is back
+        return [MovieSummary(tmdb_id, title, None, "", 0.0, None)
+                for tmdb_id, title in catalogue.search_titles(query, INLINE_RESULTS)]
+    results = (data.get("results") or [])[:INLINE_RESULTS]
+    # Keep the summaries where the add button will look for them
+    tmdb_store.remember(results)
+    summaries = [MovieSummary.from_result(result) for result in results if result.get("id")]
+    complete = (data.get("total_results") or 0) <= len(results)
+    _store(query, summaries, complete)
+    with _lock:
+        _stats["tmdb_searches"] += 1
+    return summaries
+
+# --- Debounce and supersede ---
+def submit(user_id, text, answer, received_at=None):
+    """Answer a user's inline query text once they stop typing.
+
+    answer(summaries) is called at most once, from a timer thread, unless a newer
+    query from the same user comes first. Cached queries are answered at once.
+    """
+    received_at = received_at or time.monotonic()
+    query = normalize_query(text)
+    generation = next(_generations)
+    with _lock:
+        _stats["queries"] += 1
+        # Whatever is still pending for the user was never answered and never will be
+        previous = _pending.pop(user_id, None)
+        if previous is not None:
+            _stats["superseded"] += 1
+        _pending[user_id] = (generation, None)
+    if previous is not None and previous[1] is not None:
+        previous[1].cancel()
+
+    if len(query) < MIN_QUERY_LENGTH:
+        _finish(user_id, generation, answer, [], received_at)
+        return
+    summaries = cached(query)
+    if summaries is not None:
+        _finish(user_id, generation, answer, summaries, received_at)
+        return
+
+    timer = threading.Timer(INLINE_DEBOUNCE, _run, args=(user_id, generation, query, answer, received_at))
+    timer.daemon = True
+    with _lock:
+        # A newer query may have arrived while this one looked at the cache
+        if _pending.get(user_id, (None,))[0] != generation:
+            return
+        _pending[user_id] = (generation, timer)
+    timer.start()
+
+def _current(user_id, generation):
+    with _lock:
+        entry = _pending.get(user_id)
+        return entry is not None and entry[0] == generation
+
+def _run(user_id, generation, query, answer, received_at):
+    if not _current(user_id, generation):
+        return
+    try:
+        summaries = search(query)
+    except Exception as e:
+        logging.error(f"Inline search for {query!r} failed: {e}")
+        with _lock:
+            _stats["errors"] += 1
+        summaries = []
+    _finish(user_id, generation, answer, summaries, received_at)
+
+def _finish(user_id, generation, answer, summaries, received_at):
+    with _lock:
+        if _pending.get(user_id, (None,))[0] != generation:
+            # The user kept typing meanwhile: a newer query owns the reply
+            return
+        del _pending[user_id]
+    try:
+        answer(summaries)
+    except Exception as e:
+        logging.warning(f"Answering inline query failed: {e}")
+        with _lock:
+            _stats["errors"] += 1
+        return
+    with _lock:
+        _stats["answered"] += 1
+        _latencies.append(time.monotonic() - received_at)
+
+def stats():
+    with _lock:
+        stats = dict(_stats, cached=len(_cache), pending=len(_pending))
+        latencies = sorted(_latencies)
+    stats["p50_ms"] = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+    stats["p99_ms"] = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    return stats
+
+def clear():
+    with _lock:
+        _cache.clear()
+        _latencies.clear()
@@ -1,8 +1,3 @@
-import os
-import uuid
-import random
-import logging
-from dotenv import load_dotenv
 from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
 # --- Keyboard layouts ---
@@ -24,3 +19,12 @@ def edit_delete_inline_keyboard(movie_id):
             InlineKeyboardButton("❌ Delete Movie", callback_data=f"delete_{movie_id}")
         ]
     ])
+
+def page_nav_row(prefix, has_prev, has_next):
+    """Prev/Next buttons for a paginated view; callback data is '<prefix>_prev' / '<prefix>_next'."""
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"{prefix}_prev"))
+    if has_next:
+        row.append(InlineKeyboardButton("➡️ Next", callback_data=f"{prefix}_next"))
+    return row
@@ -0,0 +1,263 @@
+import os
+import logging
+import weakref
+import threading
+import contextvars
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+# --- Latency and external-call metrics ---
+# Every menu and callback route (router.py) records a latency histogram and an
+# error count. Any Supabase or TMDB call made while a route runs is counted
+# against that route, with its duration. The routes know which one is running
+# through a context variable. Supabase calls are seen through httpx event hooks
+# on the PostgREST session, TMDB calls in tmdb_client. Each thread records into
+# its own shard without taking a lock, and render() adds the shards up, so this
+# is cheap enough to leave on. When a thread ends, its shard is folded into one
+# shared total, so short-lived threads don't pile up. METRICS_PORT serves
+# everything in Prometheus text format on METRICS_HOST (local only by default).
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "moviemate"
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+class RouteStats:
+    """One thread's record of a route: latency, errors, external calls."""
+    __slots__ = ("latency", "errors", "max_seconds", "calls")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.max_seconds = 0.0
+        self.calls = {}  # service -> [calls, seconds]
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.errors += other.errors
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        for service, (calls, seconds) in list(other.calls.items()):
+            entry = self.calls.setdefault(service, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+
+class RouteKey:
+    """Identifies a route's metrics; the numbers themselves live in the thread shards."""
+    __slots__ = ()
+
+class _Shard:
+    __slots__ = ("routes", "services")
+
+    def __init__(self):
+        self.routes = {}  # RouteKey -> RouteStats
+        self.services = {}  # service -> Histogram of call durations
+
+    def merge(self, other):
+        for key, stats in list(other.routes.items()):
+            self.routes.setdefault(key, RouteStats()).merge(stats)
+        for service, histogram in list(other.services.items()):
+            self.services.setdefault(service, Histogram()).merge(histogram)
+
+class _ThreadExit:
+    """Lives only in a thread's locals; its finalizer runs when the thread ends."""
+    __slots__ = ("__weakref__",)
+
+_local = threading.local()
+_shards = []  # the shards of live threads
+_retired = _Shard()  # everything recorded by threads that have ended, so counters never go back
+# Reentrant: a thread's exit (and with it _retire) may happen wherever the interpreter frees its locals
+_shards_lock = threading.RLock()
+_current = contextvars.ContextVar("metrics_route", default=None)
+_routers = []
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard()
+        _local.exit = _ThreadExit()
+        weakref.finalize(_local.exit, _retire, shard)
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+def _retire(shard):
+    """Fold an ended thread's shard into the shared total."""
+    with _shards_lock:
+        _retired.merge(shard)
+        _shards.remove(shard)
+
+def register_router(router):
+    """Export the router's routes; router.routes() must yield objects with .key and .metrics (a RouteKey)."""
+    _routers.append(router)
+
+def enter(key):
+    """Make key the route external calls are counted against; returns a token for leave()."""
+    return _current.set(key)
+
+# leave() and record_call() run on every update: histograms are updated inline
+def leave(key, token, seconds, failed=False):
+    _current.reset(token)
+    routes = _shard().routes
+    stats = routes.get(key)
+    if stats is None:
+        stats = routes[key] = RouteStats()
+    latency = stats.latency
+    latency.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    latency.sum += seconds
+    latency.count += 1
+    if seconds > stats.max_seconds:
+        stats.max_seconds = seconds
+    if failed:
+        stats.errors += 1
+
+def record_call(service, seconds):
+    """One call to an external service (e.g. 'supabase', 'tmdb') took `seconds`."""
+    shard = _shard()
+    histogram = shard.services.get(service)
+    if histogram is None:
+        histogram = shard.services[service] = Histogram()
+    histogram.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram.sum += seconds
+    histogram.count += 1
+    key = _current.get()
+    if key is not None:
+        stats = shard.routes.get(key)
+        if stats is None:
+            stats = shard.routes[key] = RouteStats()
+        entry = stats.calls.get(service)
+        if entry is None:
+            entry = stats.calls[service] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+def merged(key):
+    """A route's RouteStats added up over all threads."""
+    total = RouteStats()
+    # Under the lock, so a shard being retired is counted exactly once
+    with _shards_lock:
+        for shard in _shards + [_retired]:
+            stats = shard.routes.get(key)
+            if stats is not None:
+                total.merge(stats)
+    return total
+
+def snapshot(key):
+    """(hits, errors, total seconds, max seconds) of a route."""
+    stats = merged(key)
+    return stats.latency.count, stats.errors, stats.latency.sum, stats.max_seconds
+
+def thread_calls():
+    """service -> calls recorded by the current thread so far (e.g. to count one operation's round trips)."""
+    return {service: histogram.count for service, histogram in list(_shard().services.items())}
+
+def _services():
+    totals = {}
+    with _shards_lock:
+        for shard in _shards + [_retired]:
+            for service, histogram in list(shard.services.items()):
+                totals.setdefault(service, Histogram()).merge(histogram)
+    return totals
+
+# --- httpx instrumentation ---
+def instrument_httpx(client, service):
+    """Record every request of an httpx.Client as a call to `service`."""
+    def on_request(request):
+        request.extensions["metrics_started"] = perf_counter()
+
+    def on_response(response):
+        started = response.request.extensions.get("metrics_started")
+        if started is not None:
+            record_call(service, perf_counter() - started)
+
+    client.event_hooks["request"].append(on_request)
+    client.event_hooks["response"].append(on_response)
+
+# --- Prometheus text format ---
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _histogram_lines(name, labels, histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    route_lines, error_lines, call_lines, call_seconds_lines, service_lines = [], [], [], [], []
+    for router in _routers:
+        for route in router.routes():
+            stats = merged(route.metrics)
+            labels = f'router="{_label(router.name)}",route="{_label(route.key)}"'
+            route_lines += _histogram_lines(f"{PREFIX}_route_duration_seconds", labels, stats.latency)
+            error_lines.append(f"{PREFIX}_route_errors_total{{{labels}}} {stats.errors}")
+            for service, (calls, seconds) in sorted(stats.calls.items()):
+                call_lines.append(f'{PREFIX}_route_external_calls_total{{{labels},service="{service}"}} {calls}')
+                call_seconds_lines.append(
+                    f'{PREFIX}_route_external_seconds_total{{{labels},service="{service}"}} {seconds:.6f}')
+    for service, histogram in sorted(_services().items()):
+        service_lines += _histogram_lines(f"{PREFIX}_external_call_duration_seconds",
+                                          f'service="{service}"', histogram)
+    lines = [
+        f"# HELP {PREFIX}_route_duration_seconds Time spent handling an update in a menu or callback route.",
+        f"# TYPE {PREFIX}_route_duration_seconds histogram",
+        *route_lines,
+        f"# HELP {PREFIX}_route_errors_total Route calls that raised.",
+        f"# TYPE {PREFIX}_route_errors_total counter",
+        *error_lines,
+        f"# HELP {PREFIX}_route_external_calls_total Supabase and TMDB calls made by a route.",
+        f"# TYPE {PREFIX}_route_external_calls_total counter",
+        *call_lines,
+        f"# HELP {PREFIX}_route_external_seconds_total Time a route spent in Supabase and TMDB calls.",
+        f"# TYPE {PREFIX}_route_external_seconds_total counter",
+        *call_seconds_lines,
+        f"# HELP {PREFIX}_external_call_duration_seconds Duration of calls to external services.",
+        f"# TYPE {PREFIX}_external_call_duration_seconds histogram",
+        *service_lines,
+    ]
+    return "\n".join(lines) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve GET /metrics from a daemon thread. Returns the server, or None if no port is set."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
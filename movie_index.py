@@ -0,0 +1,107 @@
+import os
+import threading
+from cachetools import TTLCache
+from utils import normalize_title
+
+# --- Per-household index of the movies already on the list ---
+# Normalised title -> movies and TMDB id -> movie, so adding a movie can tell in
+# O(1) whether the household already has it. Two different TMDB ids are two movies
+# even under one title (remakes), so titles only decide when one side has no TMDB id. An index is loaded with one query
+# the first time a household adds something. After that it is kept up to date by
+# the repository's writes. The TTL bounds drift from other bot processes.
+# The unique indexes in sql/005_movie_dedupe.sql remain the final word.
+MOVIE_INDEX_SIZE = int(os.getenv("MOVIE_INDEX_SIZE", "2000"))
+MOVIE_INDEX_TTL = int(os.getenv("MOVIE_INDEX_TTL", "600"))
+
+class HouseholdIndex:
+    __slots__ = ("titles", "tmdb_ids", "movies")
+
+    def __init__(self, rows=()):
+        self.titles = {}  # normalised title -> ids of the movies listed under it
+        self.tmdb_ids = {}  # tmdb id -> movie id
+        self.movies = {}  # movie id -> {'id', 'title', 'category', 'tmdb_id'}
+        for row in rows:
+            self.add(row)
+
+    def add(self, row):
+        movie = {"id": row["id"], "title": row["title"], "category": row["category"], "tmdb_id": row.get("tmdb_id")}
+        self.remove(movie["id"])
+        self.movies[movie["id"]] = movie
+        self.titles.setdefault(normalize_title(movie["title"]), []).append(movie["id"])
+        if movie["tmdb_id"]:
+            self.tmdb_ids[movie["tmdb_id"]] = movie["id"]
+
+    def update(self, movie_id, **values):
+        movie = self.movies.get(movie_id)
+        if movie is not None:
+            self.add(dict(movie, **values))
+
+    def remove(self, movie_id):
+        movie = self.movies.pop(movie_id, None)
+        if movie is None:
+            return
+        key = normalize_title(movie["title"])
+        listed = self.titles.get(key, [])
+        if movie_id in listed:
+            listed.remove(movie_id)
+            if not listed:
+                del self.titles[key]
+        if movie["tmdb_id"] and self.tmdb_ids.get(movie["tmdb_id"]) == movie_id:
+            del self.tmdb_ids[movie["tmdb_id"]]
+
+    def find(self, title, tmdb_id=None):
+        """The listed movie with the same TMDB id, or the same normalised title if either has no TMDB id; else None."""
+        movie_id = self.tmdb_ids.get(tmdb_id) if tmdb_id else None
+        if movie_id is not None:
+            return self.movies[movie_id]
+        for movie_id in self.titles.get(normalize_title(title), ()):
+            movie = self.movies[movie_id]
+            if not tmdb_id or not movie["tmdb_id"]:
+                return movie
+        return None
+
+_indexes = TTLCache(maxsize=MOVIE_INDEX_SIZE, ttl=MOVIE_INDEX_TTL)
+_lock = threading.Lock()
+_stats = {"lookups": 0, "loads": 0, "duplicates": 0}
+
+def find(household_id, title, tmdb_id, load):
+    """Duplicate of (title, tmdb_id) on the household's list, or None. load() returns the list's rows on a miss."""
+    with _lock:
+        index = _indexes.get(household_id)
+        _stats["lookups"] += 1
+    if index is None:
+        index = HouseholdIndex(load())
+        with _lock:
+            _indexes[household_id] = index
+            _stats["loads"] += 1
+    with _lock:
+        movie = index.find(title, tmdb_id)
+        if movie is not None:
+            _stats["duplicates"] += 1
+        return dict(movie) if movie is not None else None
+
+def added(row):
+    with _lock:
+        index = _indexes.get(row.get("household_id"))
+        if index is not None:
+            index.add(row)
+
+def updated(household_id, movie_id, **values):
+    with _lock:
+        index = _indexes.get(household_id)
+        if index is not None:
+            index.update(movie_id, **values)
+
+def removed(household_id, movie_id):
+    with _lock:
+        index = _indexes.get(household_id)
+        if index is not None:
+            index.remove(movie_id)
+
+def invalidate(household_id):
+    with _lock:
+        _indexes.pop(household_id, None)
+
+def stats():
+    with _lock:
+        return dict(_stats, households=len(_indexes))
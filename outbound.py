@@ -0,0 +1,263 @@
+import os
+import time
+import asyncio
+import bisect
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from itertools import count
+from cachetools import TTLCache
+from telegram.error import RetryAfter, NetworkError
+from telegram.ext import ExtBot
+
+# --- Outbound Telegram rate limiting ---
+# Every call that posts, edits or deletes a message waits for a token from three
+# buckets: its chat (~1/s, a short burst allowed), groups (~20/min) and the whole
+# bot (~30/s). Waiting calls are served by priority, then in order. Interactive
+# replies go first and background sends (jobs, notifications) wait behind them.
+# Calls for one chat keep their order. A 429 pauses the chat (or, for calls with
+# no chat, the whole bot) for retry_after seconds, and the call is retried once
+# the pause is over.
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_GROUP_PER_MINUTE = float(os.getenv("SEND_GROUP_PER_MINUTE", "20"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_QUEUE_TIMEOUT = float(os.getenv("SEND_QUEUE_TIMEOUT", "30"))
+SEND_MAX_RETRIES = 2
+# An idle chat's bucket refills completely within this, so dropping it loses nothing
+CHAT_BUCKET_TTL = 60
+CHAT_BUCKETS = 50000
+WAIT_SAMPLES = 1000
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+LIMITED_METHODS = frozenset((
+    "sendMessage", "sendPhoto", "sendMediaGroup", "sendDocument", "sendAnimation", "sendVideo",
+    "sendSticker", "sendPoll", "sendLocation", "copyMessage", "forwardMessage",
+    "editMessageText", "editMessageMedia", "editMessageCaption", "editMessageReplyMarkup", "deleteMessage",
+))
+
+_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+@contextmanager
+def background():
+    """Sends made inside this block wait behind interactive replies."""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def background_job(callback):
+    """Mark a JobQueue callback's sends as background traffic."""
+    def job(context):
+        with background():
+            return callback(context)
+    job.__name__ = getattr(callback, "__name__", "job")
+    return job
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def available(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def wait(self, now):
+        """Seconds until a token is available."""
+        tokens = self.available(now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class Ticket:
+    __slots__ = ("chat_id", "priority", "seq", "queued_at")
+
+    def __init__(self, chat_id, priority, seq, queued_at):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.queued_at = queued_at
+
+    @property
+    def key(self):
+        return (self.priority, self.seq)
+
+class SendLimiter:
+    """Token buckets per chat and for the whole bot, with a priority queue of waiting sends."""
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE,
+                 group_rate=SEND_GROUP_PER_MINUTE / 60, chat_burst=SEND_CHAT_BURST):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        # No burst for the bot as a whole: sends are spaced evenly within each second
+        self._global = TokenBucket(global_rate, 1, time.monotonic())
+        self._chats = TTLCache(maxsize=CHAT_BUCKETS, ttl=CHAT_BUCKET_TTL)
+        self._paused = {}  # chat_id (None: every chat) -> monotonic time the pause ends
+        self._waiting = []  # Tickets sorted by (priority, seq)
+        self._seq = count()
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {"sent": 0, "throttled": 0, "retry_after": 0, "timeouts": 0,
+                       "interactive": 0, "background": 0}
+
+    # --- Caller must hold _cond ---
+    def _bucket(self, chat_id, now):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Group and channel ids are negative
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = TokenBucket(rate, self.chat_burst, now)
+        # Setting it again restarts its TTL: only idle chats' buckets expire
+        self._chats[chat_id] = bucket
+        return bucket
+
+    def _pause(self, chat_id, now):
+        until = self._paused.get(chat_id)
+        if until is not None and until <= now:
+            del self._paused[chat_id]
+            return 0.0
+        return until - now if until is not None else 0.0
+
+    def _chat_wait(self, chat_id, now):
+        if chat_id is None:
+            return self._pause(None, now)
+        return max(self._bucket(chat_id, now).wait(now), self._pause(chat_id, now), self._pause(None, now))
+
+    def _poll(self, ticket, now):
+        """0 if the ticket may go now (its tokens are taken), else seconds to wait."""
+        wait = max(self._chat_wait(ticket.chat_id, now), self._global.wait(now))
+        ready_ahead = 0
+        for other in self._waiting:
+            if other is ticket:
+                break
+            if other.chat_id is not None and other.chat_id == ticket.chat_id:
+                # An earlier send to the same chat goes first
+                return max(wait, 0.01)
+            if self._chat_wait(other.chat_id, now) == 0:
+                ready_ahead += 1
+        if wait > 0:
+            return wait
+        if ready_ahead and self._global.available(now) < ready_ahead + 1:
+            # Global tokens go to the ready sends ahead of this one
+            return (ready_ahead + 1 - self._global.tokens) / self._global.rate
+        if ticket.chat_id is not None:
+            self._bucket(ticket.chat_id, now).take()
+        self._global.take()
+        self._waiting.remove(ticket)
+        waited = now - ticket.queued_at
+        self._waits.append(waited)
+        self._stats["sent"] += 1
+        self._stats["background" if ticket.priority == BACKGROUND else "interactive"] += 1
+        if waited > 0.001:
+            self._stats["throttled"] += 1
+        self._cond.notify_all()
+        return 0.0
+
+    def _enqueue(self, chat_id, priority):
+        ticket = Ticket(chat_id, _priority.get() if priority is None else priority, next(self._seq), time.monotonic())
+        bisect.insort(self._waiting, ticket, key=lambda t: t.key)
+        return ticket
+
+    def _cancel(self, ticket):
+        self._waiting.remove(ticket)
+        self._stats["timeouts"] += 1
+        self._cond.notify_all()
+
+    # --- Public API ---
+    def acquire(self, chat_id, priority=None, timeout=SEND_QUEUE_TIMEOUT):
+        """Block until a send to chat_id (None for inline messages) may go out."""
+        with self._cond:
+            ticket = self._enqueue(chat_id, priority)
+            deadline = ticket.queued_at + timeout
+            while True:
+                now = time.monotonic()
+                wait = self._poll(ticket, now)
+                if wait == 0:
+                    return
+                if now + wait > deadline:
+                    self._cancel(ticket)
+                    raise NetworkError(f"send to chat {chat_id} waited more than {timeout:.0f}s for the rate limiter")
+                self._cond.wait(wait)
+
+    async def acquire_async(self, chat_id, priority=None, timeout=SEND_QUEUE_TIMEOUT):
+        """acquire() for coroutines: sleeps on the event loop instead of blocking it."""
+        with self._cond:
+            ticket = self._enqueue(chat_id, priority)
+        deadline = ticket.queued_at + timeout
+        while True:
+            now = time.monotonic()
+            with self._cond:
+                wait = self._poll(ticket, now)
+                if wait == 0:
+                    return
+                if now + wait > deadline:
+                    self._cancel(ticket)
+                    raise NetworkError(f"send to chat {chat_id} waited more than {timeout:.0f}s for the rate limiter")
+            await asyncio.sleep(min(wait, 0.05))
+
+    def retry_after(self, chat_id, seconds):
+        """Telegram answered 429: pause the chat (None: every chat) for `seconds`."""
+        with self._cond:
+            until = time.monotonic() + seconds
+            self._paused[chat_id] = max(until, self._paused.get(chat_id, 0.0))
+            self._stats["retry_after"] += 1
+        logging.warning(f"Telegram flood limit: {'chat ' + str(chat_id) if chat_id is not None else 'all chats'} "
+                        f"paused for {seconds}s")
+
+    def stats(self):
+        """Queue depth by priority and how long sends waited for a token."""
+        with self._cond:
+            stats = dict(self._stats, queue_depth=len(self._waiting),
+                         queued_background=sum(1 for t in self._waiting if t.priority == BACKGROUND),
+                         paused_chats=len(self._paused))
+            waits = sorted(self._waits)
+        stats["avg_wait_ms"] = sum(waits) / len(waits) * 1000 if waits else 0.0
+        stats["p99_wait_ms"] = waits[int(len(waits) * 0.99)] * 1000 if waits else 0.0
+        return stats
+
+limiter = SendLimiter()
+
+def chat_of(data):
+    """The numeric chat id a Bot API call is addressed to, or None (inline messages, @channel names)."""
+    chat_id = (data or {}).get("chat_id")
+    try:
+        return int(chat_id) if chat_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class RateLimitedBot(ExtBot):
+    """ExtBot whose message sends, edits and deletes go through the limiter.
+
+    Handlers keep calling reply_text() and friends as before; the call blocks
+    until a token is free and returns Telegram's answer.
+    """
+
+    def __init__(self, *args, limiter=limiter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_limiter = limiter
+
+    def _post(self, endpoint, data=None, *args, **kwargs):
+        if endpoint not in LIMITED_METHODS:
+            return super()._post(endpoint, data, *args, **kwargs)
+        chat_id = chat_of(data)
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            self.send_limiter.acquire(chat_id)
+            try:
+                return super()._post(endpoint, data, *args, **kwargs)
+            except RetryAfter as e:
+                self.send_limiter.retry_after(chat_id, e.retry_after)
+                if attempt == SEND_MAX_RETRIES:
+                    raise
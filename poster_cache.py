@@ -0,0 +1,172 @@
+import io
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from telegram.error import BadRequest
+import tmdb_client
+
+# --- Telegram file_id cache for TMDB posters ---
+# The first time a poster is sent, Telegram downloads it from image.tmdb.org and
+# returns a file_id; every later send of the same (tmdb_id, size) reuses that
+# file_id, so Telegram serves the photo from its own storage. The mapping is kept
+# in SQLite so it survives restarts. Posters without a file_id yet can be warmed
+# ahead of time (see prefetch.py): their bytes are downloaded into a bounded
+# in-memory cache and uploaded instead of making Telegram fetch the URL.
+POSTER_DB = os.getenv("POSTER_DB", "posters.db")
+POSTER_BYTES_BUDGET = int(os.getenv("POSTER_BYTES_BUDGET_MB", "32")) * 1024 * 1024
+POSTER_SIZE = "w500"
+TMDB_IMAGE_BASE_URL = os.getenv("TMDB_IMAGE_BASE_URL", "https://image.tmdb.org/t/p")
+
+_file_ids = None  # (tmdb_id, size) -> file_id, loaded on first use
+_conn = None
+_lock = threading.Lock()
+_bytes = OrderedDict()  # (tmdb_id, size) -> downloaded poster, least recently used first
+_bytes_total = 0
+_stats = {"hits": 0, "misses": 0, "stale_ids": 0, "prefetched_sends": 0, "warmed": 0,
+          "hit_seconds": 0.0, "miss_seconds": 0.0}
+
+def poster_url(poster_path, size=POSTER_SIZE):
+    return f"{TMDB_IMAGE_BASE_URL}/{size}{poster_path}"
+
+def _load():
+    """Open the database and read every known file_id. Caller must hold _lock."""
+    global _file_ids, _conn
+    if _file_ids is not None:
+        return
+    _file_ids = {}
+    if not POSTER_DB:
+        return
+    try:
+        _conn = sqlite3.connect(POSTER_DB, check_same_thread=False, isolation_level=None)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS posters ("
+            "tmdb_id INTEGER NOT NULL, size TEXT NOT NULL, file_id TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (tmdb_id, size))"
+        )
+        for tmdb_id, size, file_id in _conn.execute("SELECT tmdb_id, size, file_id FROM posters"):
+            _file_ids[(tmdb_id, size)] = file_id
+        logging.info(f"Poster cache: {len(_file_ids)} file_ids loaded from {POSTER_DB}")
+    except sqlite3.Error as e:
+        logging.warning(f"Poster cache database unavailable, keeping file_ids in memory only: {e}")
+        _conn = None
+
+def lookup(tmdb_id, size=POSTER_SIZE):
+    with _lock:
+        _load()
+        return _file_ids.get((tmdb_id, size))
+
+def remember(tmdb_id, size, file_id):
+    with _lock:
+        _load()
+        if _file_ids.get((tmdb_id, size)) == file_id:
+            return
+        _file_ids[(tmdb_id, size)] = file_id
+        if _conn is not None:
+            _conn.execute(
+                "INSERT OR REPLACE INTO posters (tmdb_id, size, file_id, updated_at) VALUES (?, ?, ?, ?)",
+                (tmdb_id, size, file_id, time.time()),
+            )
+
+def forget(tmdb_id, size=POSTER_SIZE):
+    with _lock:
+        _load()
+        _file_ids.pop((tmdb_id, size), None)
+        if _conn is not None:
+            _conn.execute("DELETE FROM posters WHERE tmdb_id = ? AND size = ?", (tmdb_id, size))
+
+def warm(tmdb_id, poster_path, size=POSTER_SIZE):
+    """Download a poster that has no file_id yet, so its first send needn't wait for TMDB."""
+    global _bytes_total
+    key = (tmdb_id, size)
+    with _lock:
+        _load()
+        if key in _file_ids or key in _bytes:
+            return
+    data = tmdb_client.get_image(poster_url(poster_path, size))
+    if not data or len(data) > POSTER_BYTES_BUDGET:
+        return
+    with _lock:
+        if key in _bytes:
+            return
+        _bytes[key] = data
+        _bytes_total += len(data)
+        _stats["warmed"] += 1
+        while _bytes_total > POSTER_BYTES_BUDGET:
+            _, dropped = _bytes.popitem(last=False)
+            _bytes_total -= len(dropped)
+
+def _take_bytes(key):
+    global _bytes_total
+    with _lock:
+        data = _bytes.pop(key, None)
+        if data is not None:
+            _bytes_total -= len(data)
+        return data
+
+def _photo_file_id(message):
+    """file_id of the largest photo size in a sent message, if any."""
+    photos = getattr(message, "photo", None)
+    return photos[-1].file_id if photos else None
+
+# Telegram's answers for a file_id it no longer knows (or never issued to this bot)
+STALE_FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "invalid file")
+
+def _stale_file_id(error):
+    message = error.message.lower()
+    return any(text in message for text in STALE_FILE_ID_ERRORS)
+
+def send_poster(tmdb_id, poster_path, send, size=POSTER_SIZE):
+    """Call send(photo) with the cached file_id, else the warmed bytes, else the TMDB URL.
+
+    send is e.g. `lambda photo: update.message.reply_photo(photo=photo, ...)`; its result
+    (the sent Message) provides the file_id for next time.
+    """
+    file_id = lookup(tmdb_id, size)
+    if file_id:
+        started = time.perf_counter()
+        try:
+            result = send(file_id)
+        except BadRequest as e:
+            # Anything else (a bad caption, a deleted chat) is not the file_id's fault
+            if not _stale_file_id(e):
+                raise
+            # Telegram no longer knows the file: fall back to the URL and record a new one
+            logging.warning(f"Cached poster file_id for TMDB {tmdb_id} rejected: {e}")
+            forget(tmdb_id, size)
+            with _lock:
+                _stats["stale_ids"] += 1
+        else:
+            with _lock:
+                _stats["hits"] += 1
+                _stats["hit_seconds"] += time.perf_counter() - started
+            return result
+
+    data = _take_bytes((tmdb_id, size))
+    started = time.perf_counter()
+    result = send(io.BytesIO(data) if data else poster_url(poster_path, size))
+    with _lock:
+        _stats["misses"] += 1
+        if data:
+            _stats["prefetched_sends"] += 1
+        _stats["miss_seconds"] += time.perf_counter() - started
+    file_id = _photo_file_id(result)
+    if file_id:
+        remember(tmdb_id, size, file_id)
+    return result
+
+def stats():
+    """Hit ratio, average send latency per path and the time saved by file_id hits."""
+    with _lock:
+        stats = dict(_stats, size=len(_file_ids or ()), warm_bytes=_bytes_total)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / total if total else 0.0
+    stats["avg_hit_ms"] = stats["hit_seconds"] * 1000 / stats["hits"] if stats["hits"] else 0.0
+    stats["avg_miss_ms"] = stats["miss_seconds"] * 1000 / stats["misses"] if stats["misses"] else 0.0
+    if stats["hits"] and stats["misses"]:
+        stats["saved_ms"] = max(0.0, stats["avg_miss_ms"] - stats["avg_hit_ms"]) * stats["hits"]
+    else:
+        stats["saved_ms"] = 0.0
+    return stats
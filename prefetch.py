@@ -0,0 +1,93 @@
+import os
+import logging
+import threading
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+import tmdb_store
+import poster_cache
+
+# --- Look-ahead prefetch for TMDB browsing ---
+# While a user reads one result, the summaries and posters of its neighbours are
+# warmed on a small pool. Each user has at most one batch in flight. A new batch
+# replaces the old one, and leaving the browse flow cancels it. Prefetching is
+# best effort: when the pool already has PREFETCH_MAX_PENDING tasks, more are dropped.
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", "64"))
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "2"))
+PREFETCH_BEHIND = 1
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+_lock = threading.Lock()
+_batches = {}  # user_id -> (generation, [futures])
+_generations = count(1)
+_pending = 0
+_stats = {"scheduled": 0, "warmed": 0, "cancelled": 0, "dropped": 0, "failed": 0}
+
+def around(user_id, tmdb_ids, index):
+    """Warm the results next to tmdb_ids[index] for the user."""
+    wanted = [tmdb_ids[i] for i in range(index + 1, index + 1 + PREFETCH_AHEAD) if i < len(tmdb_ids)]
+    wanted += [tmdb_ids[i] for i in range(index - PREFETCH_BEHIND, index) if i >= 0]
+    schedule(user_id, wanted)
+
+def schedule(user_id, tmdb_ids):
+    """Replace the user's prefetch batch with one warming tmdb_ids, nearest first."""
+    global _pending
+    cancel(user_id)
+    generation = next(_generations)
+    futures = []
+    with _lock:
+        _batches[user_id] = (generation, futures)
+        for tmdb_id in tmdb_ids:
+            if _pending >= PREFETCH_MAX_PENDING:
+                _stats["dropped"] += 1
+                continue
+            _pending += 1
+            _stats["scheduled"] += 1
+            future = _executor.submit(_warm, user_id, generation, tmdb_id)
+            futures.append(future)
+    for future in futures:
+        future.add_done_callback(_log_failure)
+        future.add_done_callback(lambda f, user_id=user_id, generation=generation: _done(user_id, generation))
+
+def cancel(user_id):
+    """Forget the user's batch: queued tasks are cancelled, running ones stop at their next step."""
+    with _lock:
+        _, futures = _batches.pop(user_id, (None, ()))
+    cancelled = sum(1 for future in futures if future.cancel())
+    if cancelled:
+        with _lock:
+            _stats["cancelled"] += cancelled
+
+def _wanted(user_id, generation):
+    with _lock:
+        batch = _batches.get(user_id)
+        return batch is not None and batch[0] == generation
+
+def _warm(user_id, generation, tmdb_id):
+    if not _wanted(user_id, generation):
+        return
+    summary = tmdb_store.get(tmdb_id)
+    if summary is None or not summary.poster_path or not _wanted(user_id, generation):
+        return
+    poster_cache.warm(tmdb_id, summary.poster_path)
+    with _lock:
+        _stats["warmed"] += 1
+
+def _done(user_id, generation):
+    global _pending
+    with _lock:
+        _pending -= 1
+        batch = _batches.get(user_id)
+        # Drop finished batches so idle users leave nothing behind
+        if batch is not None and batch[0] == generation and all(f.done() for f in batch[1]):
+            del _batches[user_id]
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.warning(f"Prefetch failed: {future.exception()}")
+        with _lock:
+            _stats["failed"] += 1
+
+def stats():
+    with _lock:
+        return dict(_stats, pending=_pending, users=len(_batches))
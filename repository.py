@@ -0,0 +1,231 @@
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+import schema
+import movie_index
+from db import supabase, scope_movies, new_movie_row, household_key, current_unit as _current, execute
+
+# --- Request-scoped data access (unit of work) ---
+# Handlers go through these operations instead of building supabase.table(...) chains.
+# While an update is handled (see per_update) reads are memoised, only the listed
+# columns are fetched, and queued inserts are sent as one bulk insert per table when
+# the update finishes or flush() is called. Outside a unit every call goes straight
+# to Supabase.
+MOVIE_COLUMNS = "id, title, category"
+USER_COLUMNS = "id, chat_id, partner_id, household_id"
+UNIQUE_VIOLATION = "23505"
+UNKNOWN_COLUMN = ("PGRST204", "42703")
+
+class DuplicateMovie(Exception):
+    """The household already has this movie; .movie is the listed one {'id', 'title', 'category', 'tmdb_id'}."""
+
+    def __init__(self, movie):
+        super().__init__(f"'{movie['title']}' is already in {movie['category']}")
+        self.movie = movie
+
+class UnitOfWork:
+    __slots__ = ("reads", "inserts", "round_trips", "memo_hits")
+
+    def __init__(self):
+        self.reads = {}
+        self.inserts = {}  # table -> rows waiting for flush()
+        self.round_trips = 0
+        self.memo_hits = 0
+
+_stats_lock = threading.Lock()
+_stats = {"units": 0, "round_trips": 0, "memo_hits": 0, "batched_rows": 0}
+
+@contextmanager
+def unit_of_work():
+    """Open a unit of work for the current update, or join the one already open."""
+    uow = _current.get()
+    if uow is not None:
+        yield uow
+        return
+    uow = UnitOfWork()
+    token = _current.set(uow)
+    try:
+        yield uow
+        flush()
+    finally:
+        _current.reset(token)
+        if uow.inserts:
+            logging.warning(f"Dropped {sum(map(len, uow.inserts.values()))} queued inserts after an error")
+        with _stats_lock:
+            _stats["units"] += 1
+            _stats["round_trips"] += uow.round_trips
+            _stats["memo_hits"] += uow.memo_hits
+
+def per_update(handler):
+    """Run a PTB handler callback inside its own unit of work."""
+    @wraps(handler)
+    def callback(*args, **kwargs):
+        with unit_of_work():
+            return handler(*args, **kwargs)
+    return callback
+
+def stats():
+    """Round trips per update and memoised reads since startup."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["round_trips_per_update"] = stats["round_trips"] / stats["units"] if stats["units"] else 0.0
+    return stats
+
+def _execute(query):
+    return execute(query).data
+
+def _memo(key, load):
+    uow = _current.get()
+    if uow is None:
+        return load()
+    if key in uow.reads:
+        uow.memo_hits += 1
+        return uow.reads[key]
+    value = uow.reads[key] = load()
+    return value
+
+def _remember(key, value):
+    uow = _current.get()
+    if uow is not None:
+        uow.reads[key] = value
+
+def _project(row, columns):
+    return {name: row.get(name) for name in columns.replace(" ", "").split(",")} if row else None
+
+# --- Movies ---
+def get_movie(identity, movie_id):
+    """The household's movie {'id', 'title', 'category'}, or None if it has no such movie."""
+    def load():
+        query = supabase.table("movies").select(MOVIE_COLUMNS).eq("id", movie_id)
+        rows = _execute(scope_movies(query, identity))
+        return rows[0] if rows else None
+    return _memo(("movie", household_key(identity), movie_id), load)
+
+def rename_movie(identity, movie_id, title):
+    """Set a movie's title. Returns the updated movie, or None if the household has no such movie."""
+    return _update_movie(identity, movie_id, {"title": title})
+
+def set_movie_category(identity, movie_id, category):
+    """Move a movie to another list. Returns the updated movie, or None if the household has no such movie."""
+    return _update_movie(identity, movie_id, {"category": category})
+
+def _update_movie(identity, movie_id, values):
+    rows = _execute(scope_movies(supabase.table("movies").update(values).eq("id", movie_id), identity))
+    movie = _project(rows[0], MOVIE_COLUMNS) if rows else None
+    _remember(("movie", household_key(identity), movie_id), movie)
+    if movie and identity.get("household_id"):
+        movie_index.updated(identity["household_id"], movie_id, **values)
+    return movie
+
+def delete_movie(identity, movie_id):
+    """Delete a movie. Returns False if the household has no such movie."""
+    rows = _execute(scope_movies(supabase.table("movies").delete().eq("id", movie_id), identity))
+    _remember(("movie", household_key(identity), movie_id), None)
+    if identity.get("household_id"):
+        movie_index.removed(identity["household_id"], movie_id)
+    return bool(rows)
+
+def add_movie(identity, title, category, **details):
+    """Add a movie to the household's list; details are extra columns such as tmdb_id.
+
+    Raises DuplicateMovie if the list already has it (see find_duplicate), also when
+    another process inserted it first.
+    """
+    duplicate = find_duplicate(identity, title, details.get("tmdb_id"))
+    if duplicate is not None:
+        raise DuplicateMovie(duplicate)
+    _insert("movies", dict(new_movie_row(identity, title, category), **details))
+    # Written before returning: callers reply "added" right after, so a failed
+    # insert has to reach them, not the end of the unit of work
+    flush()
+
+def find_duplicate(identity, title, tmdb_id=None):
+    """The household's movie with the same TMDB id, or the same normalised title when either has no TMDB id; or None.
+
+    Lists without a household (before sql/003) are not checked.
+    """
+    household_id = identity.get("household_id")
+    if not household_id:
+        return None
+    return movie_index.find(household_id, title, tmdb_id, lambda: _household_movies(household_id))
+
+def _household_movies(household_id, page_size=1000):
+    """Every movie of a household, for its duplicate index."""
+    # Lists from before movies.tmdb_id existed are indexed by title only
+    columns = schema.select_columns("movies", MOVIE_COLUMNS, "tmdb_id")
+    return _fetch_all(supabase.table("movies").select(columns).eq("household_id", household_id), page_size)
+
+def _fetch_all(query, page_size):
+    rows = []
+    while True:
+        # postgrest-py 0.10's range() excludes its end
+        page = _execute(query.order("id").range(len(rows), len(rows) + page_size))
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+# --- Users ---
+def create_user(chat_id):
+    """Insert the users row of a new chat and return it."""
+    return _execute(supabase.table("users").insert({"chat_id": str(chat_id)}))[0]
+
+def set_invite_code(chat_id, invite_code):
+    _execute(supabase.table("users").update({"invite_code": invite_code}).eq("chat_id", str(chat_id)))
+
+def get_user(user_id):
+    """A users row {'id', 'chat_id', 'partner_id', 'household_id'}, or None."""
+    def load():
+        rows = _execute(supabase.table("users").select(USER_COLUMNS).eq("id", user_id))
+        return rows[0] if rows else None
+    return _memo(("user", user_id), load)
+
+# --- Batched writes ---
+def _insert(table, row):
+    uow = _current.get()
+    if uow is None:
+        _execute(supabase.table(table).insert(row))
+        return
+    uow.inserts.setdefault(table, []).append(row)
+
+def flush():
+    """Send the queued inserts, one request per table (and column set). Returns the inserted rows."""
+    uow = _current.get()
+    if uow is None or not uow.inserts:
+        return {}
+    inserted = {}
+    while uow.inserts:
+        table, rows = uow.inserts.popitem()
+        # A bulk insert needs the same keys in every row
+        by_columns = {}
+        for row in rows:
+            by_columns.setdefault(frozenset(row), []).append(row)
+        for batch in by_columns.values():
+            try:
+                rows_inserted = _execute(supabase.table(table).insert(batch))
+            except Exception as e:
+                if table == "movies" and getattr(e, "code", None) == UNIQUE_VIOLATION:
+                    raise _duplicate_in(batch) from e
+                if getattr(e, "code", None) in UNKNOWN_COLUMN:
+                    # The schema changed under us: re-read it so the next write only uses real columns
+                    schema.refresh()
+                raise
+            inserted.setdefault(table, []).extend(rows_inserted)
+            if table == "movies":
+                for row in rows_inserted:
+                    movie_index.added(row)
+        with _stats_lock:
+            _stats["batched_rows"] += len(rows)
+    return inserted
+
+def _duplicate_in(rows):
+    """DuplicateMovie for a movies insert the database rejected (another process added it first)."""
+    for row in rows:
+        if row.get("household_id"):
+            movie_index.invalidate(row["household_id"])
+    for row in rows:
+        identity = {"household_id": row.get("household_id")}
+        duplicate = find_duplicate(identity, row["title"], row.get("tmdb_id"))
+        if duplicate is not None:
+            return DuplicateMovie(duplicate)
+    return DuplicateMovie({"id": None, "title": rows[0]["title"], "category": rows[0]["category"], "tmdb_id": rows[0].get("tmdb_id")})
@@ -0,0 +1,136 @@
+import time
+import logging
+import metrics
+
+# --- Route registry for menu texts and callback data ---
+# Exact keys are a dict lookup; prefixes live in a character trie and the longest
+# registered prefix wins, so "editcat_" beats "edit_" no matter the declaration order.
+# Each route's latency, errors and external calls are recorded in metrics.py.
+
+class Route:
+    __slots__ = ("key", "handler", "pass_data", "metrics")
+
+    def __init__(self, key, handler, pass_data):
+        self.key = key
+        self.handler = handler
+        self.pass_data = pass_data
+        self.metrics = metrics.RouteKey()
+
+class _TrieNode:
+    __slots__ = ("children", "route")
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+class Router:
+    def __init__(self, name):
+        self.name = name
+        self._exact = {}
+        self._root = _TrieNode()
+        self._states = {}  # conversation states handled outside the key lookup, see call()
+
+    def exact(self, key, pass_data=False):
+        """Decorator: route `key` exactly to the handler."""
+        def decorator(handler):
+            if key in self._exact:
+                raise ValueError(f"{self.name} route {key!r} is already registered")
+            self._exact[key] = Route(key, handler, pass_data)
+            return handler
+        return decorator
+
+    def prefix(self, prefix, pass_data=False):
+        """Decorator: route every key starting with `prefix` to the handler (longest prefix wins)."""
+        def decorator(handler):
+            node = self._root
+            for char in prefix:
+                node = node.children.setdefault(char, _TrieNode())
+            if node.route is not None:
+                raise ValueError(f"{self.name} prefix {prefix!r} is already registered")
+            node.route = Route(prefix, handler, pass_data)
+            return handler
+        return decorator
+
+    def resolve(self, key):
+        """Return the Route for key, or None."""
+        route = self._exact.get(key)
+        if route is not None:
+            return route
+        node = self._root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.route is not None:
+                route = node.route
+        return route
+
+    def dispatch(self, key, update, context):
+        """Call the handler routed for key. Returns False if nothing matched."""
+        route = self.resolve(key)
+        if route is None:
+            return False
+        self._run(route, update, context, key)
+        return True
+
+    def call(self, state, handler, update, context):
+        """Call handler for a conversation state (no key lookup), measured like a route named `state`."""
+        route = self._states.get(state)
+        if route is None:
+            route = self._states.setdefault(state, Route(state, handler, False))
+        return self._run(route, update, context)
+
+    def _run(self, route, update, context, key=None):
+        started = time.perf_counter()
+        token = metrics.enter(route.metrics)
+        failed = False
+        try:
+            if route.pass_data:
+                return route.handler(update, context, key)
+            return route.handler(update, context)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics.leave(route.metrics, token, time.perf_counter() - started, failed)
+
+    def routes(self):
+        """All registered routes, exact ones first, then prefixes and states."""
+        found = list(self._exact.values())
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.route is not None:
+                found.append(node.route)
+            stack.extend(node.children.values())
+        return found + list(self._states.values())
+
+    def stats(self):
+        """Per-route hit counts and latency, busiest first."""
+        rows = []
+        for route in self.routes():
+            hits, errors, total_seconds, max_seconds = metrics.snapshot(route.metrics)
+            rows.append({
+                "route": route.key,
+                "handler": getattr(route.handler, "__name__", repr(route.handler)),
+                "hits": hits,
+                "errors": errors,
+                "avg_ms": total_seconds * 1000 / hits if hits else 0.0,
+                "max_ms": max_seconds * 1000,
+            })
+        return sorted(rows, key=lambda row: row["hits"], reverse=True)
+
+    def log_stats(self):
+        for row in self.stats():
+            if row["hits"]:
+                logging.info(
+                    f"{self.name} route {row['route']!r}: {row['hits']} hits, {row['errors']} errors, "
+                    f"avg {row['avg_ms']:.1f} ms, max {row['max_ms']:.1f} ms"
+                )
+
+# Inline button callback_data -> handler
+callback_router = Router("callback")
+# Reply keyboard menu texts -> handler
+menu_router = Router("menu")
+metrics.register_router(callback_router)
+metrics.register_router(menu_router)
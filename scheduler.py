@@ -0,0 +1,98 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Per-chat ordered update scheduler ---
+# Updates of different chats run in parallel on a bounded pool; updates of the
+# same chat run strictly one after another, because handlers keep conversation
+# state in context.user_data (awaiting_movie_title, awaiting_tmdb_search, ...).
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "16"))
+
+class ChatScheduler:
+    def __init__(self, max_workers=SCHEDULER_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-worker")
+        self._lock = threading.Lock()
+        self._backlogs = {}  # chat_id -> deque of (fn, args, enqueued_at) waiting behind the running one
+        self._queued = 0  # tasks handed to the pool that haven't started yet
+        self._running = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "max_chat_backlog": 0, "wait_seconds_total": 0.0}
+
+    def submit(self, chat_id, fn, *args):
+        """Run fn(*args) after every earlier task of the same chat has finished."""
+        task = (fn, args, time.monotonic())
+        with self._lock:
+            self._stats["submitted"] += 1
+            backlog = self._backlogs.get(chat_id)
+            if backlog is not None:
+                backlog.append(task)
+                self._stats["max_chat_backlog"] = max(self._stats["max_chat_backlog"], len(backlog))
+                return
+            self._backlogs[chat_id] = deque()
+            self._queued += 1
+        self._executor.submit(self._run, chat_id, task)
+
+    def _run(self, chat_id, task):
+        fn, args, enqueued_at = task
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._stats["wait_seconds_total"] += time.monotonic() - enqueued_at
+        try:
+            fn(*args)
+        except Exception as e:
+            logging.exception(f"Error handling update for chat {chat_id}: {e}")
+            with self._lock:
+                self._stats["failed"] += 1
+        with self._lock:
+            self._running -= 1
+            self._stats["completed"] += 1
+            backlog = self._backlogs[chat_id]
+            if not backlog:
+                del self._backlogs[chat_id]
+                return
+            next_task = backlog.popleft()
+            self._queued += 1
+        # Go back through the pool so one busy chat can't hog a worker
+        self._executor.submit(self._run, chat_id, next_task)
+
+    def wrap(self, handler):
+        """Turn a PTB handler callback into one that is scheduled per chat and returns at once."""
+        def callback(update, context):
+            chat = update.effective_chat
+            user = update.effective_user
+            chat_id = chat.id if chat else (user.id if user else None)
+            self.submit(chat_id, handler, update, context)
+        callback.__name__ = getattr(handler, "__name__", "callback")
+        return callback
+
+    def stats(self, top=5):
+        """Queue depth and per-chat backlog metrics."""
+        with self._lock:
+            backlogs = {chat_id: len(q) for chat_id, q in self._backlogs.items()}
+            stats = dict(
+                self._stats,
+                workers=self.max_workers,
+                running=self._running,
+                queued=self._queued,
+                active_chats=len(backlogs),
+            )
+        stats["backlogged"] = sum(backlogs.values())
+        stats["queue_depth"] = stats["queued"] + stats["backlogged"]
+        stats["top_chat_backlogs"] = sorted(backlogs.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        started = stats["completed"] + stats["running"]
+        stats["avg_wait_ms"] = stats["wait_seconds_total"] * 1000 / started if started else 0.0
+        return stats
+
+    def shutdown(self, wait=True, timeout=10.0):
+        """Stop the pool; with wait=True, first let already accepted updates finish."""
+        deadline = time.monotonic() + timeout
+        while wait and time.monotonic() < deadline:
+            with self._lock:
+                if not self._backlogs:
+                    break
+            time.sleep(0.05)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,71 @@
+import os
+import time
+import logging
+import threading
+from db import SUPABASE_URL, SUPABASE_KEY
+
+# --- Schema capability registry ---
+# Which columns the movies and users tables actually have, read once from
+# PostgREST's OpenAPI description (at startup, or on first use) instead of
+# probing before each write. Optional columns come from later migrations
+# (sql/005, sql/006). Writers and renderers ask has() and use them only when
+# they exist. refresh() reloads the registry, e.g. after a migration or when
+# PostgREST rejects a column.
+SCHEMA_TABLES = ("movies", "users")
+# After a failed introspection the base columns are assumed for this long, then columns() asks again
+SCHEMA_RETRY_SECONDS = float(os.getenv("SCHEMA_RETRY_SECONDS", "30"))
+
+_columns = None  # table -> frozenset of column names
+_retry_at = None  # monotonic time to introspect again after a failure; None once it succeeded
+_lock = threading.Lock()
+
+def _introspect():
+    """table -> columns from PostgREST's OpenAPI document."""
+    import requests  # only needed here; keeps it off the import path of a cold start
+    r = requests.get(
+        f"{SUPABASE_URL}/rest/v1/",
+        headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}",
+                 "Accept": "application/openapi+json"},
+        timeout=10,
+    )
+    r.raise_for_status()
+    definitions = r.json().get("definitions") or {}
+    return {table: frozenset((definitions.get(table) or {}).get("properties") or ()) for table in SCHEMA_TABLES}
+
+def refresh():
+    """Read the schema again. If PostgREST can't be asked, only the base columns are assumed for SCHEMA_RETRY_SECONDS."""
+    global _columns, _retry_at
+    try:
+        columns = _introspect()
+        retry_at = None
+    except Exception as e:
+        logging.warning(f"Schema introspection failed, optional columns disabled for {SCHEMA_RETRY_SECONDS:.0f}s: {e}")
+        columns = {table: frozenset() for table in SCHEMA_TABLES}
+        retry_at = time.monotonic() + SCHEMA_RETRY_SECONDS
+    with _lock:
+        _columns = columns
+        _retry_at = retry_at
+    logging.info("Schema: " + "; ".join(f"{table}({', '.join(sorted(cols))})" for table, cols in columns.items()))
+    return columns
+
+def columns(table):
+    global _retry_at
+    with _lock:
+        loaded = _columns
+        stale = _retry_at is not None and time.monotonic() >= _retry_at
+        if stale:
+            # One caller retries; the others keep the base columns meanwhile
+            _retry_at = time.monotonic() + SCHEMA_RETRY_SECONDS
+    if loaded is None or stale:
+        loaded = refresh()
+    return loaded.get(table, frozenset())
+
+def has(table, *names):
+    """True if the table has every one of the columns."""
+    available = columns(table)
+    return all(name in available for name in names)
+
+def select_columns(table, base, *optional):
+    """A select list: the base columns plus those optional ones the table has."""
+    extra = [name for name in optional if has(table, name)]
+    return ", ".join([base] + extra) if extra else base
@@ -0,0 +1,223 @@
+import os
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# --- Session store for context.user_data ---
+# Replaces the dispatcher's unbounded defaultdict. Sessions live in memory while
+# they are in use; a periodic sweep spills idle ones (and everything at shutdown)
+# to SQLite, and a chat's session is loaded back lazily on its next update, so a
+# restart doesn't break users who are halfway through a flow.
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+SESSION_MEMORY_BUDGET = int(os.getenv("SESSION_MEMORY_BUDGET_MB", "64")) * 1024 * 1024
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "1800"))
+# Never evict a session touched more recently than this: a handler may still hold it
+SESSION_MIN_IDLE = int(os.getenv("SESSION_MIN_IDLE", "60"))
+SESSION_MAX_AGE_DAYS = int(os.getenv("SESSION_MAX_AGE_DAYS", "30"))
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+class SQLiteSpill:
+    """Spilled sessions in a local SQLite file: user_id -> pickled dict."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def load(self, user_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def save_many(self, items):
+        """items: iterable of (user_id, blob); an empty session deletes the row."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for user_id, blob in items:
+                if blob is None:
+                    self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)",
+                        (user_id, blob, now),
+                    )
+            self._conn.execute("COMMIT")
+
+    def purge(self, older_than):
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (older_than,)).rowcount
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class SessionStore(MutableMapping):
+    """Drop-in for Dispatcher.user_data: user_id -> session dict, created on first access."""
+
+    def __init__(self, spill=None, memory_budget=SESSION_MEMORY_BUDGET,
+                 idle_ttl=SESSION_IDLE_TTL, min_idle=SESSION_MIN_IDLE):
+        self.spill = spill
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.min_idle = min_idle
+        # user_id -> [session, last_access, pickled size, when the size was measured], least recent first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "spills": 0, "evictions": 0, "purged": 0, "memory_bytes": 0}
+
+    def __getitem__(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            slot = self._sessions.get(user_id)
+            if slot is not None:
+                slot[1] = now
+                self._sessions.move_to_end(user_id)
+                return slot[0]
+        session = self._load(user_id)
+        with self._lock:
+            # Another thread may have loaded the same user meanwhile
+            slot = self._sessions.setdefault(user_id, [session, now, 0, None])
+            self._sessions.move_to_end(user_id)
+            return slot[0]
+
+    def _load(self, user_id):
+        if self.spill is None:
+            return {}
+        blob = self.spill.load(user_id)
+        if blob is None:
+            return {}
+        try:
+            session = pickle.loads(blob)
+        except Exception as e:
+            logging.warning(f"Dropping unreadable session of user {user_id}: {e}")
+            return {}
+        with self._lock:
+            self._stats["loads"] += 1
+        return session
+
+    def __setitem__(self, user_id, session):
+        with self._lock:
+            self._sessions[user_id] = [session, time.monotonic(), 0, None]
+            self._sessions.move_to_end(user_id)
+
+    def __delitem__(self, user_id):
+        with self._lock:
+            del self._sessions[user_id]
+        if self.spill is not None:
+            self.spill.save_many([(user_id, None)])
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._sessions
+
+    def sweep(self):
+        """Spill and drop sessions idle past the TTL, then least recently used ones until under budget.
+
+        Only sessions used since their size was last measured are pickled again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            slots = list(self._sessions.items())
+        sizes = {}
+        candidates = []
+        for user_id, slot in slots:
+            session, last_access, size, measured_at = slot
+            if measured_at is None or last_access >= measured_at:
+                try:
+                    size = slot[2] = len(pickle.dumps(session))
+                    slot[3] = now
+                except Exception as e:
+                    # A handler may be changing the session right now: keep the old size
+                    logging.debug(f"Could not measure the session of user {user_id}: {e}")
+            sizes[user_id] = size
+            candidates.append((user_id, now - last_access))
+        total = sum(sizes.values())
+
+        evict = []
+        for user_id, idle in candidates:  # least recently used first
+            if idle < self.min_idle:
+                break
+            if idle >= self.idle_ttl or total > self.memory_budget:
+                evict.append(user_id)
+                total -= sizes[user_id]
+        self._evict(evict, now)
+        with self._lock:
+            self._stats["memory_bytes"] = total
+        if self.spill is not None and SESSION_MAX_AGE_DAYS > 0:
+            purged = self.spill.purge(time.time() - SESSION_MAX_AGE_DAYS * 86400)
+            with self._lock:
+                self._stats["purged"] += purged
+
+    def _evict(self, user_ids, now, force=False):
+        if not user_ids:
+            return
+        with self._lock:
+            slots = []
+            for user_id in user_ids:
+                slot = self._sessions.get(user_id)
+                # Skip sessions picked up again since the sweep looked at them
+                if slot is not None and (force or now - slot[1] >= self.min_idle):
+                    slots.append((user_id, self._sessions.pop(user_id)[0]))
+            self._stats["evictions"] += len(slots)
+        if self.spill is not None and slots:
+            blobs = []
+            for user_id, session in slots:
+                try:
+                    blobs.append((user_id, pickle.dumps(session) if session else None))
+                except Exception as e:
+                    logging.warning(f"Dropping session of user {user_id} that can't be pickled: {e}")
+            self.spill.save_many(blobs)
+            with self._lock:
+                self._stats["spills"] += len(slots)
+
+    def close(self):
+        """Spill every session (on shutdown)."""
+        with self._lock:
+            user_ids = list(self._sessions)
+        self._evict(user_ids, time.monotonic(), force=True)
+        if self.spill is not None:
+            self.spill.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, active=len(self._sessions))
+        if self.spill is not None:
+            stats["spilled"] = self.spill.count()
+        return stats
+
+def install(dispatcher, job_queue=None):
+    """Replace dispatcher.user_data with a SessionStore (SQLite spill unless SESSION_DB is empty)."""
+    spill = SQLiteSpill(SESSION_DB) if SESSION_DB else None
+    store = SessionStore(spill)
+    # Keep whatever was created before the store was installed
+    for user_id, session in dispatcher.user_data.items():
+        store[user_id] = session
+    dispatcher.user_data = store
+    if job_queue is not None and SESSION_SWEEP_INTERVAL > 0:
+        job_queue.run_repeating(lambda context: store.sweep(), interval=SESSION_SWEEP_INTERVAL)
+    logging.info(
+        f"Session store: budget {SESSION_MEMORY_BUDGET // (1024 * 1024)} MB, idle TTL {SESSION_IDLE_TTL}s, "
+        f"spill to {SESSION_DB or 'nowhere (memory only)'}"
+    )
+    return store
@@ -0,0 +1,7 @@
+-- Keyset pagination of movie lists: WHERE user_id IN (...) [AND category = ...]
+-- ORDER BY created_at, id. Run once in the Supabase SQL editor.
+create index if not exists movies_user_category_created_id_idx
+    on movies (user_id, category, created_at, id);
+
+create index if not exists movies_user_created_id_idx
+    on movies (user_id, created_at, id);
@@ -0,0 +1,49 @@
+-- One-row random pick for /random, done in the database instead of downloading the list.
+-- p_exclude holds the household's most recent picks; p_favour_older skews the pick
+-- towards entries that have been waiting longest (offset = n * random()^2 over created_at).
+create or replace function pick_random_movie(
+    p_user_ids uuid[],
+    p_categories text[],
+    p_exclude uuid[] default '{}',
+    p_favour_older boolean default false
+)
+returns setof movies
+language plpgsql
+volatile
+as $$
+declare
+    n bigint;
+    k bigint;
+begin
+    select count(*) into n from movies
+     where user_id = any(p_user_ids)
+       and category = any(p_categories)
+       and not (id = any(p_exclude));
+
+    if n = 0 and cardinality(p_exclude) > 0 then
+        -- Everything was picked recently: repeat rather than return nothing
+        p_exclude := '{}';
+        select count(*) into n from movies
+         where user_id = any(p_user_ids)
+           and category = any(p_categories);
+    end if;
+    if n = 0 then
+        return;
+    end if;
+
+    if p_favour_older then
+        k := floor(n * power(random(), 2));
+    else
+        k := floor(n * random());
+    end if;
+
+    return query
+        select * from movies
+         where user_id = any(p_user_ids)
+           and category = any(p_categories)
+           and not (id = any(p_exclude))
+         order by created_at, id
+         offset k
+         limit 1;
+end;
+$$;
@@ -0,0 +1,124 @@
+-- Households: a shared list is one row, users and movies point to it, and list reads
+-- become WHERE household_id = $1 instead of WHERE user_id IN (self, partner).
+-- Existing pairs are moved into one household each. Run once in the Supabase SQL editor.
+create table if not exists households (
+    id uuid primary key default gen_random_uuid(),
+    created_at timestamptz not null default now()
+);
+
+alter table users add column if not exists household_id uuid references households (id);
+alter table movies add column if not exists household_id uuid references households (id);
+
+-- --- Backfill ---
+-- A pair shares the household keyed by the smaller of the two user ids.
+insert into households (id)
+select distinct least(u.id, coalesce(u.partner_id, u.id))
+  from users u
+ where u.household_id is null
+on conflict (id) do nothing;
+
+update users
+   set household_id = least(id, coalesce(partner_id, id))
+ where household_id is null;
+
+update movies m
+   set household_id = u.household_id
+  from users u
+ where m.user_id = u.id
+   and m.household_id is null;
+
+-- --- New rows ---
+-- New users get a household of their own; movies inserted without one (older bot
+-- versions) inherit their owner's household.
+create or replace function assign_user_household()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.household_id is null then
+        insert into households default values returning id into new.household_id;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists users_assign_household on users;
+create trigger users_assign_household
+    before insert on users
+    for each row execute function assign_user_household();
+
+create or replace function assign_movie_household()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.household_id is null then
+        select household_id into new.household_id from users where id = new.user_id;
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists movies_assign_household on movies;
+create trigger movies_assign_household
+    before insert on movies
+    for each row execute function assign_movie_household();
+
+-- --- Indexes ---
+-- Keyset pagination: WHERE household_id = $1 [AND category = ...] ORDER BY created_at, id
+create index if not exists movies_household_category_created_id_idx
+    on movies (household_id, category, created_at, id);
+
+create index if not exists movies_household_created_id_idx
+    on movies (household_id, created_at, id);
+
+create index if not exists users_household_idx on users (household_id);
+
+-- --- Random pick ---
+-- Same as pick_random_movie (002) but scoped by household.
+create or replace function pick_random_household_movie(
+    p_household_id uuid,
+    p_categories text[],
+    p_exclude uuid[] default '{}',
+    p_favour_older boolean default false
+)
+returns setof movies
+language plpgsql
+volatile
+as $$
+declare
+    n bigint;
+    k bigint;
+begin
+    select count(*) into n from movies
+     where household_id = p_household_id
+       and category = any(p_categories)
+       and not (id = any(p_exclude));
+
+    if n = 0 and cardinality(p_exclude) > 0 then
+        -- Everything was picked recently: repeat rather than return nothing
+        p_exclude := '{}';
+        select count(*) into n from movies
+         where household_id = p_household_id
+           and category = any(p_categories);
+    end if;
+    if n = 0 then
+        return;
+    end if;
+
+    if p_favour_older then
+        k := floor(n * power(random(), 2));
+    else
+        k := floor(n * random());
+    end if;
+
+    return query
+        select * from movies
+         where household_id = p_household_id
+           and category = any(p_categories)
+           and not (id = any(p_exclude))
+         order by created_at, id
+         offset k
+         limit 1;
+end;
+$$;
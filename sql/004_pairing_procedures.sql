@@ -0,0 +1,113 @@
+-- Pairing in one round trip: /join and /unlink each call one function that locks
+-- the rows involved, makes every change in one transaction and returns the final
+-- state, so two people redeeming the same code can't end up half-paired.
+-- Needs 003_households.sql. Run once in the Supabase SQL editor.
+
+-- status is one of: paired, invalid_code, own_code, already_paired, unknown_user
+create or replace function redeem_invite(p_chat_id text, p_invite_code text)
+returns table (
+    status text,
+    user_id uuid,
+    partner_id uuid,
+    household_id uuid,
+    previous_household_id uuid,
+    partner_chat_id text
+)
+language plpgsql
+as $$
+declare
+    v_joiner users%rowtype;
+    v_inviter users%rowtype;
+    v_inviter_id uuid;
+    v_joiner_id uuid;
+begin
+    select u.id into v_inviter_id from users u where u.invite_code = p_invite_code;
+    select u.id into v_joiner_id from users u where u.chat_id = p_chat_id;
+    if v_joiner_id is null then
+        return query select 'unknown_user', null::uuid, null::uuid, null::uuid, null::uuid, null::text;
+        return;
+    end if;
+    if v_inviter_id is null then
+        return query select 'invalid_code', v_joiner_id, null::uuid, null::uuid, null::uuid, null::text;
+        return;
+    end if;
+    if v_inviter_id = v_joiner_id then
+        return query select 'own_code', v_joiner_id, null::uuid, null::uuid, null::uuid, null::text;
+        return;
+    end if;
+
+    -- Lock both rows in id order so concurrent redemptions queue instead of deadlocking
+    perform 1 from users u where u.id in (v_inviter_id, v_joiner_id) order by u.id for update;
+    select * into v_inviter from users u where u.id = v_inviter_id;
+    select * into v_joiner from users u where u.id = v_joiner_id;
+
+    -- Someone else redeemed the code while we waited for the lock
+    if v_inviter.invite_code is distinct from p_invite_code then
+        return query select 'invalid_code', v_joiner.id, v_joiner.partner_id, v_joiner.household_id,
+                            null::uuid, null::text;
+        return;
+    end if;
+    -- Either side still has a partner: they have to /unlink first, or that partner
+    -- would keep pointing at someone who moved to another household
+    if v_joiner.partner_id is not null or v_inviter.partner_id is not null then
+        return query select 'already_paired', v_joiner.id, v_joiner.partner_id, v_joiner.household_id,
+                            null::uuid, null::text;
+        return;
+    end if;
+
+    update movies m set household_id = v_inviter.household_id where m.user_id = v_joiner.id;
+    update users u set partner_id = v_inviter.id, household_id = v_inviter.household_id where u.id = v_joiner.id;
+    update users u set partner_id = v_joiner.id, invite_code = null where u.id = v_inviter.id;
+    -- Drop the joiner's old household if nobody is left in it
+    delete from households h
+     where h.id = v_joiner.household_id
+       and h.id is distinct from v_inviter.household_id
+       and not exists (select 1 from users u where u.household_id = h.id);
+
+    return query select 'paired', v_joiner.id, v_inviter.id, v_inviter.household_id,
+                        v_joiner.household_id, v_inviter.chat_id;
+end;
+$$;
+
+-- status is one of: unlinked, not_paired, unknown_user
+create or replace function leave_household(p_chat_id text)
+returns table (
+    status text,
+    user_id uuid,
+    partner_id uuid,
+    household_id uuid,
+    previous_household_id uuid
+)
+language plpgsql
+as $$
+declare
+    v_user users%rowtype;
+    v_household_id uuid;
+begin
+    select * into v_user from users u where u.chat_id = p_chat_id;
+    if not found then
+        return query select 'unknown_user', null::uuid, null::uuid, null::uuid, null::uuid;
+        return;
+    end if;
+    -- Lock the user and their partner in id order, as redeem_invite does, so two
+    -- partners leaving at once queue instead of deadlocking; then re-read the row,
+    -- the partner may have left while we waited
+    perform 1 from users u where u.id in (v_user.id, v_user.partner_id) order by u.id for update;
+    select * into v_user from users u where u.id = v_user.id;
+    -- Only then the household: serialises leaves of its other members
+    perform 1 from households h where h.id = v_user.household_id for update;
+
+    if v_user.partner_id is null
+       and not exists (select 1 from users u where u.household_id = v_user.household_id and u.id <> v_user.id) then
+        return query select 'not_paired', v_user.id, null::uuid, v_user.household_id, null::uuid;
+        return;
+    end if;
+
+    insert into households default values returning id into v_household_id;
+    update movies m set household_id = v_household_id where m.user_id = v_user.id;
+    update users u set partner_id = null, household_id = v_household_id where u.id = v_user.id;
+    update users u set partner_id = null where u.partner_id = v_user.id;
+
+    return query select 'unlinked', v_user.id, null::uuid, v_household_id, v_user.household_id;
+end;
+$$;
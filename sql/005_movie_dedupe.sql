@@ -0,0 +1,98 @@
+-- Duplicate movies: a household lists a movie once, however its title is spelled.
+-- movies.tmdb_id is unique per household, and so is movies.title_norm (kept by a
+-- trigger) among movies without a TMDB id; remakes share a title but not an id. The bot checks the same keys in memory before inserting (see
+-- movie_index.py); these constraints catch what that misses. Run once in the
+-- Supabase SQL editor, after 003_households.sql.
+create extension if not exists unaccent;
+
+alter table movies add column if not exists tmdb_id integer;
+alter table movies add column if not exists title_norm text;
+
+-- Same rules as utils.normalize_title(): accents, case, punctuation and a bracketed
+-- trailing year ("Dune (2021)") don't make a different movie. A bare number stays
+-- ("Wonder Woman 1984").
+create or replace function normalize_title(p_title text)
+returns text
+language sql
+stable
+as $$
+    select trim(regexp_replace(
+        regexp_replace(
+            lower(trim(unaccent(coalesce(p_title, '')))),
+            '(?<=\S)\s*[\(\[]\s*(18[89][0-9]|19[0-9][0-9]|20[0-3][0-9])\s*[\)\]]\s*$',
+            ''
+        ),
+        '[^[:alnum:]]+', ' ', 'g'
+    ));
+$$;
+
+create or replace function set_movie_title_norm()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.title_norm := normalize_title(new.title);
+    return new;
+end;
+$$;
+
+drop trigger if exists movies_set_title_norm on movies;
+create trigger movies_set_title_norm
+    before insert or update of title on movies
+    for each row execute function set_movie_title_norm();
+
+-- An earlier version of this file indexed every title and also stripped a bare year
+drop index if exists movies_household_title_norm_key;
+
+update movies set title_norm = normalize_title(title) where title_norm is distinct from normalize_title(title);
+
+-- --- Existing duplicates ---
+-- The unique indexes can't be built over duplicates, so all copies but one (a loved
+-- copy wins over a planned one, then the oldest) are moved to movies_duplicates,
+-- with kept_id pointing at the copy that stayed. Nothing is deleted: look through
+-- that table afterwards and put rows back or drop them by hand.
+create table if not exists movies_duplicates (like movies);
+alter table movies_duplicates add column if not exists moved_at timestamptz not null default now();
+alter table movies_duplicates add column if not exists kept_id uuid;
+
+with ranked as (
+    select id,
+           first_value(id) over w as kept_id,
+           row_number() over w as n
+      from movies
+     where household_id is not null and tmdb_id is not null
+    window w as (partition by household_id, tmdb_id order by (category = 'watched') desc, created_at, id)
+), moved as (
+    insert into movies_duplicates
+    select m.*, now(), r.kept_id from movies m join ranked r on r.id = m.id where r.n > 1
+    returning id
+)
+delete from movies m using moved where m.id = moved.id;
+
+with ranked as (
+    select id,
+           first_value(id) over w as kept_id,
+           row_number() over w as n
+      from movies
+     where household_id is not null and tmdb_id is null
+    window w as (partition by household_id, title_norm order by (category = 'watched') desc, created_at, id)
+), moved as (
+    insert into movies_duplicates
+    select m.*, now(), r.kept_id from movies m join ranked r on r.id = m.id where r.n > 1
+    returning id
+)
+delete from movies m using moved where m.id = moved.id;
+
+do $$
+begin
+    raise notice '% duplicate movies are in movies_duplicates', (select count(*) from movies_duplicates);
+end;
+$$;
+
+create unique index if not exists movies_household_title_norm_key
+    on movies (household_id, title_norm)
+    where tmdb_id is null;
+
+create unique index if not exists movies_household_tmdb_id_key
+    on movies (household_id, tmdb_id)
+    where tmdb_id is not null;
@@ -0,0 +1,7 @@
+-- TMDB details stored with a movie when it is added from TMDB, so list views can
+-- show them without calling TMDB. The bot reads the table's columns at startup
+-- (schema.py) and fills these only once they exist. Run once in the Supabase
+-- SQL editor; then restart the bot (or wait for its next schema refresh).
+alter table movies add column if not exists poster_path text;
+alter table movies add column if not exists overview text;
+alter table movies add column if not exists release_year smallint;
@@ -0,0 +1,70 @@
+-- Constant-time /random: every movie gets a random sort key, and a pick is the first
+-- row at or after a random point (wrapping around to the smallest key). That is one
+-- index probe on (household_id, random_key) instead of count(*) + OFFSET, which read
+-- every row of the household. favour_older picks a random point in time, skewed
+-- towards the oldest entry, and takes the first movie added at or after it.
+alter table movies add column if not exists random_key double precision not null default random();
+
+create index if not exists movies_household_random_key_idx on movies (household_id, random_key);
+
+-- random() must run on every call, so the functions are volatile (a stable function
+-- may be evaluated once and its result reused).
+alter function pick_random_movie(uuid[], text[], uuid[], boolean) volatile;
+
+create or replace function pick_random_household_movie(
+    p_household_id uuid,
+    p_categories text[],
+    p_exclude uuid[] default '{}',
+    p_favour_older boolean default false
+)
+returns setof movies
+language plpgsql
+volatile
+as $$
+declare
+    r double precision := random();
+    oldest timestamptz;
+    newest timestamptz;
+    picked movies;
+begin
+    for attempt in 1..2 loop
+        if p_favour_older then
+            select min(created_at), max(created_at) into oldest, newest from movies
+             where household_id = p_household_id
+               and category = any(p_categories)
+               and not (id = any(p_exclude));
+            select * into picked from movies
+             where household_id = p_household_id
+               and category = any(p_categories)
+               and not (id = any(p_exclude))
+               and created_at >= oldest + (newest - oldest) * power(r, 2)
+             order by created_at, id
+             limit 1;
+        else
+            select * into picked from movies
+             where household_id = p_household_id
+               and category = any(p_categories)
+               and not (id = any(p_exclude))
+               and random_key >= r
+             order by random_key
+             limit 1;
+            if not found then
+                select * into picked from movies
+                 where household_id = p_household_id
+                   and category = any(p_categories)
+                   and not (id = any(p_exclude))
+                 order by random_key
+                 limit 1;
+            end if;
+        end if;
+
+        if found then
+            return next picked;
+            return;
+        end if;
+        -- Everything was picked recently: repeat rather than return nothing
+        exit when cardinality(p_exclude) = 0;
+        p_exclude := '{}';
+    end loop;
+end;
+$$;
@@ -0,0 +1,16 @@
+-- Local stand-in for the Supabase tables, so the migrations in sql/ can be applied
+-- to a plain Postgres (see docker-compose.yml). Not needed on Supabase.
+create table if not exists users (
+    id uuid primary key default gen_random_uuid(),
+    chat_id text unique not null,
+    invite_code text,
+    partner_id uuid references users (id)
+);
+
+create table if not exists movies (
+    id uuid primary key default gen_random_uuid(),
+    user_id uuid references users (id),
+    title text not null,
+    category text not null,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,12 @@
+-- Anonymous PostgREST role for the local stand-in (Supabase has its own roles).
+do $$
+begin
+    if not exists (select 1 from pg_roles where rolname = 'anon') then
+        create role anon nologin;
+    end if;
+end;
+$$;
+
+grant usage on schema public to anon;
+grant all on all tables in schema public to anon;
+grant execute on all functions in schema public to anon;
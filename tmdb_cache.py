@@ -0,0 +1,183 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import tmdb_client
+
+# --- Shared TMDB response cache ---
+# One cache for all users, keyed by endpoint + query + language. Stale entries are
+# served while a background refresh runs, and concurrent misses for the same key
+# share a single outbound request.
+TMDB_CACHE_SIZE = int(os.getenv("TMDB_CACHE_SIZE", "1024"))
+
+# Fresh lifetime per endpoint, in seconds
+TMDB_TTLS = {
+    "movie/popular": 3 * 3600,
+    "movie/top_rated": 12 * 3600,
+    "search/movie": 3600,
+}
+DEFAULT_TTL = 3600
+# Entries older than ttl * STALE_FACTOR are too old to serve even while refreshing
+STALE_FACTOR = 4
+# Longest a caller waits for another caller's fetch of the same key
+TMDB_INFLIGHT_TIMEOUT = float(os.getenv("TMDB_INFLIGHT_TIMEOUT", "60"))
+
+_entries = OrderedDict()  # key -> (data, fetched_at, ttl)
+_inflight = {}  # key -> Future
+_lock = threading.Lock()
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "fetches": 0, "errors": 0}
+
+def _fetch(endpoint, params):
+    """Call TMDB through the pooled client. Returns the parsed JSON, or None for a client error."""
+    return tmdb_client.get_json(endpoint, params)
+
+def _cache_key(endpoint, params):
+    return (endpoint, tuple(sorted(params.items())))
+
+def _start_fetch(key, endpoint, params):
+    """Register an in-flight fetch for key. Caller must hold _lock; returns (future, is_owner)."""
+    future = _inflight.get(key)
+    if future is not None:
+        _stats["coalesced"] += 1
+        return future, False
+    future = Future()
+    _inflight[key] = future
+    return future, True
+
+def _finish_fetch(key, endpoint, future, data=None, error=None):
+    """Store a fetch result and wake up everybody waiting on the same key."""
+    with _lock:
+        if error is not None:
+            _stats["errors"] += 1
+        else:
+            _stats["fetches"] += 1
+            if data is not None:
+                _entries[key] = (data, time.monotonic(), TMDB_TTLS.get(endpoint, DEFAULT_TTL))
+                _entries.move_to_end(key)
+                while len(_entries) > TMDB_CACHE_SIZE:
+                    _entries.popitem(last=False)
+        _inflight.pop(key, None)
+    if error is not None:
+        logging.warning(f"TMDB fetch for {endpoint} failed: {error}")
+        future.set_exception(error)
+    else:
+        future.set_result(data)
+
+def _fail_fetch(key, endpoint, future, error):
+    """Fail an in-flight fetch; an interrupted owner (e.g. a cancelled task) leaves waiters a TMDBUnavailable."""
+    if not isinstance(error, Exception):
+        error = tmdb_client.TMDBUnavailable(f"fetch of {endpoint} was interrupted")
+    _finish_fetch(key, endpoint, future, error=error)
+
+def _run_fetch(key, endpoint, params, future):
+    try:
+        data = _fetch(endpoint, params)
+    except BaseException as e:
+        _fail_fetch(key, endpoint, future, e)
+        if not isinstance(e, Exception):
+            raise
+    else:
+        _finish_fetch(key, endpoint, future, data=data)
+
+def _refresh_in_background(key, endpoint, params):
+    with _lock:
+        future, is_owner = _start_fetch(key, endpoint, params)
+    if is_owner:
+        threading.Thread(
+            target=_run_fetch, args=(key, endpoint, params, future),
+            name=f"tmdb-refresh-{endpoint}", daemon=True
+        ).start()
+
+def _lookup(key, endpoint, params):
+    """Check the cache for key. Returns (data, expired, future, is_owner); data is set on a (stale) hit."""
+    now = time.monotonic()
+    expired = None
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            data, fetched_at, ttl = entry
+            age = now - fetched_at
+            if age < ttl:
+                _stats["hits"] += 1
+                _entries.move_to_end(key)
+                return data, None, None, False
+            if age < ttl * STALE_FACTOR:
+                _stats["stale_hits"] += 1
+                _entries.move_to_end(key)
+                stale = data
+            else:
+                stale = None
+                expired = data
+        else:
+            stale = None
+        if stale is None:
+            _stats["misses"] += 1
+            future, is_owner = _start_fetch(key, endpoint, params)
+            return None, expired, future, is_owner
+
+    _refresh_in_background(key, endpoint, params)
+    return stale, None, None, False
+
+def get_json(endpoint, params):
+    """Return the TMDB JSON for endpoint (e.g. 'movie/popular') and params, using the shared cache.
+
+    Returns None when TMDB answered with a client error. Raises tmdb_client.TMDBUnavailable
+    when TMDB is degraded and nothing usable is cached.
+    """
+    key = _cache_key(endpoint, params)
+    data, expired, future, is_owner = _lookup(key, endpoint, params)
+    if future is None:
+        return data
+
+    if is_owner:
+        _run_fetch(key, endpoint, params, future)
+    try:
+        try:
+            return future.result(timeout=TMDB_INFLIGHT_TIMEOUT)
+        except FutureTimeout:
+            raise tmdb_client.TMDBUnavailable(f"waited {TMDB_INFLIGHT_TIMEOUT:.0f}s for another fetch of {endpoint}")
+    except tmdb_client.TMDBUnavailable:
+        # An old answer beats an error while TMDB is down
+        if expired is not None:
+            return expired
+        raise
+
+async def get_json_async(endpoint, params):
+    """Async twin of get_json(); misses share the same single-flight as threaded callers."""
+    key = _cache_key(endpoint, params)
+    data, expired, future, is_owner = _lookup(key, endpoint, params)
+    if future is None:
+        return data
+
+    if is_owner:
+        # Whatever ends the fetch, including cancellation, must settle the future
+        try:
+            data = await tmdb_client.get_json_async(endpoint, params)
+        except BaseException as e:
+            _fail_fetch(key, endpoint, future, e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            _finish_fetch(key, endpoint, future, data=data)
+    try:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), TMDB_INFLIGHT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise tmdb_client.TMDBUnavailable(f"waited {TMDB_INFLIGHT_TIMEOUT:.0f}s for another fetch of {endpoint}")
+    except tmdb_client.TMDBUnavailable:
+        if expired is not None:
+            return expired
+        raise
+
+def clear():
+    """Drop all cached responses."""
+    with _lock:
+        _entries.clear()
+
+def cache_stats():
+    """Counters for the shared TMDB cache."""
+    with _lock:
+        return dict(_stats, size=len(_entries), inflight=len(_inflight))
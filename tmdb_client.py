@@ -0,0 +1,205 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+# --- TMDB HTTP client ---
+# A single pooled session for all TMDB calls, with timeouts, bounded retries
+# and a circuit breaker that fails fast while TMDB is degraded.
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
+TMDB_CONNECT_TIMEOUT = float(os.getenv("TMDB_CONNECT_TIMEOUT", "3.05"))
+TMDB_READ_TIMEOUT = float(os.getenv("TMDB_READ_TIMEOUT", "8"))
+TMDB_POOL_SIZE = int(os.getenv("TMDB_POOL_SIZE", "16"))
+TMDB_MAX_RETRIES = int(os.getenv("TMDB_MAX_RETRIES", "2"))
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 4.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TMDBUnavailable(Exception):
+    """TMDB is down, rate limiting us, or the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, lets one trial call through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """Return True if a call may go out now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.warning(f"TMDB circuit breaker opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("TMDB_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("TMDB_BREAKER_RESET", "30")),
+)
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=TMDB_POOL_SIZE))
+
+def _get(url, **kwargs):
+    """One GET on the pooled session, recorded as a TMDB call."""
+    started = time.perf_counter()
+    try:
+        return _session.get(url, timeout=(TMDB_CONNECT_TIMEOUT, TMDB_READ_TIMEOUT), **kwargs)
+    finally:
+        metrics.record_call("tmdb", time.perf_counter() - started)
+
+def _backoff(attempt, retry_after=None):
+    """Seconds to wait before the next attempt: Retry-After if given, else full-jitter exponential."""
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def get_json(endpoint, params):
+    """GET a TMDB endpoint (e.g. 'movie/popular') and return the parsed JSON.
+
+    Returns None for client errors such as 401/404. Raises TMDBUnavailable when
+    TMDB keeps failing (timeouts, 429, 5xx) or the circuit breaker is open.
+    """
+    if not breaker.allow():
+        raise TMDBUnavailable("circuit breaker open")
+    # Every exit settles the breaker, or a half-open trial would never end
+    try:
+        result = _get_json(endpoint, params)
+    except BaseException:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+def _get_json(endpoint, params):
+    query = dict(params, api_key=os.getenv("TMDB_API_KEY"))
+    url = f"{TMDB_API_URL}/{endpoint}"
+    for attempt in range(TMDB_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            r = _get(url, params=query)
+            if r.status_code == 200:
+                return r.json()
+        except (requests.RequestException, ValueError) as e:
+            logging.warning(f"TMDB {endpoint} attempt {attempt + 1} failed: {e}")
+        else:
+            if r.status_code not in RETRY_STATUSES:
+                logging.warning(f"TMDB {endpoint} returned {r.status_code}")
+                return None
+            retry_after = r.headers.get("Retry-After")
+            logging.warning(f"TMDB {endpoint} attempt {attempt + 1} returned {r.status_code}")
+        if attempt < TMDB_MAX_RETRIES:
+            time.sleep(_backoff(attempt, retry_after))
+    raise TMDBUnavailable(f"TMDB {endpoint} failed after {TMDB_MAX_RETRIES + 1} attempts")
+
+def get_image(url):
+    """Download a poster from image.tmdb.org in one attempt. Returns the bytes, or None."""
+    try:
+        r = _get(url)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        logging.warning(f"TMDB image {url} failed: {e}")
+        return None
+    if r.status_code != 200:
+        logging.warning(f"TMDB image {url} returned {r.status_code}")
+        return None
+    return r.content
+
+def warm():
+    """Open a pooled connection to TMDB (DNS, TCP, TLS) before the first search needs one."""
+    if not os.getenv("TMDB_API_KEY"):
+        return
+    try:
+        _session.get(f"{TMDB_API_URL}/configuration", params={"api_key": os.getenv("TMDB_API_KEY")},
+                     timeout=(TMDB_CONNECT_TIMEOUT, TMDB_READ_TIMEOUT))
+    except (requests.ConnectionError, requests.Timeout) as e:
+        logging.warning(f"TMDB warm-up failed: {e}")
+
+_async_client = None
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(TMDB_READ_TIMEOUT, connect=TMDB_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=TMDB_POOL_SIZE * 4, max_keepalive_connections=TMDB_POOL_SIZE),
+        )
+    return _async_client
+
+async def get_json_async(endpoint, params):
+    """Async twin of get_json() for the asyncio mode; shares the same circuit breaker."""
+    if not breaker.allow():
+        raise TMDBUnavailable("circuit breaker open")
+    try:
+        result = await _get_json_async(endpoint, params)
+    except BaseException:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+async def _get_json_async(endpoint, params):
+    query = dict(params, api_key=os.getenv("TMDB_API_KEY"))
+    url = f"{TMDB_API_URL}/{endpoint}"
+    client = _get_async_client()
+    for attempt in range(TMDB_MAX_RETRIES + 1):
+        retry_after = None
+        try:
+            started = time.perf_counter()
+            try:
+                r = await client.get(url, params=query)
+            finally:
+                metrics.record_call("tmdb", time.perf_counter() - started)
+            if r.status_code == 200:
+                return r.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logging.warning(f"TMDB {endpoint} attempt {attempt + 1} failed: {e}")
+        else:
+            if r.status_code not in RETRY_STATUSES:
+                logging.warning(f"TMDB {endpoint} returned {r.status_code}")
+                return None
+            retry_after = r.headers.get("Retry-After")
+            logging.warning(f"TMDB {endpoint} attempt {attempt + 1} returned {r.status_code}")
+        if attempt < TMDB_MAX_RETRIES:
+            await asyncio.sleep(_backoff(attempt, retry_after))
+    raise TMDBUnavailable(f"TMDB {endpoint} failed after {TMDB_MAX_RETRIES + 1} attempts")
@@ -0,0 +1,88 @@
+import os
+import threading
+from collections import OrderedDict
+import tmdb_cache
+
+# --- Shared store of TMDB movie summaries ---
+# Browsing sessions keep only TMDB ids and a cursor in user_data; what a result
+# card shows lives here once per movie, in a slotted record, for all users.
+# Summaries evicted from the bounded store are fetched again by id on demand.
+TMDB_STORE_SIZE = int(os.getenv("TMDB_STORE_SIZE", "20000"))
+
+class MovieSummary:
+    __slots__ = ("id", "title", "year", "overview", "rating", "poster_path")
+
+    def __init__(self, id, title, year, overview, rating, poster_path):
+        self.id = id
+        self.title = title
+        self.year = year
+        self.overview = overview
+        self.rating = rating
+        self.poster_path = poster_path
+
+    @classmethod
+    def from_result(cls, result):
+        """Build a summary from one TMDB movie JSON object."""
+        release_date = result.get("release_date") or ""
+        return cls(
+            result["id"],
+            result.get("title") or "Title not specified",
+            release_date[:4] or None,
+            result.get("overview") or "",
+            float(result.get("vote_average") or 0),
+            result.get("poster_path"),
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, MovieSummary) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+_summaries = OrderedDict()  # tmdb id -> MovieSummary, least recently used first
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "refetches": 0}
+
+def remember(results):
+    """Store the summaries of a TMDB results list and return their ids, in order."""
+    ids = []
+    with _lock:
+        for result in results:
+            if not result or "id" not in result:
+                continue
+            summary = MovieSummary.from_result(result)
+            # Keep the record other sessions already point at unless TMDB changed it
+            if _summaries.get(summary.id) != summary:
+                _summaries[summary.id] = summary
+            _summaries.move_to_end(summary.id)
+            ids.append(summary.id)
+        while len(_summaries) > TMDB_STORE_SIZE:
+            _summaries.popitem(last=False)
+    return ids
+
+def get(tmdb_id):
+    """The summary of a movie, fetching it from TMDB if it has been evicted. None if TMDB doesn't know it.
+
+    Raises tmdb_client.TMDBUnavailable when a refetch is needed and TMDB is down.
+    """
+    with _lock:
+        summary = _summaries.get(tmdb_id)
+        if summary is not None:
+            _summaries.move_to_end(tmdb_id)
+            _stats["hits"] += 1
+            return summary
+        _stats["misses"] += 1
+    data = tmdb_cache.get_json(f"movie/{tmdb_id}", {"language": "en-US"})
+    if not data:
+        return None
+    with _lock:
+        _stats["refetches"] += 1
+    remember([data])
+    return MovieSummary.from_result(data)
+
+def stats():
+    with _lock:
+        return dict(_stats, size=len(_summaries), max_size=TMDB_STORE_SIZE)
+
+def clear():
+    with _lock:
+        _summaries.clear()
@@ -0,0 +1,165 @@
+import os
+import threading
+from bisect import bisect_right
+from cachetools import TTLCache
+import tmdb_cache
+import tmdb_store
+
+# --- Lazy stream over paged TMDB results, shared between sessions ---
+# A ResultSource is one list of results (endpoint and params): the TMDB pages loaded
+# so far, as tuples of ids, and where each page starts. Sources are interned, so
+# everyone browsing the popular list shares one, and a session keeps only a
+# reference to it next to its cursor (current_result_index). Positions are
+# absolute result numbers. Moving past the last loaded page loads the next one for
+# all sessions. Ids already on the previous page are skipped when a page is loaded,
+# because TMDB's popular lists shift while you page. Sources are dropped from the
+# registry after TMDB_STREAM_TTL, so new sessions see a fresh list; sessions still
+# holding an old one keep it.
+TMDB_STREAM_SOURCES = int(os.getenv("TMDB_STREAM_SOURCES", "512"))
+TMDB_STREAM_TTL = int(os.getenv("TMDB_STREAM_TTL", "3600"))
+# Load the next page when the cursor gets this close to the end of the loaded pages
+TMDB_LOOKAHEAD = 3
+# TMDB refuses pages beyond 500
+TMDB_MAX_PAGES = 500
+
+class ResultSource:
+    __slots__ = ("endpoint", "params", "total_pages", "pages", "starts", "_lock")
+
+    def __init__(self, endpoint, params, total_pages=1):
+        self.endpoint = endpoint
+        self.params = params  # sorted (name, value) pairs
+        self.total_pages = total_pages
+        self.pages = []  # page n is pages[n - 1], a tuple of TMDB ids
+        self.starts = []  # absolute position of each page's first id
+        self._lock = threading.Lock()
+
+    @property
+    def loaded_pages(self):
+        return len(self.pages)
+
+    @property
+    def size(self):
+        return self.starts[-1] + len(self.pages[-1]) if self.pages else 0
+
+    def add_page(self, page, ids):
+        """Append page if it is the next one (another session may have loaded it first)."""
+        with self._lock:
+            if page != len(self.pages) + 1:
+                return
+            self.starts.append(self.size)
+            self.pages.append(tuple(ids))
+
+    def id_at(self, index):
+        page = bisect_right(self.starts, index) - 1
+        if page < 0:
+            return None
+        position = index - self.starts[page]
+        ids = self.pages[page]
+        return ids[position] if position < len(ids) else None
+
+    def window(self, index):
+        """(offset, ids) of the loaded pages around index."""
+        page = max(0, bisect_right(self.starts, index) - 1)
+        first, last = max(0, page - 1), min(len(self.pages), page + 2)
+        ids = tuple(tmdb_id for ids in self.pages[first:last] for tmdb_id in ids)
+        return (self.starts[first], ids) if self.pages else (0, ())
+
+    # A spilled session pickles only the key of an API source: it is interned again
+    # when loaded, and its pages reloaded on demand. Fixed lists keep their ids.
+    def __reduce__(self):
+        if self.endpoint is None:
+            return (_fixed, (self.pages[0] if self.pages else (),))
+        return (_source, (self.endpoint, self.params))
+
+_sources = TTLCache(maxsize=TMDB_STREAM_SOURCES, ttl=TMDB_STREAM_TTL)
+_lock = threading.Lock()
+
+def _source(endpoint, params):
+    """The shared source of endpoint + params (a sorted tuple of pairs)."""
+    key = (endpoint, params)
+    with _lock:
+        source = _sources.get(key)
+        if source is None:
+            source = _sources[key] = ResultSource(endpoint, params)
+        return source
+
+def clear():
+    """Forget the shared sources (sessions keep the ones they hold)."""
+    with _lock:
+        _sources.clear()
+
+def _fixed(ids):
+    source = ResultSource(None, (), 1)
+    source.add_page(1, ids)
+    return source
+
+def open_stream(user_data, endpoint, params, data):
+    """Start browsing from the already fetched first page. Returns False if it has no results."""
+    source = _source(endpoint, tuple(sorted(params.items())))
+    if not source.loaded_pages:
+        source.total_pages = min(data.get("total_pages") or 1, TMDB_MAX_PAGES)
+        source.add_page(1, _dedupe(tmdb_store.remember(data.get("results") or [])))
+    user_data['tmdb_stream'] = source
+    return source.size > 0
+
+def open_ids(user_data, tmdb_ids):
+    """Browse a fixed list of TMDB ids, e.g. local catalogue matches. Returns False if it is empty."""
+    source = _fixed(_dedupe(tmdb_ids))
+    user_data['tmdb_stream'] = source
+    return source.size > 0
+
+def movie_id(user_data, index):
+    """TMDB id at absolute position index, loading pages as needed; None if there is none."""
+    source = user_data.get('tmdb_stream')
+    if source is None or index < 0:
+        return None
+    while index >= source.size and source.loaded_pages < source.total_pages:
+        if not _load_next(source):
+            break
+    return source.id_at(index)
+
+def has_next(user_data, index):
+    """True if there is a result after index; loads the next page early when index is near the end."""
+    source = user_data.get('tmdb_stream')
+    if source is None:
+        return False
+    if index + TMDB_LOOKAHEAD >= source.size and source.loaded_pages < source.total_pages:
+        _load_next(source)
+    return index + 1 < source.size or source.loaded_pages < source.total_pages
+
+def loaded(user_data, start, count):
+    """TMDB ids at positions [start, start + count), loading pages as needed."""
+    ids = []
+    for index in range(start, start + count):
+        tmdb_id = movie_id(user_data, index)
+        if tmdb_id is None:
+            break
+        ids.append(tmdb_id)
+    return ids
+
+def window(user_data, index):
+    """(offset, ids) of the loaded results around index."""
+    source = user_data.get('tmdb_stream')
+    return source.window(index) if source else (0, ())
+
+def _load_next(source):
+    """Load the page after the last loaded one. Returns False, and ends the source there, if it came back empty."""
+    page = source.loaded_pages + 1
+    data = tmdb_cache.get_json(source.endpoint, dict(source.params, page=page))
+    if not data or not data.get("results"):
+        source.total_pages = source.loaded_pages
+        return False
+    if data.get("total_pages"):
+        source.total_pages = min(data["total_pages"], TMDB_MAX_PAGES)
+    previous = source.pages[-1] if source.pages else ()
+    source.add_page(page, _dedupe(tmdb_store.remember(data["results"]), previous))
+    return True
+
+def _dedupe(ids, seen=()):
+    seen = set(seen)
+    fresh = []
+    for tmdb_id in ids:
+        if tmdb_id not in seen:
+            seen.add(tmdb_id)
+            fresh.append(tmdb_id)
+    return fresh
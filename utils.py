@@ -0,0 +1,41 @@
+import re
+import unicodedata
+
+# --- Text helpers ---
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Split text into chunks of at most `limit` characters, breaking between lines."""
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            # A single line longer than a message: hard-split it
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+# A bracketed release year at the end of a title: "Dune (2021)". A bare number stays,
+# it is often part of the title ("Wonder Woman 1984", "Blade Runner 2049").
+TRAILING_YEAR = re.compile(r"(?<=\S)\s*[\(\[]\s*(?:18[89]\d|19\d\d|20[0-3]\d)\s*[\)\]]\s*$")
+
+def normalize_title(title):
+    """Key under which two titles count as the same movie: case, accents, punctuation and a bracketed trailing year are ignored.
+
+    Mirrors normalize_title() in sql/005_movie_dedupe.sql.
+    """
+    text = unicodedata.normalize("NFKD", title or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower().strip()
+    text = TRAILING_YEAR.sub("", text)
+    return re.sub(r"[\W_]+", " ", text).strip()
@@ -0,0 +1,82 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+
+# --- Webhook ingress and health endpoint ---
+# A small threaded HTTP server: POST <path> accepts Telegram updates (checking the
+# secret token header), acknowledges right away and hands the update to the
+# dispatcher queue. GET / and /health answer without touching any bot logic.
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY_BYTES = 1024 * 1024
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MovieMateBot"
+
+    def _reply(self, status, body=b"ok"):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split("?")[0] in ("/", "/health"):
+            self._reply(200)
+        else:
+            self._reply(404, b"not found")
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        server = self.server
+        if server.webhook_path is None or self.path.split("?")[0] != server.webhook_path:
+            self._reply(404, b"not found")
+            return
+        if server.secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), server.secret):
+            logging.warning(f"Rejected webhook call with a bad secret token from {self.client_address[0]}")
+            self._reply(403, b"forbidden")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._reply(400, b"bad request")
+            return
+        body = self.rfile.read(length)
+        # Acknowledge first: Telegram only needs a 2xx, the dispatcher does the rest
+        self._reply(200)
+        try:
+            update = Update.de_json(json.loads(body), server.bot)
+        except Exception as e:
+            logging.error(f"Could not parse webhook update: {e}")
+            return
+        server.update_queue.put(update)
+        server.received += 1
+
+    def log_message(self, format, *args):
+        # Keep access logs out of bot.log
+        pass
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host, port, bot=None, update_queue=None, webhook_path=None, secret=None):
+        super().__init__((host, port), _Handler)
+        self.bot = bot
+        self.update_queue = update_queue
+        self.webhook_path = webhook_path
+        self.secret = secret
+        self.received = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="webhook-server", daemon=True)
+        self._thread.start()
+        host, port = self.server_address[:2]
+        route = f"webhook at {self.webhook_path}" if self.webhook_path else "health only"
+        logging.info(f"HTTP server listening on {host}:{port} ({route})")
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()